@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+
+class AuthBackendsConfig(AppConfig):
+    name = 'auth_backends'
+
+    def ready(self):
+        # Register signal handlers
+        from . import signals  # noqa
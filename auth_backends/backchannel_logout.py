@@ -90,11 +90,18 @@ class OidcBackchannelLogoutMixin:
             raise AuthException(self, 'User not authenticated with this backend')
 
         # Notice: The following is a Django specific session deletion
+        from users.models import TunnistamoSession, UserSessionKey
+
         User = get_user_model()  # noqa
         SessionStore = import_module(settings.SESSION_ENGINE).SessionStore  # noqa
         Session = SessionStore.get_model_class()  # noqa
 
-        sessions = Session.objects.filter(expire_date__gte=timezone.now())
+        # Only the sessions indexed for the user are decoded. The user id in the
+        # session data is still checked in case the index is out of date.
+        session_keys = list(
+            UserSessionKey.objects.filter(user=social_auth.user).values_list('session_key', flat=True)
+        )
+        sessions = Session.objects.filter(session_key__in=session_keys, expire_date__gte=timezone.now())
         for session in sessions:
             session_data = session.get_decoded()
             session_user_id = User._meta.pk.to_python(session_data.get(SESSION_KEY))
@@ -102,7 +109,6 @@ class OidcBackchannelLogoutMixin:
                 continue
 
             if 'tunnistamo_session_id' in session_data:
-                from users.models import TunnistamoSession
                 try:
                     tunnistamo_session = TunnistamoSession.objects.get(pk=session_data['tunnistamo_session_id'])
                     tunnistamo_session.end(send_logout_to_apis=True, request=self.strategy.request)
@@ -111,3 +117,6 @@ class OidcBackchannelLogoutMixin:
 
             session.delete()
             logger.info(f'Deleted a session for user {session_user_id}')
+
+        # The sessions are either deleted or expired by now
+        UserSessionKey.objects.filter(session_key__in=session_keys).delete()
@@ -0,0 +1,17 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+
+from auth_backends.models import SuomiFiAccessLevel, SuomiFiUserAttribute
+from auth_backends.suomifi_metadata import suomifi_metadata_snapshot
+
+
+def invalidate_suomifi_metadata(sender, **kwargs):
+    suomifi_metadata_snapshot.invalidate()
+
+
+for suomifi_metadata_model in [
+    SuomiFiUserAttribute, SuomiFiAccessLevel, SuomiFiAccessLevel._parler_meta.root_model,
+]:
+    post_save.connect(invalidate_suomifi_metadata, sender=suomifi_metadata_model)
+    post_delete.connect(invalidate_suomifi_metadata, sender=suomifi_metadata_model)
+
+m2m_changed.connect(invalidate_suomifi_metadata, sender=SuomiFiAccessLevel.attributes.through)
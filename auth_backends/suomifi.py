@@ -7,7 +7,7 @@ from lxml import etree
 from oidc_provider.models import Client
 from social_core.backends.saml import SAMLAuth, SAMLIdentityProvider
 
-from auth_backends.models import SuomiFiUserAttribute
+from auth_backends.suomifi_metadata import get_suomifi_metadata
 
 NSMAP = {
     'alg': 'urn:oasis:names:tc:SAML:metadata:algsupport',
@@ -292,9 +292,9 @@ class SuomiFiSAMLAuth(SAMLAuth):
 
     def _extract_suomifi_attributes(self, response):
         attributes = {}
-        for attribute in SuomiFiUserAttribute.objects.all():
-            if attribute.uri in response.get('attributes'):
-                attributes[attribute.friendly_name] = response.get('attributes')[attribute.uri][0]
+        for (uri, friendly_name) in get_suomifi_metadata().attribute_friendly_names_by_uri.items():
+            if uri in response.get('attributes'):
+                attributes[friendly_name] = response.get('attributes')[uri][0]
         return attributes
 
     @staticmethod
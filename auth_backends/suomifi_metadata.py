@@ -0,0 +1,61 @@
+from collections import namedtuple
+from types import MappingProxyType
+
+from auth_backends.models import SuomiFiAccessLevel, SuomiFiUserAttribute
+from tunnistamo.snapshots import VersionedSnapshot
+from tunnistamo.utils import get_translation, get_translations
+
+SUOMIFI_SCOPE_PREFIX = 'suomifi_'
+
+
+class SuomiFiAccessLevelData(namedtuple('SuomiFiAccessLevelData', [
+    'shorthand', 'names', 'descriptions', 'attribute_friendly_names',
+])):
+    """An access level with its translated names and the friendly names of its attributes"""
+    __slots__ = ()
+
+    @property
+    def scope(self):
+        return SUOMIFI_SCOPE_PREFIX + self.shorthand
+
+    def get_name(self):
+        return get_translation(self.names)
+
+    def get_description(self):
+        return get_translation(self.descriptions)
+
+
+SuomiFiMetadata = namedtuple('SuomiFiMetadata', ['access_levels', 'attribute_friendly_names_by_uri'])
+
+
+def _build_suomifi_metadata():
+    access_levels = {}
+    for level in SuomiFiAccessLevel.objects.prefetch_related('translations', 'attributes').order_by('shorthand'):
+        access_levels[level.shorthand] = SuomiFiAccessLevelData(
+            shorthand=level.shorthand,
+            names=get_translations(level, 'name'),
+            descriptions=get_translations(level, 'description'),
+            attribute_friendly_names=tuple(attribute.friendly_name for attribute in level.attributes.all()),
+        )
+
+    attribute_friendly_names_by_uri = dict(SuomiFiUserAttribute.objects.values_list('uri', 'friendly_name'))
+
+    return SuomiFiMetadata(
+        access_levels=MappingProxyType(access_levels),
+        attribute_friendly_names_by_uri=MappingProxyType(attribute_friendly_names_by_uri),
+    )
+
+
+suomifi_metadata_snapshot = VersionedSnapshot('suomifi_metadata', _build_suomifi_metadata)
+
+
+def get_suomifi_metadata():
+    """Return the Suomi.fi access levels and user attributes
+
+    The metadata is read from the snapshot of the current process which is
+    rebuilt when the access levels or the attributes change e.g. by the
+    populate_suomifi_attributes management command.
+
+    :rtype: SuomiFiMetadata
+    """
+    return suomifi_metadata_snapshot.get()
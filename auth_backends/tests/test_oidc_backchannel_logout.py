@@ -7,7 +7,7 @@ from django.utils.crypto import get_random_string
 from social_core.exceptions import AuthException, AuthTokenError
 
 from tunnistamo.tests.conftest import reload_social_django_utils
-from users.models import TunnistamoSession
+from users.models import TunnistamoSession, UserSessionKey
 
 from .conftest import DummyOidcBackchannelLogoutBackend, DummyOidcBackend
 
@@ -343,6 +343,7 @@ def test_backchannel_successful_logout(
 
     tunnistamo_session.refresh_from_db()
     assert tunnistamo_session.ended_at is not None
+    assert not UserSessionKey.objects.filter(user=user).exists()
 
     response = user_django_client.get('/accounts/profile/')
 
@@ -462,3 +463,47 @@ def test_backchannel_successful_logout_other_session_unaffected(
     assert response.status_code == 200
     assert str(user2) in str(response.content)
     assert response.wsgi_request.user.is_authenticated is True
+
+
+@pytest.mark.django_db
+def test_backchannel_logout_only_deletes_indexed_sessions(
+    rsa_key,
+    settings,
+    django_client_factory,
+    user_factory,
+    usersocialauth_factory,
+    logout_token_factory,
+):
+    settings.AUTHENTICATION_BACKENDS = settings.AUTHENTICATION_BACKENDS + (
+        'auth_backends.tests.conftest.DummyOidcBackchannelLogoutBackend',
+    )
+    settings.SOCIAL_AUTH_DUMMYOIDCLOGOUTBACKEND_KEY = 'dummykey'
+
+    reload_social_django_utils()
+
+    password = get_random_string(12)
+    user = user_factory(password=password)
+
+    backend = DummyOidcBackchannelLogoutBackend()
+    social_auth = usersocialauth_factory(provider=backend.name, user=user)
+
+    user_django_client = django_client_factory()
+    user_django_client.login(username=user.username, password=password)
+
+    # Remove the session from the index. The session must not be found anymore.
+    UserSessionKey.objects.filter(user=user).delete()
+
+    op_django_client = django_client_factory()
+    backchannel_logout_url = reverse(
+        'auth_backends:backchannel_logout',
+        kwargs={'backend': backend.name}
+    )
+
+    logout_token = logout_token_factory(backend, sub=social_auth.uid)
+    logout_response = op_django_client.post(backchannel_logout_url, data={'logout_token': logout_token})
+
+    assert logout_response.status_code == 200
+
+    response = user_django_client.get('/accounts/profile/')
+
+    assert response.wsgi_request.user.is_authenticated is True
@@ -0,0 +1,76 @@
+import os
+
+import pytest
+from django.core.management import call_command
+from django.utils import translation
+
+from auth_backends.models import SuomiFiAccessLevel
+from auth_backends.suomifi import SuomiFiSAMLAuth
+from auth_backends.suomifi_metadata import get_suomifi_metadata
+from oidc_apis.scopes import SuomiFiUserAttributeScopeClaims
+
+SUOMIFI_FIELDS_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__)))),
+    'tunnistamo', 'tests', 'data', 'suomifi_fields.yaml',
+)
+
+
+@pytest.fixture
+def suomifi_attributes():
+    call_command('populate_suomifi_attributes', '--load', SUOMIFI_FIELDS_PATH)
+
+
+@pytest.mark.django_db
+def test_suomifi_metadata_contains_access_levels_and_attributes(suomifi_attributes):
+    metadata = get_suomifi_metadata()
+
+    assert set(metadata.access_levels) == {'basic', 'extended'}
+    basic = metadata.access_levels['basic']
+    assert basic.scope == 'suomifi_basic'
+    assert set(basic.attribute_friendly_names) == {'nationalIdentificationNumber', 'cn'}
+    assert set(metadata.access_levels['extended'].attribute_friendly_names) == {
+        'nationalIdentificationNumber', 'cn', 'KotikuntaKuntaS',
+    }
+    assert metadata.attribute_friendly_names_by_uri['urn:oid:2.5.4.3'] == 'cn'
+
+
+@pytest.mark.django_db
+def test_suomifi_scope_info_is_not_queried(suomifi_attributes, django_assert_num_queries):
+    get_suomifi_metadata()
+
+    with django_assert_num_queries(0), translation.override('fi'):
+        assert 'info_suomifi_basic' in dir(SuomiFiUserAttributeScopeClaims)
+        assert SuomiFiUserAttributeScopeClaims.info_suomifi_basic == (
+            'Basic attributes', 'Limited set of attributes'
+        )
+        with pytest.raises(AttributeError):
+            SuomiFiUserAttributeScopeClaims.info_suomifi_unknown
+
+
+@pytest.mark.django_db
+def test_suomifi_attributes_are_extracted_without_queries(suomifi_attributes, django_assert_num_queries):
+    get_suomifi_metadata()
+    response = {'attributes': {'urn:oid:2.5.4.3': ['Testi Teppo'], 'urn:oid:unknown': ['value']}}
+
+    with django_assert_num_queries(0):
+        attributes = SuomiFiSAMLAuth()._extract_suomifi_attributes(response)
+
+    assert attributes == {'cn': 'Testi Teppo'}
+
+
+@pytest.mark.django_db
+def test_suomifi_metadata_follows_changes(suomifi_attributes):
+    assert 'basic' in get_suomifi_metadata().access_levels
+
+    level = SuomiFiAccessLevel.objects.get(shorthand='basic')
+    level.attributes.clear()
+    assert get_suomifi_metadata().access_levels['basic'].attribute_friendly_names == ()
+
+    level.set_current_language('fi')
+    level.name = 'Perustiedot'
+    level.save()
+    with translation.override('fi'):
+        assert get_suomifi_metadata().access_levels['basic'].get_name() == 'Perustiedot'
+
+    level.delete()
+    assert 'basic' not in get_suomifi_metadata().access_levels
@@ -0,0 +1,10 @@
+import pytest
+from django.core.cache import cache
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    """Don't let cached values leak from one test to another"""
+    cache.clear()
+    yield
+    cache.clear()
@@ -1,15 +1,40 @@
+import json
 import uuid
+from datetime import timedelta
+from functools import lru_cache
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.auth.hashers import check_password, make_password
+from django.core.cache import cache
 from django.db import models
 from django.db.models import JSONField
+from django.utils.crypto import salted_hmac
 from django.utils.timezone import now
 from django.utils.translation import gettext_lazy as _
+from jwcrypto import jwk
 
 User = get_user_model()
 
 
+@lru_cache(maxsize=1024)
+def _import_jwk(key_json):
+    return jwk.JWK.from_json(key_json)
+
+
+def get_jwk(key):
+    """
+    Return a JWK object of a key stored in a JSON field.
+
+    The constructed JWK objects are kept in a per-process LRU cache keyed by
+    the key itself, so a changed key never gets a stale object.
+
+    :type key: dict
+    :rtype: jwcrypto.jwk.JWK
+    """
+    return _import_jwk(json.dumps(key, sort_keys=True))
+
+
 class UserDevice(models.Model):
     OS_ANDROID = 'android'
     OS_IOS = 'ios'
@@ -32,6 +57,35 @@ class UserDevice(models.Model):
     def __str__(self):
         return '{} ({} {} for user {})'.format(self.id, self.os, self.os_version, self.user)
 
+    def advance_auth_counter(self, auth_counter):
+        """Advance the authentication counter of the device to the given value
+
+        The counter is checked and advanced in a single conditional UPDATE so
+        that concurrent requests can't use the same counter value. Returns
+        False if the counter wasn't greater than the stored counter, i.e. the
+        token has been replayed.
+
+        The last used time is updated at most once in
+        USER_DEVICE_LAST_USED_AT_INTERVAL seconds."""
+        current_time = now()
+        updates = {'auth_counter': auth_counter}
+        last_used_at_interval = timedelta(seconds=settings.USER_DEVICE_LAST_USED_AT_INTERVAL)
+        if self.last_used_at is None or self.last_used_at <= current_time - last_used_at_interval:
+            updates['last_used_at'] = current_time
+
+        if not UserDevice.objects.filter(pk=self.pk, auth_counter__lt=auth_counter).update(**updates):
+            return False
+
+        for (field, value) in updates.items():
+            setattr(self, field, value)
+        return True
+
+    def get_secret_jwk(self):
+        return get_jwk(self.secret_key)
+
+    def get_public_jwk(self):
+        return get_jwk(self.public_key)
+
 
 class InterfaceDevice(models.Model):
     id = models.UUIDField(default=uuid.uuid4, primary_key=True)
@@ -44,5 +98,29 @@ class InterfaceDevice(models.Model):
     def set_secret_key(self, raw_secret_key):
         self.secret_key = make_password(raw_secret_key)
 
+    def _get_verified_secret_key_cache_key(self, raw_secret_key):
+        # The presented secret is stored only as a keyed HMAC. The hash of the
+        # secret key is included so that changing the secret key invalidates
+        # the verified secrets.
+        digest = salted_hmac(
+            'devices.InterfaceDevice.check_secret_key',
+            '{}:{}'.format(self.secret_key, raw_secret_key),
+            algorithm='sha256',
+        ).hexdigest()
+        return 'interface_device_secret:{}:{}'.format(self.id, digest)
+
     def check_secret_key(self, raw_secret_key):
-        return check_password(raw_secret_key, self.secret_key)
+        """Check the secret key of the device
+
+        Verifying the password hash is slow by design, so successfully
+        verified secrets are cached for INTERFACE_DEVICE_SECRET_CACHE_TIMEOUT
+        seconds. Wrong secrets are always verified against the hash."""
+        cache_key = self._get_verified_secret_key_cache_key(raw_secret_key)
+        if cache.get(cache_key):
+            return True
+
+        if not check_password(raw_secret_key, self.secret_key):
+            return False
+
+        cache.set(cache_key, True, settings.INTERFACE_DEVICE_SECRET_CACHE_TIMEOUT)
+        return True
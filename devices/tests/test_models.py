@@ -0,0 +1,100 @@
+import json
+from datetime import timedelta
+from unittest import mock
+
+import pytest
+from django.contrib.auth.hashers import check_password
+from django.utils.timezone import now
+from jwcrypto import jwk
+
+from devices.factories import InterfaceDeviceFactory, UserDeviceFactory
+from devices.models import InterfaceDevice
+
+
+@pytest.fixture
+def interface_device():
+    interface_device = InterfaceDeviceFactory.build(scopes='read:identities:helmet')
+    interface_device.set_secret_key('secret')
+    interface_device.save()
+    return interface_device
+
+
+@pytest.mark.django_db
+def test_verified_interface_device_secret_is_cached(interface_device):
+    with mock.patch('devices.models.check_password', side_effect=check_password) as mock_check_password:
+        assert interface_device.check_secret_key('secret')
+        assert InterfaceDevice.objects.get(pk=interface_device.pk).check_secret_key('secret')
+
+    assert mock_check_password.call_count == 1
+
+
+@pytest.mark.django_db
+def test_wrong_interface_device_secret_is_always_checked(interface_device):
+    with mock.patch('devices.models.check_password', side_effect=check_password) as mock_check_password:
+        assert interface_device.check_secret_key('secret')
+        assert not interface_device.check_secret_key('wrong')
+        assert not interface_device.check_secret_key('wrong')
+
+    assert mock_check_password.call_count == 3
+
+
+@pytest.mark.django_db
+def test_changing_interface_device_secret_invalidates_cached_secret(interface_device):
+    assert interface_device.check_secret_key('secret')
+
+    interface_device.set_secret_key('new secret')
+    interface_device.save()
+
+    assert not interface_device.check_secret_key('secret')
+    assert interface_device.check_secret_key('new secret')
+
+
+@pytest.mark.django_db
+def test_user_device_keys_are_constructed_once():
+    enc_key = jwk.JWK.generate(kty='oct', alg='HS256', use='enc')
+    sign_key = jwk.JWK.generate(kty='EC', crv='P-256', use='sig')
+    user_device = UserDeviceFactory(
+        secret_key=json.loads(enc_key.export()),
+        public_key=json.loads(sign_key.export_public()),
+    )
+    same_user_device = type(user_device).objects.get(pk=user_device.pk)
+
+    assert user_device.get_secret_jwk() == enc_key
+    assert user_device.get_public_jwk().thumbprint() == sign_key.thumbprint()
+    assert same_user_device.get_secret_jwk() is user_device.get_secret_jwk()
+    assert same_user_device.get_public_jwk() is user_device.get_public_jwk()
+
+
+@pytest.mark.django_db
+def test_auth_counter_is_advanced_only_forward():
+    user_device = UserDeviceFactory(auth_counter=5)
+    stale_user_device = type(user_device).objects.get(pk=user_device.pk)
+
+    assert user_device.advance_auth_counter(6)
+    assert user_device.auth_counter == 6
+
+    # The stale copy still has the old counter but the update is checked
+    # against the database
+    assert not stale_user_device.advance_auth_counter(6)
+    assert not user_device.advance_auth_counter(5)
+
+    user_device.refresh_from_db()
+    assert user_device.auth_counter == 6
+
+
+@pytest.mark.django_db
+def test_last_used_at_is_updated_at_most_once_in_interval(settings):
+    settings.USER_DEVICE_LAST_USED_AT_INTERVAL = 60
+    user_device = UserDeviceFactory(auth_counter=0)
+    type(user_device).objects.filter(pk=user_device.pk).update(last_used_at=now() - timedelta(minutes=5))
+    user_device.refresh_from_db()
+
+    assert user_device.advance_auth_counter(1)
+    user_device.refresh_from_db()
+    last_used_at = user_device.last_used_at
+    assert last_used_at > now() - timedelta(seconds=5)
+
+    assert user_device.advance_auth_counter(2)
+    user_device.refresh_from_db()
+    assert user_device.auth_counter == 2
+    assert user_device.last_used_at == last_used_at
@@ -1,6 +1,7 @@
 import json
 import random
 import time
+from datetime import timedelta
 from unittest import mock
 
 import pytest
@@ -160,6 +161,9 @@ def test_access_token_authentication_wrong_scope(api_client, scopes):
 @pytest.mark.django_db
 def test_interface_device_authentication(interface_device_api_client):
     user_device = interface_device_api_client.user_device
+    # The last used time is updated at most once a minute
+    user_device.last_used_at -= timedelta(minutes=5)
+    user_device.save(update_fields=['last_used_at'])
     old_last_used_at = user_device.last_used_at
     old_auth_counter = user_device.auth_counter
     nonce = interface_device_api_client.nonce
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class KeyManagerConfig(AppConfig):
     name = 'key_manager'
     verbose_name = 'Tunnistamo RSA key manager'
+
+    def ready(self):
+        # Register signal handlers
+        from . import signals  # noqa
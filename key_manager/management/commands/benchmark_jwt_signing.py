@@ -0,0 +1,68 @@
+import time
+import uuid
+from timeit import default_timer
+
+from Cryptodome.PublicKey import RSA
+from django.core.management.base import BaseCommand
+from jwcrypto import jwk
+from jwkest.jwk import RSAKey as jwk_RSAKey
+
+from key_manager.signing_keys import sign_jwt_with_keys
+
+
+def _create_id_token_payload():
+    now = int(time.time())
+    return {
+        'iss': 'https://tunnistamo.example.com/openid',
+        'sub': str(uuid.uuid4()),
+        'aud': 'https://api.example.com/benchmark',
+        'exp': now + 3600,
+        'iat': now,
+        'auth_time': now,
+        'nonce': uuid.uuid4().hex,
+        'at_hash': uuid.uuid4().hex[:22],
+        'amr': 'helsinki_adfs',
+        'loa': 'substantial',
+        'https://api.hel.fi/auth': ['benchmark'],
+    }
+
+
+class Command(BaseCommand):
+    """
+    Micro-benchmark of signing an ID token sized JWT with each type of key.
+
+    Only the signing is timed. The token endpoint also loads and saves the code,
+    the token and the session and renders the claims, and it signs the ID token
+    with django-oidc-provider, which doesn't support ES256. The ES256 keys are
+    used for the API tokens and the back-channel log out tokens.
+    """
+    help = 'Compares the throughput of signing a JWT with RSA-2048, RSA-4096 and ES256 keys, excluding the rest ' \
+           'of the token endpoint'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=200, help='Number of tokens signed with each key')
+
+    def handle(self, *args, **options):
+        count = options['count']
+        ec_key = jwk.JWK.generate(kty='EC', crv='P-256', kid='benchmark-es256')
+        signers = [
+            ('RSA-2048', 'RS256', [jwk_RSAKey(key=RSA.generate(2048), kid='benchmark-rsa-2048')]),
+            ('RSA-4096', 'RS256', [jwk_RSAKey(key=RSA.generate(4096), kid='benchmark-rsa-4096')]),
+            ('ES256 (P-256)', 'ES256', [ec_key]),
+        ]
+        payloads = [_create_id_token_payload() for i in range(count)]
+
+        for (name, alg, keys) in signers:
+            # Warm up
+            sign_jwt_with_keys(payloads[0], alg, keys)
+
+            start_time = default_timer()
+            for payload in payloads:
+                sign_jwt_with_keys(payload, alg, keys)
+            elapsed = default_timer() - start_time
+
+            self.stdout.write('{name:<14} {per_second:>9.1f} tokens/s {per_token:>8.3f} ms/token'.format(
+                name=name,
+                per_second=count / elapsed,
+                per_token=elapsed / count * 1000,
+            ))
@@ -4,14 +4,15 @@ from Cryptodome.PublicKey import RSA
 from django.core.exceptions import ObjectDoesNotExist
 from django.core.management.base import BaseCommand
 from django.utils import timezone
+from jwcrypto import jwk
 from oidc_provider.models import RSAKey
 
 from key_manager import settings
-from key_manager.models import ManagedRSAKey
+from key_manager.models import ManagedECKey, ManagedRSAKey
 
 
 class Command(BaseCommand):
-    help = 'Manages default OpenID RSA key for Tunnistamo'
+    help = 'Manages default OpenID RSA key and optionally the EC key for Tunnistamo'
 
     def add_arguments(self, parser):
         parser.add_argument('--list-before', action='store_true', help='List keys before management cycle')
@@ -26,6 +27,19 @@ class Command(BaseCommand):
             return
 
         now = timezone.now()
+        self.manage_rsa_keys(now)
+
+        if settings.get('KEY_MANAGER_EC_KEYS_ENABLED'):
+            self.manage_ec_keys(now)
+
+        # Show key summary
+        if options['list_after']:
+            self.list_keys()
+
+    def manage_rsa_keys(self, now):
+        """
+        Expire, remove and create RSA keys.
+        """
         valid_keys = False
         # loop through all the keys
         for rsakey in RSAKey.objects.all():
@@ -54,10 +68,6 @@ class Command(BaseCommand):
         if not valid_keys:
             self.create_managed_rsa_key(settings.get('KEY_MANAGER_RSA_KEY_LENGTH'))
 
-        # Show key summary
-        if options['list_after']:
-            self.list_keys()
-
     def create_managed_rsa_key(self, length):
         """
         Create an RSA key with a given length.
@@ -68,12 +78,47 @@ class Command(BaseCommand):
         ManagedRSAKey.objects.create(rsakey=rsakey, created_at=timezone.now())
         self.stdout.write('Created new key of length {0} with id: {1}'.format(length, rsakey))
 
+    def manage_ec_keys(self, now):
+        """
+        Expire, remove and create EC keys the same way as the RSA keys.
+        """
+        valid_keys = False
+        for eckey in ManagedECKey.objects.all():
+            if eckey.expired_at:
+                # remove expired key after hold period
+                if eckey.expired_at + timedelta(days=settings.get('KEY_MANAGER_RSA_KEY_EXPIRATION_PERIOD')) < now:
+                    eckey.delete()
+                    self.stdout.write('Removed EC key with id: {0}'.format(eckey.kid))
+            elif eckey.created_at + timedelta(days=settings.get('KEY_MANAGER_RSA_KEY_MAX_AGE')) < now:
+                # expire key older than maximum age
+                eckey.expired_at = now
+                eckey.save()
+                self.stdout.write('Expired EC key with id: {0}'.format(eckey.kid))
+            else:
+                valid_keys = True
+
+        if not valid_keys:
+            self.create_managed_ec_key()
+
+    def create_managed_ec_key(self):
+        """
+        Create a P-256 key for ES256 signing.
+        """
+        key = jwk.JWK.generate(kty='EC', crv='P-256')
+        eckey = ManagedECKey.objects.create(
+            key=key.export_to_pem(private_key=True, password=None).decode('utf8'),
+            created_at=timezone.now(),
+        )
+        self.stdout.write('Created new P-256 EC key with id: {0}'.format(eckey.kid))
+
     def list_keys(self):
         """
-        List all RSA keys found in the database.
+        List all RSA keys and EC keys found in the database.
         """
         for rsakey in RSAKey.objects.all():
             try:
                 self.stdout.write('Managed {0}'.format(ManagedRSAKey.objects.get(rsakey=rsakey)))
             except ObjectDoesNotExist:
                 self.stdout.write('Unmanaged key: {0}'.format(rsakey))
+        for eckey in ManagedECKey.objects.all():
+            self.stdout.write('Managed {0}'.format(eckey))
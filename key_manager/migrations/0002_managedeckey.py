@@ -0,0 +1,22 @@
+# Generated by Django 4.2.14 on 2026-10-18 07:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('key_manager', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ManagedECKey',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.TextField(help_text='Private P-256 key in PEM format')),
+                ('created_at', models.DateTimeField()),
+                ('expired_at', models.DateTimeField(null=True)),
+            ],
+        ),
+    ]
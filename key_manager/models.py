@@ -1,3 +1,5 @@
+from hashlib import md5
+
 from django.db import models
 from oidc_provider.models import RSAKey
 
@@ -13,3 +15,26 @@ class ManagedRSAKey(models.Model):
         if self.expired_at:
             res = res + ', expired {0}'.format(self.expired_at)
         return res
+
+
+class ManagedECKey(models.Model):
+    """
+    Elliptic curve key for signing JWTs with ES256.
+
+    Unlike the RSA keys, which are stored by django-oidc-provider, the EC
+    keys are stored and managed by the key manager only.
+    """
+    key = models.TextField(help_text='Private P-256 key in PEM format')
+    created_at = models.DateTimeField()
+    expired_at = models.DateTimeField(
+        null=True)
+
+    def __str__(self):
+        res = 'EC key: {0}, created {1}'.format(self.kid, self.created_at)
+        if self.expired_at:
+            res = res + ', expired {0}'.format(self.expired_at)
+        return res
+
+    @property
+    def kid(self):
+        return md5(self.key.encode('utf-8')).hexdigest() if self.key else ''
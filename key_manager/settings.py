@@ -24,6 +24,23 @@ class DefaultSettings(object):
         """
         return 7
 
+    @property
+    def KEY_MANAGER_KEYS_CACHE_MAX_AGE(self):
+        """
+        OPTIONAL. Seconds the published keys and the discovery document may
+        be cached by the clients. Defaults to one hour per week of the
+        expiration period of a key, i.e. one hour with the default period.
+        """
+        return get('KEY_MANAGER_RSA_KEY_EXPIRATION_PERIOD') * 24 * 60 * 60 // (7 * 24)
+
+    @property
+    def KEY_MANAGER_EC_KEYS_ENABLED(self):
+        """
+        OPTIONAL. Whether P-256 keys for ES256 signing are managed as well.
+        Default value is False.
+        """
+        return False
+
 
 default_settings = DefaultSettings()
 
@@ -0,0 +1,16 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from oidc_provider.models import RSAKey
+
+from key_manager.models import ManagedECKey, ManagedRSAKey
+from key_manager.signing_keys import signing_key_ring_snapshot
+
+
+@receiver(post_save, sender=RSAKey)
+@receiver(post_delete, sender=RSAKey)
+@receiver(post_save, sender=ManagedRSAKey)
+@receiver(post_delete, sender=ManagedRSAKey)
+@receiver(post_save, sender=ManagedECKey)
+@receiver(post_delete, sender=ManagedECKey)
+def invalidate_signing_key_ring(sender, **kwargs):
+    signing_key_ring_snapshot.invalidate()
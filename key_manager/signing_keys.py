@@ -0,0 +1,206 @@
+import hashlib
+import json
+from datetime import timedelta
+
+from Cryptodome.PublicKey.RSA import importKey
+from django.utils.functional import cached_property
+from django.utils.timezone import now
+from jwcrypto import jwk, jws
+from jwkest import long_to_base64
+from jwkest.jwk import RSAKey as jwk_RSAKey
+from jwkest.jwk import SYMKey
+from jwkest.jws import JWS
+from oidc_provider.models import RSAKey
+
+from tunnistamo.snapshots import VersionedSnapshot
+
+from . import settings as key_manager_settings
+from .models import ManagedECKey
+
+
+class SigningKeyRing(object):
+    """
+    Parsed signing keys of the current process.
+
+    The keys are ordered so that the current signing key is the first one.
+    The current key is the newest unexpired managed key which has been
+    published for at least KEY_MANAGER_KEYS_CACHE_MAX_AGE seconds, so that
+    the clients which have cached the published keys can verify the tokens.
+    It is followed by the other published unexpired keys, the expired keys,
+    the RSA keys which are not managed by the key manager and finally the
+    keys published too recently, oldest first. A recent key is therefore used
+    only when there is no other key.
+    """
+    def __init__(self, keys, ec_keys=(), promote_at=None):
+        """
+        :type keys: list[jwkest.jwk.RSAKey]
+        :type ec_keys: list[jwcrypto.jwk.JWK]
+        :param promote_at: Time when a recently published key has been
+            published long enough and the order of the keys changes
+        :type promote_at: datetime.datetime|None
+        """
+        self.keys = keys
+        self.ec_keys = list(ec_keys)
+        self.promote_at = promote_at
+
+    @property
+    def current_key(self):
+        return self.keys[0] if self.keys else None
+
+    @property
+    def version(self):
+        """Identifier of the set of RSA keys which changes when the keys are rotated"""
+        return ','.join(key.kid for key in self.keys)
+
+    @property
+    def ec_version(self):
+        """Identifier of the set of EC keys which changes when the keys are rotated"""
+        return ','.join(key['kid'] for key in self.ec_keys)
+
+    def get_keys(self):
+        if not self.keys:
+            raise Exception('You must add at least one RSA Key.')
+        return list(self.keys)
+
+    def get_ec_keys(self):
+        if not self.ec_keys:
+            raise Exception('You must add at least one EC Key.')
+        return list(self.ec_keys)
+
+    def get_public_jwks(self):
+        """Return the public keys as a JWK Set"""
+        keys = [{
+            'kty': 'RSA',
+            'alg': 'RS256',
+            'use': 'sig',
+            'kid': key.kid,
+            'n': long_to_base64(key.key.n),
+            'e': long_to_base64(key.key.e),
+        } for key in self.keys]
+        keys.extend(dict(key.export_public(as_dict=True), alg='ES256', use='sig') for key in self.ec_keys)
+
+        return {'keys': keys}
+
+    @cached_property
+    def public_jwks_content(self):
+        """The JWK Set rendered as JSON once per key ring"""
+        return json.dumps(self.get_public_jwks()).encode('utf-8')
+
+    @cached_property
+    def public_jwks_etag(self):
+        return hashlib.sha256(self.public_jwks_content).hexdigest()
+
+
+def _get_managed_key_order(created_at, expired_at, published_before):
+    if expired_at is not None:
+        return (2, -expired_at.timestamp())
+    if created_at <= published_before:
+        return (1, -created_at.timestamp())
+    return (4, created_at.timestamp())
+
+
+def _get_rsa_key_order(rsakey, published_before):
+    managed_key = getattr(rsakey, 'managedrsakey', None)
+    if managed_key is None:
+        return (3, 0, rsakey.pk)
+    return _get_managed_key_order(managed_key.created_at, managed_key.expired_at, published_before) + (rsakey.pk,)
+
+
+def _get_promote_at(managed_keys, published_before, publication_period):
+    """Return the time when the next recently published key will be promoted"""
+    pending = [
+        managed_key.created_at + publication_period for managed_key in managed_keys
+        if managed_key.expired_at is None and managed_key.created_at > published_before
+    ]
+    return min(pending, default=None)
+
+
+def _import_ec_key(eckey):
+    key = jwk.JWK.from_pem(eckey.key.encode('utf-8'))
+    key['kid'] = eckey.kid
+    return key
+
+
+def _build_signing_key_ring():
+    publication_period = timedelta(seconds=key_manager_settings.get('KEY_MANAGER_KEYS_CACHE_MAX_AGE'))
+    published_before = now() - publication_period
+
+    rsakeys = sorted(
+        RSAKey.objects.select_related('managedrsakey'),
+        key=lambda rsakey: _get_rsa_key_order(rsakey, published_before),
+    )
+    eckeys = sorted(
+        ManagedECKey.objects.all(),
+        key=lambda eckey: _get_managed_key_order(eckey.created_at, eckey.expired_at, published_before) + (eckey.pk,),
+    )
+    managed_keys = [
+        rsakey.managedrsakey for rsakey in rsakeys if getattr(rsakey, 'managedrsakey', None) is not None
+    ] + eckeys
+
+    return SigningKeyRing(
+        [jwk_RSAKey(key=importKey(rsakey.key), kid=rsakey.kid) for rsakey in rsakeys],
+        [_import_ec_key(eckey) for eckey in eckeys],
+        promote_at=_get_promote_at(managed_keys, published_before, publication_period),
+    )
+
+
+signing_key_ring_snapshot = VersionedSnapshot('signing_key_ring', _build_signing_key_ring)
+
+
+def get_signing_key_ring():
+    """
+    Get the signing key ring of the current process.
+
+    The key ring is rebuilt when the keys are added, removed or expired e.g.
+    by the manage_openid_keys management command, and when a recently
+    published key becomes the current key.
+
+    :rtype: SigningKeyRing
+    """
+    key_ring = signing_key_ring_snapshot.get()
+    if key_ring.promote_at is not None and key_ring.promote_at <= now():
+        signing_key_ring_snapshot.discard()
+        key_ring = signing_key_ring_snapshot.get()
+
+    return key_ring
+
+
+def get_client_signing_keys(client, alg=None):
+    """
+    Get the keys for signing JWTs for the client.
+
+    Same as get_client_alg_keys of django-oidc-provider but the keys are
+    taken from the signing key ring instead of the database. The algorithm
+    defaults to the JWT algorithm of the client.
+
+    :rtype: list
+    """
+    alg = alg or client.jwt_alg
+    if alg == 'RS256':
+        return get_signing_key_ring().get_keys()
+    elif alg == 'ES256':
+        return get_signing_key_ring().get_ec_keys()
+    elif alg == 'HS256':
+        return [SYMKey(key=client.client_secret, alg=alg)]
+
+    raise Exception('Unsupported key algorithm.')
+
+
+def sign_jwt_with_keys(payload, alg, keys):
+    """Sign the payload as a JWT with the first of the keys
+
+    ES256 is signed with jwcrypto since the elliptic curve implementation of
+    pyjwkest is written in pure Python and is much slower."""
+    if alg != 'ES256':
+        return JWS(payload, alg=alg).sign_compact(keys)
+
+    key = keys[0]
+    token = jws.JWS(json.dumps(payload).encode('utf-8'))
+    token.add_signature(key, protected={'alg': alg, 'kid': key['kid']})
+    return token.serialize(compact=True)
+
+
+def sign_jwt(payload, client, alg=None):
+    """Sign the payload as a JWT with the current signing key of the client"""
+    alg = alg or client.jwt_alg
+    return sign_jwt_with_keys(payload, alg, get_client_signing_keys(client, alg))
@@ -0,0 +1,183 @@
+import json
+from datetime import timedelta
+from unittest import mock
+
+import pytest
+from Cryptodome.PublicKey import RSA
+from django.core.management import call_command
+from django.utils import timezone
+from jwcrypto import jwk, jws
+from jwkest.jws import factory
+from oidc_provider.models import RSAKey
+
+from key_manager.models import ManagedECKey, ManagedRSAKey
+from key_manager.signing_keys import get_signing_key_ring, sign_jwt
+from users.factories import OIDCClientFactory
+
+
+def create_managed_rsa_key(created_at, expired_at=None):
+    key = RSA.generate(1024)
+    rsakey = RSAKey.objects.create(key=key.exportKey('PEM').decode('utf8'))
+    ManagedRSAKey.objects.create(rsakey=rsakey, created_at=created_at, expired_at=expired_at)
+    return rsakey
+
+
+def create_managed_ec_key(created_at, expired_at=None):
+    key = jwk.JWK.generate(kty='EC', crv='P-256')
+    return ManagedECKey.objects.create(
+        key=key.export_to_pem(private_key=True, password=None).decode('utf8'),
+        created_at=created_at,
+        expired_at=expired_at,
+    )
+
+
+def get_signing_kid(jwt):
+    return factory(jwt).jwt.headers['kid']
+
+
+def verify_with_jwks(jwt, jwks):
+    token = jws.JWS()
+    token.deserialize(jwt)
+    token.verify(jwk.JWKSet.from_json(json.dumps(jwks)).get_key(token.jose_header['kid']))
+    return json.loads(token.payload)
+
+
+@pytest.mark.django_db
+def test_newest_unexpired_key_is_the_current_key():
+    now = timezone.now()
+    expired = create_managed_rsa_key(now - timedelta(days=20), expired_at=now - timedelta(days=1))
+    older = create_managed_rsa_key(now - timedelta(days=10))
+    newest = create_managed_rsa_key(now - timedelta(days=5))
+    unmanaged = RSAKey.objects.create(key=RSA.generate(1024).exportKey('PEM').decode('utf8'))
+
+    key_ring = get_signing_key_ring()
+
+    assert [key.kid for key in key_ring.keys] == [newest.kid, older.kid, expired.kid, unmanaged.kid]
+    assert get_signing_kid(sign_jwt({'sub': 'test'}, OIDCClientFactory(jwt_alg='RS256'))) == newest.kid
+
+
+@pytest.mark.django_db
+def test_signing_does_not_query_keys(django_assert_num_queries):
+    create_managed_rsa_key(timezone.now())
+    client = OIDCClientFactory(jwt_alg='RS256')
+    sign_jwt({'sub': 'test'}, client)
+
+    with django_assert_num_queries(0):
+        sign_jwt({'sub': 'test'}, client)
+
+
+@pytest.mark.django_db
+def test_key_ring_follows_key_rotation(settings):
+    settings.KEY_MANAGER_RSA_KEY_LENGTH = 1024
+    settings.KEY_MANAGER_KEYS_CACHE_MAX_AGE = 3600
+    old_key = create_managed_rsa_key(timezone.now() - timedelta(days=365))
+    client = OIDCClientFactory(jwt_alg='RS256')
+    assert get_signing_kid(sign_jwt({'sub': 'test'}, client)) == old_key.kid
+
+    call_command('manage_openid_keys')
+
+    # The old key is used until the new key has been published for long enough
+    new_key = RSAKey.objects.exclude(pk=old_key.pk).get()
+    assert get_signing_kid(sign_jwt({'sub': 'test'}, client)) == old_key.kid
+    assert [key.kid for key in get_signing_key_ring().keys] == [old_key.kid, new_key.kid]
+
+    later = timezone.now() + timedelta(hours=1, seconds=1)
+    with mock.patch('key_manager.signing_keys.now', return_value=later):
+        assert get_signing_kid(sign_jwt({'sub': 'test'}, client)) == new_key.kid
+        assert [key.kid for key in get_signing_key_ring().keys] == [new_key.kid, old_key.kid]
+
+
+@pytest.mark.django_db
+def test_recently_published_key_becomes_current_key_after_cache_max_age(settings):
+    settings.KEY_MANAGER_KEYS_CACHE_MAX_AGE = 3600
+    now = timezone.now()
+    published = create_managed_rsa_key(now - timedelta(days=5))
+    recent = create_managed_rsa_key(now - timedelta(minutes=30))
+    client = OIDCClientFactory(jwt_alg='RS256')
+
+    assert get_signing_kid(sign_jwt({'sub': 'test'}, client)) == published.kid
+    assert get_signing_key_ring().promote_at == recent.managedrsakey.created_at + timedelta(hours=1)
+
+    with mock.patch('key_manager.signing_keys.now', return_value=now + timedelta(minutes=31)):
+        assert get_signing_kid(sign_jwt({'sub': 'test'}, client)) == recent.kid
+        assert get_signing_key_ring().promote_at is None
+
+
+@pytest.mark.django_db
+def test_recently_published_key_is_used_when_there_is_no_other_key():
+    recent = create_managed_rsa_key(timezone.now())
+
+    assert get_signing_kid(sign_jwt({'sub': 'test'}, OIDCClientFactory(jwt_alg='RS256'))) == recent.kid
+
+
+@pytest.mark.django_db
+def test_signing_without_keys_fails():
+    with pytest.raises(Exception, match='You must add at least one RSA Key.'):
+        sign_jwt({'sub': 'test'}, OIDCClientFactory(jwt_alg='RS256'))
+
+
+@pytest.mark.django_db
+def test_es256_signing_uses_newest_unexpired_ec_key():
+    now = timezone.now()
+    create_managed_ec_key(now - timedelta(days=20), expired_at=now - timedelta(days=1))
+    current = create_managed_ec_key(now - timedelta(days=5))
+    client = OIDCClientFactory(jwt_alg='RS256')
+
+    jwt = sign_jwt({'sub': 'test'}, client, alg='ES256')
+
+    assert factory(jwt).jwt.headers == {'alg': 'ES256', 'kid': current.kid}
+    assert verify_with_jwks(jwt, get_signing_key_ring().get_public_jwks()) == {'sub': 'test'}
+
+
+@pytest.mark.django_db
+def test_es256_signing_without_ec_keys_fails():
+    with pytest.raises(Exception, match='You must add at least one EC Key.'):
+        sign_jwt({'sub': 'test'}, OIDCClientFactory(jwt_alg='RS256'), alg='ES256')
+
+
+@pytest.mark.django_db
+def test_ec_keys_are_managed_when_enabled(settings):
+    settings.KEY_MANAGER_RSA_KEY_LENGTH = 1024
+    settings.KEY_MANAGER_EC_KEYS_ENABLED = True
+    old_key = create_managed_ec_key(timezone.now() - timedelta(days=365))
+    removed_key = create_managed_ec_key(
+        timezone.now() - timedelta(days=365), expired_at=timezone.now() - timedelta(days=30)
+    )
+
+    call_command('manage_openid_keys')
+
+    old_key.refresh_from_db()
+    assert old_key.expired_at is not None
+    assert not ManagedECKey.objects.filter(pk=removed_key.pk).exists()
+    new_key = ManagedECKey.objects.get(expired_at=None)
+    assert [key['kid'] for key in get_signing_key_ring().ec_keys] == [old_key.kid, new_key.kid]
+
+    later = timezone.now() + timedelta(days=1)
+    with mock.patch('key_manager.signing_keys.now', return_value=later):
+        assert [key['kid'] for key in get_signing_key_ring().ec_keys] == [new_key.kid, old_key.kid]
+
+
+@pytest.mark.django_db
+def test_ec_keys_are_not_managed_by_default(settings):
+    settings.KEY_MANAGER_RSA_KEY_LENGTH = 1024
+
+    call_command('manage_openid_keys')
+
+    assert not ManagedECKey.objects.exists()
+
+
+@pytest.mark.django_db
+def test_jwks_publishes_rsa_and_ec_keys(client):
+    rsakey = create_managed_rsa_key(timezone.now())
+    eckey = create_managed_ec_key(timezone.now())
+
+    response = client.get('/openid/jwks')
+
+    assert response.status_code == 200
+    keys = response.json()['keys']
+    assert [(key['kty'], key['alg'], key['use'], key['kid']) for key in keys] == [
+        ('RSA', 'RS256', 'sig', rsakey.kid),
+        ('EC', 'ES256', 'sig', eckey.kid),
+    ]
+    assert 'd' not in keys[1]
+    assert keys[1]['crv'] == 'P-256'
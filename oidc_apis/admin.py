@@ -7,7 +7,7 @@ from parler.forms import TranslatableModelForm
 
 from users.models import OidcClientOptions
 
-from .models import Api, ApiDomain, ApiScope, ApiScopeTranslation
+from .models import Api, ApiDomain, ApiScope, ApiScopeTranslation, BackchannelLogoutDelivery
 
 
 class DontRequireIdentifier(object):
@@ -70,6 +70,14 @@ class ApiScopeTranslationAdmin(admin.ModelAdmin):
     list_display = ['master', 'language_code', 'name', 'description']
 
 
+@admin.register(BackchannelLogoutDelivery)
+class BackchannelLogoutDeliveryAdmin(admin.ModelAdmin):
+    list_display = ['api', 'sub', 'sid', 'created_at', 'next_attempt_at', 'expires_at', 'attempts']
+    list_filter = ['api']
+    search_fields = ['sub', 'sid']
+    readonly_fields = ['api', 'iss', 'sub', 'sid', 'created_at', 'attempts', 'last_error']
+
+
 class OidcClientForm(oidc_provider.admin.ClientForm):
     """
     OIDC Client form which allows changing the client_id.
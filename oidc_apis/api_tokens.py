@@ -1,10 +1,16 @@
 import datetime
+import hashlib
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 
+from django.conf import settings
+from django.core.cache import cache
 from django.utils import timezone
-from oidc_provider.lib.utils.token import create_id_token, encode_id_token
+from oidc_provider.lib.utils.token import create_id_token
 
-from .models import ApiScope
+from key_manager.signing_keys import get_client_signing_keys, get_signing_key_ring, sign_jwt_with_keys
+
+from .registry import get_api_scope_registry
 
 
 def get_api_tokens_by_access_token(token, request=None):
@@ -19,37 +25,155 @@ def get_api_tokens_by_access_token(token, request=None):
 
     :rtype: dict[str,str]
     :return: Dictionary of the API tokens with API identifer as the key
+
+    The signed API tokens are cached until the access token expires. A
+    cached API token is used only if it was signed with the current
+    signing keys of the API.
     """
     # Limit scopes to known and allowed API scopes
-    known_api_scopes = ApiScope.objects.by_identifiers(token.scope)
-    allowed_api_scopes = known_api_scopes.allowed_for_client(token.client)
+    allowed_api_scopes = get_api_scope_registry().allowed_for_client(token.scope, token.client)
 
     # Group API scopes by the API identifiers
     scopes_by_api = defaultdict(list)
     for api_scope in allowed_api_scopes:
         scopes_by_api[api_scope.api.identifier].append(api_scope)
 
-    return {
-        api_identifier: generate_api_token(scopes, token, request)
-        for (api_identifier, scopes) in scopes_by_api.items()
+    if not scopes_by_api:
+        return {}
+
+    cache_key = _get_api_tokens_cache_key(token)
+    cached_api_tokens = cache.get(cache_key, {})
+    key_ring = get_signing_key_ring()
+
+    key_ids = {}
+    api_tokens = {}
+    unsigned_scopes_by_api = {}
+    for (api_identifier, scopes) in scopes_by_api.items():
+        key_ids[api_identifier] = _get_signing_key_id(scopes[0].api, key_ring)
+        cached_key_id, api_token = cached_api_tokens.get(api_identifier, (None, None))
+        if cached_key_id == key_ids[api_identifier]:
+            api_tokens[api_identifier] = api_token
+        else:
+            unsigned_scopes_by_api[api_identifier] = scopes
+
+    api_tokens.update(generate_api_tokens(unsigned_scopes_by_api, token, request))
+    signed_api_tokens = {
+        api_identifier: (key_ids[api_identifier], api_token) for (api_identifier, api_token) in api_tokens.items()
     }
 
+    timeout = int((token.expires_at - timezone.now()).total_seconds())
+    if signed_api_tokens != cached_api_tokens and timeout > 0:
+        cache.set(cache_key, signed_api_tokens, timeout)
+
+    return api_tokens
+
+
+def clear_cached_api_tokens(token):
+    """Remove the cached API tokens of an access token"""
+    cache.delete(_get_api_tokens_cache_key(token))
+
+
+def _get_api_tokens_cache_key(token):
+    # The access token is a bearer secret so it's not used in the key as is
+    access_token_hash = hashlib.sha256(token.access_token.encode('utf-8')).hexdigest()
+    return 'api_tokens:{}'.format(access_token_hash)
+
+
+def _get_signing_key_id(api, key_ring):
+    """Return an identifier for the current signing keys of the API
+
+    The identifier changes whenever the keys are rotated or the secret of
+    the client changes."""
+    alg = api.get_jwt_alg()
+    if alg == 'RS256':
+        return 'RS256:{}'.format(key_ring.version)
+    if alg == 'ES256':
+        return 'ES256:{}'.format(key_ring.ec_version)
+
+    client = api.oidc_client
+    return '{}:{}'.format(alg, hashlib.sha256(client.client_secret.encode('utf-8')).hexdigest())
+
 
 def generate_api_token(api_scopes, token, request=None):
     assert api_scopes
-    api = api_scopes[0].api
-    audience = api.oidc_client.client_id
-    req_scopes = api.required_scopes
+    api_identifier = api_scopes[0].api.identifier
+    return generate_api_tokens({api_identifier: api_scopes}, token, request)[api_identifier]
+
+
+def generate_api_tokens(scopes_by_api, token, request=None):
+    """
+    Generate API Tokens for several APIs at once.
+
+    The ID token claims are created once for every distinct set of required
+    scopes and only the audience is changed per API. Several tokens are
+    signed in a thread pool if OIDC_APIS_API_TOKEN_SIGNING_MAX_WORKERS allows
+    more than one thread.
+
+    :type scopes_by_api: dict[str,list[ApiScope]]
+    :param scopes_by_api: API scopes grouped by the API identifiers
+
+    :rtype: dict[str,str]
+    :return: Dictionary of the API tokens with API identifer as the key
+    """
+    id_tokens = {}
+    keys = {}
+    payloads = {}
+    for (api_identifier, api_scopes) in scopes_by_api.items():
+        api = api_scopes[0].api
+        audience = api.oidc_client.client_id
+        req_scopes = api.required_scopes
+
+        id_token_key = frozenset(req_scopes)
+        if id_token_key not in id_tokens:
+            id_tokens[id_token_key] = create_id_token(
+                token, token.user, aud=audience, request=request, scope=req_scopes)
+
+        payload = {}
+        payload.update(id_tokens[id_token_key])
+        payload['aud'] = str(audience)
+        payload.update(_get_api_authorization_claims(api_scopes))
+        payload['exp'] = _get_api_token_expires_at(token)
+
+        # All RS256 and ES256 clients share the same keys
+        client = api.oidc_client
+        alg = api.get_jwt_alg()
+        keys_key = (alg, client.client_secret if alg == 'HS256' else None)
+        if keys_key not in keys:
+            keys[keys_key] = get_client_signing_keys(client, alg)
+
+        payloads[api_identifier] = (payload, alg, keys[keys_key])
+
+    if len(payloads) < 2 or settings.OIDC_APIS_API_TOKEN_SIGNING_MAX_WORKERS < 2:
+        return {
+            api_identifier: _sign_api_token(*signing_args) for (api_identifier, signing_args) in payloads.items()
+        }
+
+    futures = {
+        api_identifier: _get_signing_executor().submit(_sign_api_token, *signing_args)
+        for (api_identifier, signing_args) in payloads.items()
+    }
+
+    return {api_identifier: future.result() for (api_identifier, future) in futures.items()}
+
+
+def _sign_api_token(payload, alg, keys):
+    return sign_jwt_with_keys(payload, alg, keys)
+
+
+_signing_executor = None
+
 
-    id_token = create_id_token(
-        token, token.user, aud=audience, request=request, scope=req_scopes)
+def _get_signing_executor():
+    """Return the thread pool used for signing the API tokens of one request"""
+    global _signing_executor
 
-    payload = {}
-    payload.update(id_token)
-    payload.update(_get_api_authorization_claims(api_scopes))
-    payload['exp'] = _get_api_token_expires_at(token)
+    if _signing_executor is None:
+        _signing_executor = ThreadPoolExecutor(
+            max_workers=settings.OIDC_APIS_API_TOKEN_SIGNING_MAX_WORKERS,
+            thread_name_prefix='api-token-signing',
+        )
 
-    return encode_id_token(payload, api.oidc_client)
+    return _signing_executor
 
 
 def _get_api_authorization_claims(api_scopes):
@@ -1,44 +1,300 @@
 import logging
+from collections import Counter, namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import timedelta
+from timeit import default_timer
 
 import requests
+from django.conf import settings
+from django.db import transaction
+from django.utils.timezone import now
 from oidc_provider.lib.utils.common import get_issuer
 from requests import RequestException
+from requests.adapters import HTTPAdapter
 
-from oidc_apis.models import ApiScope
+from oidc_apis.models import BackchannelLogoutDelivery
+from oidc_apis.registry import get_api_scope_registry
 from tunnistamo.oidc import create_logout_token
 
 logger = logging.getLogger(__name__)
 
+BackchannelLogoutResult = namedtuple('BackchannelLogoutResult', ['api', 'elapsed', 'error'])
 
-def send_backchannel_logout_to_api(api, request, sub, sid=None):
-    if not api.backchannel_logout_url:
-        return
+_http_session = None
 
-    iss = get_issuer(request=request)
 
-    response = requests.post(api.backchannel_logout_url, timeout=2, data={
-        'logout_token': create_logout_token(api.oidc_client, iss, sub, sid),
+def _get_http_session():
+    """Return a requests session shared by the back-channel log outs
+
+    The session keeps the connections to the APIs alive between log outs."""
+    global _http_session
+
+    if _http_session is None:
+        pool_size = settings.OIDC_APIS_BACKCHANNEL_LOGOUT_MAX_WORKERS
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        http_session = requests.Session()
+        http_session.mount('http://', adapter)
+        http_session.mount('https://', adapter)
+        _http_session = http_session
+
+    return _http_session
+
+
+def _post_logout_token(url, logout_token):
+    start_time = default_timer()
+    response = _get_http_session().post(url, timeout=settings.OIDC_APIS_BACKCHANNEL_LOGOUT_TIMEOUT, data={
+        'logout_token': logout_token,
     })
     response.raise_for_status()
 
+    return default_timer() - start_time
 
-def send_backchannel_logout_to_apis_in_token_scope(oidc_token, request, sid=None):
-    known_api_scopes = ApiScope.objects.by_identifiers(oidc_token.scope)
-    token_api_scopes = known_api_scopes.allowed_for_client(oidc_token.client)
 
-    for api_scope in token_api_scopes:
+def get_backchannel_logout_apis(oidc_token):
+    """Return the APIs in the token scope that accept back-channel log outs"""
+    token_api_scopes = get_api_scope_registry().allowed_for_client(oidc_token.scope, oidc_token.client)
+
+    return [api_scope.api for api_scope in token_api_scopes if api_scope.api.backchannel_logout_url]
+
+
+def _log_failed_backchannel_logout(api, sub, sid, error):
+    logger.info(
+        'Failed to send backchannel logout (User ID: {user_id}, sid: {sid}) to API "{api_name}": {e}'.format(
+            user_id=sub,
+            sid=sid,
+            api_name=api.name,
+            e=error,
+        ))
+
+
+def _post_logout_tokens(posts):
+    """Post log out tokens concurrently
+
+    The posts are given as a dict of (URL, log out token) tuples keyed by
+    anything hashable. Returns a dict of (elapsed, error) tuples with the same
+    keys. Posts not finished within the total timeout are abandoned and
+    reported as failed."""
+    if not posts:
+        return {}
+
+    max_workers = min(len(posts), settings.OIDC_APIS_BACKCHANNEL_LOGOUT_MAX_WORKERS)
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='backchannel-logout')
+    try:
+        futures = {
+            executor.submit(_post_logout_token, url, logout_token): key
+            for key, (url, logout_token) in posts.items()
+        }
+        done, not_done = wait(futures, timeout=settings.OIDC_APIS_BACKCHANNEL_LOGOUT_TOTAL_TIMEOUT)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    outcomes = {}
+    for future, key in futures.items():
+        if future in not_done:
+            error = 'Total timeout of {} seconds exceeded'.format(settings.OIDC_APIS_BACKCHANNEL_LOGOUT_TOTAL_TIMEOUT)
+            outcomes[key] = (None, error)
+            continue
+
         try:
-            send_backchannel_logout_to_api(
-                api_scope.api,
-                request,
-                sub=str(oidc_token.user.uuid),
-                sid=sid,
-            )
+            outcomes[key] = (future.result(), None)
         except RequestException as e:
-            logger.info(
-                'Failed to send backchannel logout (User ID: {user_id}, sid: {sid}) to API "{api_name}": {e}'.format(
-                    user_id=str(oidc_token.user.uuid),
-                    sid=sid,
-                    api_name=api_scope.api.name,
-                    e=e,
+            outcomes[key] = (None, e)
+
+    return outcomes
+
+
+def _send_logout_tokens(logouts):
+    """Create and post log out tokens concurrently
+
+    The log outs are given as a dict of (API, iss, sub, sid) tuples keyed by
+    anything hashable. Returns a dict of (elapsed, error) tuples with the same
+    keys. A log out token which can't be created, e.g. because the API uses
+    ES256 without EC keys, fails only the log out of its API."""
+    posts = {}
+    outcomes = {}
+    # The log out tokens are created here instead of in the thread pool
+    # because creating them reads the signing keys from the database.
+    for key, (api, iss, sub, sid) in logouts.items():
+        try:
+            logout_token = create_logout_token(api.oidc_client, iss, sub, sid, alg=api.get_jwt_alg())
+        except Exception as e:
+            logger.exception('Failed to create a logout token for API "{api_name}"'.format(api_name=api.name))
+            outcomes[key] = (None, e)
+            continue
+        posts[key] = (api.backchannel_logout_url, logout_token)
+
+    outcomes.update(_post_logout_tokens(posts))
+
+    return outcomes
+
+
+def _log_backchannel_logout_outcome(api, sub, sid, elapsed, error):
+    if error is not None:
+        _log_failed_backchannel_logout(api, sub, sid, error)
+        return
+
+    logger.info(
+        'Sent backchannel logout (User ID: {user_id}, sid: {sid}) to API "{api_name}" in {elapsed:.3f}s'.format(
+            user_id=sub,
+            sid=sid,
+            api_name=api.name,
+            elapsed=elapsed,
+        ))
+
+
+def send_backchannel_logouts(apis, request, sub, sid=None):
+    """Send back-channel log outs to the APIs concurrently
+
+    Every API gets at most one log out token. The log out tokens are posted in
+    a thread pool using keep-alive connections. Log outs not finished within the
+    total timeout are abandoned and reported as failed.
+
+    :rtype: list[BackchannelLogoutResult]
+    """
+    apis_by_id = {api.pk: api for api in apis if api.backchannel_logout_url}
+    if not apis_by_id:
+        return []
+
+    iss = get_issuer(request=request)
+    outcomes = _send_logout_tokens({api.pk: (api, iss, sub, sid) for api in apis_by_id.values()})
+
+    results = []
+    for api_id, (elapsed, error) in outcomes.items():
+        api = apis_by_id[api_id]
+        _log_backchannel_logout_outcome(api, sub, sid, elapsed, error)
+        results.append(BackchannelLogoutResult(api, elapsed, error))
+
+    return results
+
+
+def _get_delivery_lease():
+    """Return the time a delivery is reserved for the worker attempting it"""
+    return timedelta(seconds=settings.OIDC_APIS_BACKCHANNEL_LOGOUT_TOTAL_TIMEOUT * 2)
+
+
+def queue_backchannel_logouts(apis, request, sub, sid=None, claim=False):
+    """Store back-channel log outs to the APIs in the outbox
+
+    Every API gets at most one log out. Returns the created deliveries which
+    can be passed to `deliver_backchannel_logouts`. With claim the deliveries
+    are created already claimed by the caller so that the
+    send_backchannel_logouts workers don't send them at the same time.
+
+    :rtype: list[BackchannelLogoutDelivery]
+    """
+    apis_by_id = {api.pk: api for api in apis if api.backchannel_logout_url}
+    if not apis_by_id:
+        return []
+
+    iss = get_issuer(request=request)
+    current_time = now()
+    expires_at = current_time + timedelta(seconds=settings.OIDC_APIS_BACKCHANNEL_LOGOUT_EXPIRATION)
+
+    next_attempt_at = current_time + _get_delivery_lease() if claim else current_time
+
+    return BackchannelLogoutDelivery.objects.bulk_create([
+        BackchannelLogoutDelivery(
+            api=api,
+            iss=iss,
+            sub=sub,
+            sid=sid,
+            created_at=current_time,
+            next_attempt_at=next_attempt_at,
+            expires_at=expires_at,
+        ) for api in apis_by_id.values()
+    ])
+
+
+def deliver_backchannel_logouts(deliveries):
+    """Try once to deliver back-channel log outs from the outbox
+
+    Delivered log outs are removed from the outbox. Failed log outs are
+    rescheduled with an exponential backoff. Log outs that have expired or
+    whose API no longer accepts back-channel log outs are removed without
+    sending.
+
+    :rtype: list[BackchannelLogoutResult]
+    """
+    current_time = now()
+    deliveries_by_id = {}
+    discarded_ids = []
+    for delivery in deliveries:
+        if not delivery.api.backchannel_logout_url:
+            discarded_ids.append(delivery.pk)
+        elif delivery.expires_at <= current_time:
+            logger.warning(
+                'Gave up sending backchannel logout (User ID: {user_id}, sid: {sid}) to API "{api_name}" '
+                'after {attempts} attempts: {e}'.format(
+                    user_id=delivery.sub,
+                    sid=delivery.sid,
+                    api_name=delivery.api.name,
+                    attempts=delivery.attempts,
+                    e=delivery.last_error,
                 ))
+            discarded_ids.append(delivery.pk)
+        else:
+            deliveries_by_id[delivery.pk] = delivery
+
+    outcomes = _send_logout_tokens({
+        delivery.pk: (delivery.api, delivery.iss, delivery.sub, delivery.sid)
+        for delivery in deliveries_by_id.values()
+    })
+
+    results = []
+    delivered_ids = []
+    for delivery_id, (elapsed, error) in outcomes.items():
+        delivery = deliveries_by_id[delivery_id]
+        _log_backchannel_logout_outcome(delivery.api, delivery.sub, delivery.sid, elapsed, error)
+        results.append(BackchannelLogoutResult(delivery.api, elapsed, error))
+
+        if error is None:
+            delivered_ids.append(delivery_id)
+        else:
+            delivery.mark_failed(error)
+
+    BackchannelLogoutDelivery.objects.filter(pk__in=delivered_ids + discarded_ids).delete()
+
+    return results
+
+
+def claim_due_backchannel_logout_deliveries(batch_size):
+    """Return deliveries from the outbox that are due to be sent
+
+    At most OIDC_APIS_BACKCHANNEL_LOGOUT_MAX_PER_API deliveries are claimed per
+    API so that a burst of log outs doesn't flood a single API. The claimed
+    deliveries are postponed for the duration of the delivery attempt so that
+    other workers don't pick them up at the same time.
+
+    :rtype: list[BackchannelLogoutDelivery]
+    """
+    max_per_api = settings.OIDC_APIS_BACKCHANNEL_LOGOUT_MAX_PER_API
+    current_time = now()
+    lease = _get_delivery_lease()
+
+    with transaction.atomic():
+        due_deliveries = BackchannelLogoutDelivery.objects.due(current_time).select_related(
+            'api__domain', 'api__oidc_client',
+        ).select_for_update(skip_locked=True, of=('self',)).order_by('next_attempt_at')[:batch_size]
+
+        per_api_counts = Counter()
+        claimed = []
+        for delivery in due_deliveries:
+            if per_api_counts[delivery.api_id] >= max_per_api:
+                continue
+            per_api_counts[delivery.api_id] += 1
+            claimed.append(delivery)
+
+        BackchannelLogoutDelivery.objects.filter(pk__in=[d.pk for d in claimed]).update(
+            next_attempt_at=current_time + lease,
+        )
+
+    return claimed
+
+
+def send_backchannel_logout_to_apis_in_token_scope(oidc_token, request, sid=None):
+    return send_backchannel_logouts(
+        get_backchannel_logout_apis(oidc_token),
+        request,
+        sub=str(oidc_token.user.uuid),
+        sid=sid,
+    )
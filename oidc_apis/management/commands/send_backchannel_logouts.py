@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from oidc_apis.backchannel_logout import claim_due_backchannel_logout_deliveries, deliver_backchannel_logouts
+from oidc_apis.models import BackchannelLogoutDelivery
+
+
+class Command(BaseCommand):
+    help = 'Sends the back-channel log outs waiting in the outbox to the APIs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help='Number of log outs sent at a time')
+        parser.add_argument('--loop', action='store_true', help='Keep sending log outs until interrupted')
+        parser.add_argument('--interval', type=float, default=10, help='Seconds to sleep between loops')
+
+    def handle(self, *args, **options):
+        while True:
+            sent, failed = self.drain(options['batch_size'])
+            if sent or failed or options['verbosity'] > 1:
+                self.stdout.write('Sent {} back-channel log outs, {} failed. {} log outs in the outbox.'.format(
+                    sent, failed, BackchannelLogoutDelivery.objects.count(),
+                ))
+
+            if not options['loop']:
+                return
+
+            time.sleep(options['interval'])
+
+    def drain(self, batch_size):
+        """Send the due log outs in batches until there are none left"""
+        sent = failed = 0
+        while True:
+            deliveries = claim_due_backchannel_logout_deliveries(batch_size)
+            if not deliveries:
+                return sent, failed
+
+            for result in deliver_backchannel_logouts(deliveries):
+                if result.error is None:
+                    sent += 1
+                else:
+                    failed += 1
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.14 on 2026-10-18 06:32
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('oidc_apis', '0004_alter_apiscopetranslation_master'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BackchannelLogoutDelivery',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('iss', models.CharField(max_length=255, verbose_name='issuer')),
+                ('sub', models.CharField(max_length=255, verbose_name='subject')),
+                ('sid', models.CharField(blank=True, max_length=255, null=True, verbose_name='session ID')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='created at')),
+                ('next_attempt_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='next attempt at')),
+                ('expires_at', models.DateTimeField(verbose_name='expires at')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='attempts')),
+                ('last_error', models.TextField(blank=True, verbose_name='last error')),
+                ('api', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='backchannel_logout_deliveries', to='oidc_apis.api', verbose_name='API')),
+            ],
+            options={
+                'verbose_name': 'back-channel log out delivery',
+                'verbose_name_plural': 'back-channel log out deliveries',
+                'ordering': ('next_attempt_at',),
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.14 on 2026-10-18 07:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('oidc_apis', '0005_backchannel_logout_delivery'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='api',
+            name='jwt_alg',
+            field=models.CharField(blank=True, choices=[('ES256', 'ES256')], default='', help_text='Algorithm used to sign the API Tokens and the Log Out tokens of the API. If not given, the JWT algorithm of the OIDC client is used. ES256 requires EC keys to be enabled in the key manager.', max_length=10, verbose_name='JWT algorithm'),
+        ),
+    ]
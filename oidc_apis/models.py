@@ -1,7 +1,11 @@
+from datetime import timedelta
+
+from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.core.validators import RegexValidator
 from django.db import models
 from django.utils.crypto import get_random_string
+from django.utils.timezone import now
 from django.utils.translation import gettext_lazy as _
 from multiselectfield import MultiSelectField
 from oidc_provider.models import Client
@@ -9,6 +13,7 @@ from parler.fields import TranslatedField, TranslationsForeignKey
 from parler.managers import TranslatableQuerySet
 from parler.models import TranslatableModel, TranslatedFieldsModel
 
+from key_manager.signing_keys import get_signing_key_ring
 from oidc_apis.utils import combine_uniquely
 
 from .mixins import AutoFilledIdentifier, ImmutableFields
@@ -73,6 +78,16 @@ class Api(models.Model):
             "be [helusers.urls path]/logout/oidc/backchannel/"
         )
     )
+    jwt_alg = models.CharField(
+        max_length=10, blank=True, default='',
+        choices=[('ES256', 'ES256')],
+        verbose_name=_("JWT algorithm"),
+        help_text=_(
+            "Algorithm used to sign the API Tokens and the Log Out tokens of "
+            "the API. If not given, the JWT algorithm of the OIDC client is used. "
+            "ES256 requires EC keys to be enabled in the key manager."
+        )
+    )
 
     class Meta:
         unique_together = [('domain', 'name')]
@@ -88,6 +103,9 @@ class Api(models.Model):
             domain=self.domain.identifier.rstrip('/'),
             name=self.name)
 
+    def get_jwt_alg(self):
+        return self.jwt_alg or self.oidc_client.jwt_alg
+
     def required_scopes_string(self):
         return ' '.join(sorted(self.required_scopes))
     required_scopes_string.short_description = _("required scopes")
@@ -100,6 +118,11 @@ class Api(models.Model):
                 raise ValidationError(
                     {'oidc_client': _(
                         "OIDC Client ID must match with the identifier")})
+        if self.jwt_alg == 'ES256' and not get_signing_key_ring().ec_keys:
+            raise ValidationError(
+                {'jwt_alg': _(
+                    "ES256 requires EC keys. Enable EC keys in the key manager "
+                    "and create them with the manage_openid_keys command.")})
         super(Api, self).clean()
 
     def save(self, *args, **kwargs):
@@ -187,9 +210,9 @@ class ApiScope(AutoFilledIdentifier, ImmutableFields, TranslatableModel):
 
     @classmethod
     def _get_required_scopes(cls, scopes):
-        api_scopes = ApiScope.objects.by_identifiers(scopes)
-        apis = {x.api for x in api_scopes}
-        return set(sum((list(api.required_scopes) for api in apis), []))
+        from .registry import get_api_scope_registry
+
+        return get_api_scope_registry().get_required_scopes(scopes)
 
 
 class ApiScopeTranslation(TranslatedFieldsModel):
@@ -209,3 +232,48 @@ class ApiScopeTranslation(TranslatedFieldsModel):
 
     def __str__(self):
         return "{obj}[{lang}]".format(obj=self.master, lang=self.language_code)
+
+
+class BackchannelLogoutDeliveryQuerySet(models.QuerySet):
+    def due(self, at=None):
+        return self.filter(next_attempt_at__lte=at or now())
+
+
+class BackchannelLogoutDelivery(models.Model):
+    """A back-channel log out waiting to be delivered to an API
+
+    The log out token is created only when the delivery is attempted so that
+    its issued at time is always fresh. Delivered log outs are removed and the
+    failed ones are retried with an exponential backoff until they expire."""
+    api = models.ForeignKey(
+        Api, related_name='backchannel_logout_deliveries', on_delete=models.CASCADE,
+        verbose_name=_("API"))
+    iss = models.CharField(max_length=255, verbose_name=_("issuer"))
+    sub = models.CharField(max_length=255, verbose_name=_("subject"))
+    sid = models.CharField(max_length=255, null=True, blank=True, verbose_name=_("session ID"))
+    created_at = models.DateTimeField(default=now, verbose_name=_("created at"))
+    next_attempt_at = models.DateTimeField(default=now, db_index=True, verbose_name=_("next attempt at"))
+    expires_at = models.DateTimeField(verbose_name=_("expires at"))
+    attempts = models.PositiveIntegerField(default=0, verbose_name=_("attempts"))
+    last_error = models.TextField(blank=True, verbose_name=_("last error"))
+
+    objects = BackchannelLogoutDeliveryQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = _("back-channel log out delivery")
+        verbose_name_plural = _("back-channel log out deliveries")
+        ordering = ('next_attempt_at',)
+
+    def __str__(self):
+        return '{} (sub: {}, sid: {})'.format(self.api, self.sub, self.sid)
+
+    def get_retry_delay(self):
+        """Return the delay before the next attempt after a failed one"""
+        delay = settings.OIDC_APIS_BACKCHANNEL_LOGOUT_RETRY_DELAY * 2 ** max(self.attempts - 1, 0)
+        return timedelta(seconds=min(delay, settings.OIDC_APIS_BACKCHANNEL_LOGOUT_MAX_RETRY_DELAY))
+
+    def mark_failed(self, error):
+        self.attempts += 1
+        self.last_error = str(error)
+        self.next_attempt_at = now() + self.get_retry_delay()
+        self.save(update_fields=['attempts', 'last_error', 'next_attempt_at'])
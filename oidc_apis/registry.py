@@ -0,0 +1,104 @@
+from tunnistamo.snapshots import VersionedSnapshot
+from tunnistamo.utils import get_translation, get_translations
+
+from .models import ApiScope
+
+
+class ApiScopeRegistry(object):
+    """
+    In-memory index of the API scopes.
+
+    Holds the API scopes with their APIs, API domains, OIDC clients of the
+    APIs, translations and the IDs of the allowed clients.
+
+    The translated fields of the shared API scope instances would return the
+    language active when the registry was built, so the translations are read
+    with get_translated_field instead.
+    """
+    def __init__(self, api_scopes, allowed_client_ids):
+        """
+        :type api_scopes: Iterable[ApiScope]
+        :type allowed_client_ids: dict[int,frozenset[int]]
+        :param allowed_client_ids: IDs of the allowed clients by API scope ID
+        """
+        self._api_scopes = {api_scope.identifier: api_scope for api_scope in api_scopes}
+        self._allowed_client_ids = {
+            api_scope.identifier: allowed_client_ids.get(api_scope.pk, frozenset())
+            for api_scope in self._api_scopes.values()
+        }
+        self._translations = {
+            api_scope.identifier: {
+                field: get_translations(api_scope, field) for field in ('name', 'description')
+            }
+            for api_scope in self._api_scopes.values()
+        }
+
+    def get(self, identifier):
+        return self._api_scopes.get(identifier)
+
+    def get_translated_field(self, identifier, field):
+        """
+        Get a translated field of the API scope in the active language.
+        """
+        return get_translation(self._translations[identifier][field])
+
+    def all(self):
+        return [self._api_scopes[identifier] for identifier in sorted(self._api_scopes)]
+
+    def by_identifiers(self, identifiers):
+        """
+        Get the known API scopes in the order of the given identifiers.
+
+        :rtype: list[ApiScope]
+        """
+        return [
+            self._api_scopes[identifier]
+            for identifier in dict.fromkeys(identifiers)
+            if identifier in self._api_scopes
+        ]
+
+    def allowed_for_client(self, identifiers, client):
+        """
+        Get the known API scopes which the client is allowed to get.
+
+        :rtype: list[ApiScope]
+        """
+        return [
+            api_scope for api_scope in self.by_identifiers(identifiers)
+            if client.pk in self._allowed_client_ids[api_scope.identifier]
+        ]
+
+    def get_required_scopes(self, identifiers):
+        apis = {api_scope.api.pk: api_scope.api for api_scope in self.by_identifiers(identifiers)}
+        return set(sum((list(api.required_scopes) for api in apis.values()), []))
+
+
+def _build_api_scope_registry():
+    api_scopes = ApiScope.objects.select_related(
+        'api__domain', 'api__oidc_client',
+    ).prefetch_related('translations')
+
+    allowed_client_ids = {}
+    allowed_apps = ApiScope.allowed_apps.through.objects.values_list('apiscope_id', 'client_id')
+    for (api_scope_id, client_id) in allowed_apps:
+        allowed_client_ids.setdefault(api_scope_id, set()).add(client_id)
+
+    return ApiScopeRegistry(
+        list(api_scopes),
+        {api_scope_id: frozenset(client_ids) for (api_scope_id, client_ids) in allowed_client_ids.items()},
+    )
+
+
+api_scope_registry_snapshot = VersionedSnapshot('api_scope_registry', _build_api_scope_registry)
+
+
+def get_api_scope_registry():
+    """
+    Get the API scope registry of the current process.
+
+    The registry is rebuilt when API scopes, APIs, API domains or OIDC
+    clients are changed.
+
+    :rtype: ApiScopeRegistry
+    """
+    return api_scope_registry_snapshot.get()
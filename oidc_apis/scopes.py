@@ -1,28 +1,37 @@
 import re
 
+from django.db.models import prefetch_related_objects
 from django.utils.translation import gettext_lazy as _
 from oidc_provider.lib.claims import ScopeClaims, StandardScopeClaims
 from oidc_provider.lib.errors import BearerTokenError
-from social_django.models import UserSocialAuth
 
-from auth_backends.models import SuomiFiAccessLevel
+from auth_backends.suomifi_metadata import SUOMIFI_SCOPE_PREFIX, get_suomifi_metadata
 
 from .models import ApiScope
+from .registry import get_api_scope_registry
+
+
+def get_user_social_auth(user, provider):
+    """Return the first social auth of the user with the provider or None
+
+    All of the social auths of the user are loaded at once, or taken from the
+    prefetched social auths of the user."""
+    social_auths = [social_auth for social_auth in user.social_auth.all() if social_auth.provider == provider]
+    if not social_auths:
+        return None
+    return min(social_auths, key=lambda social_auth: social_auth.pk)
 
 
 class ApiScopeClaims(ScopeClaims):
     @classmethod
     def get_scopes_info(cls, scopes=[]):
-        scopes_by_identifier = {
-            api_scope.identifier: api_scope
-            for api_scope in ApiScope.objects.by_identifiers(scopes)
-        }
-        api_scopes = (scopes_by_identifier.get(scope) for scope in scopes)
+        registry = get_api_scope_registry()
+        api_scopes = (registry.get(scope) for scope in scopes)
         return [
             {
                 'scope': api_scope.identifier,
-                'name': api_scope.name,
-                'description': api_scope.description,
+                'name': registry.get_translated_field(api_scope.identifier, 'name'),
+                'description': registry.get_translated_field(api_scope.identifier, 'description'),
             }
             for api_scope in api_scopes if api_scope
         ]
@@ -32,10 +41,10 @@ class GithubUsernameScopeClaims(ScopeClaims):
     info_github_username = (
         _("GitHub username"), _("Access to your GitHub username."))
 
+    user_prefetch_lookups = ('social_auth',)
+
     def scope_github_username(self):
-        github_account = UserSocialAuth.objects.filter(
-            user=self.user, provider='github'
-        ).first()
+        github_account = get_user_social_auth(self.user, 'github')
         if not github_account:
             return {}
         github_data = github_account.extra_data
@@ -66,10 +75,11 @@ class UserConsentsScopeClaims(ScopeClaims):
 
 class AdGroupsScopeClaims(ScopeClaims):
     info_ad_groups = (_("AD Groups"), _("Access to your AD Group memberships."))
+    user_prefetch_lookups = ('ad_groups',)
 
     def scope_ad_groups(self):
         return {
-            'ad_groups': list(self.user.ad_groups.all().values_list('name', flat=True)),
+            'ad_groups': [ad_group.name for ad_group in self.user.ad_groups.all()],
         }
 
 
@@ -120,43 +130,64 @@ class ReducedStandardScopeClaims(StandardScopeClaims):
 class SuomiFiUserAttributeScopeClaimsMeta(type):
     def __dir__(cls):
         names = super().__dir__()
-        for level in SuomiFiAccessLevel.objects.all():
-            names.append('info_suomifi_' + level.shorthand)
+        for shorthand in get_suomifi_metadata().access_levels:
+            names.append('info_suomifi_' + shorthand)
         return names
 
     def __getattr__(cls, name):
         match = re.match(r'^info_suomifi_(.*)', name)
         if match:
-            try:
-                level = SuomiFiAccessLevel.objects.get(shorthand=match.group(1))
-                return (level.name, level.description)
-            except SuomiFiAccessLevel.DoesNotExist:
+            level = get_suomifi_metadata().access_levels.get(match.group(1))
+            if level is None:
                 raise AttributeError()
+            return (level.get_name(), level.get_description())
         return super().__getattr__(name)
 
 
 class SuomiFiUserAttributeScopeClaims(ScopeClaims, metaclass=SuomiFiUserAttributeScopeClaimsMeta):
+    claim_scope_prefix = SUOMIFI_SCOPE_PREFIX
+    user_prefetch_lookups = ('social_auth',)
+
     def create_response_dic(self):
         dic = {}
-        try:
-            social_user = UserSocialAuth.objects.get(user=self.user, provider='suomifi')
-        except UserSocialAuth.DoesNotExist:
+        social_user = get_user_social_auth(self.user, 'suomifi')
+        if not social_user:
             return dic
 
-        for level in SuomiFiAccessLevel.objects.all():
-            scope = 'suomifi_' + level.shorthand
-            if scope in self.scopes:
-                if scope not in self.client.scope:
-                    raise BearerTokenError('insufficient_scope')
-                dic[scope] = {}
-                for attribute in level.attributes.all():
-                    if attribute.friendly_name in social_user.extra_data['suomifi_attributes']:
-                        dic[scope][attribute.friendly_name] = \
-                            social_user.extra_data['suomifi_attributes'][attribute.friendly_name]
+        access_levels = get_suomifi_metadata().access_levels
+        for scope in self.scopes:
+            if not scope.startswith(self.claim_scope_prefix):
+                continue
+            level = access_levels.get(scope[len(self.claim_scope_prefix):])
+            if level is None:
+                continue
+            if scope not in self.client.scope:
+                raise BearerTokenError('insufficient_scope')
+            dic[scope] = {}
+            for friendly_name in level.attribute_friendly_names:
+                if friendly_name in social_user.extra_data['suomifi_attributes']:
+                    dic[scope][friendly_name] = social_user.extra_data['suomifi_attributes'][friendly_name]
         dic = self._clean_dic(dic)
         return dic
 
 
+def has_claims_for_scopes(claim_cls, scopes):
+    """Return True if the claim class provides claims for any of the scopes
+
+    The scopes of a claim class are the ones it has a scope method for, or the
+    ones starting with its claim scope prefix. The class attributes are read
+    directly so that the metaclass of the Suomi.fi claims isn't consulted."""
+    prefix = getattr(claim_cls, 'claim_scope_prefix', None)
+    if prefix:
+        return any(scope.startswith(prefix) for scope in scopes)
+
+    return any(
+        'scope_' + scope in vars(klass)
+        for klass in claim_cls.__mro__
+        for scope in scopes
+    )
+
+
 class CombinedScopeClaims(ScopeClaims):
     combined_scope_claims = [
         ReducedStandardScopeClaims,
@@ -187,8 +218,25 @@ class CombinedScopeClaims(ScopeClaims):
         super().__init__(token, *args, **kwargs)
 
     def create_response_dic(self):
+        """Create the claims of the claim classes having claims for the token scopes
+
+        The related objects of the user needed by the claim classes are
+        prefetched once and shared by all of them."""
         result = super(CombinedScopeClaims, self).create_response_dic()
-        for claim_cls in self.combined_scope_claims:
+
+        claim_classes = [
+            claim_cls for claim_cls in self.combined_scope_claims
+            if has_claims_for_scopes(claim_cls, self.scopes)
+        ]
+        prefetch_lookups = {
+            lookup
+            for claim_cls in claim_classes
+            for lookup in getattr(claim_cls, 'user_prefetch_lookups', ())
+        }
+        if prefetch_lookups:
+            prefetch_related_objects([self.user], *sorted(prefetch_lookups))
+
+        for claim_cls in claim_classes:
             claim = claim_cls(self._token)
             result.update(claim.create_response_dic())
         return result
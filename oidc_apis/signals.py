@@ -0,0 +1,21 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from oidc_provider.models import Client
+
+from .models import Api, ApiDomain, ApiScope, ApiScopeTranslation
+from .registry import api_scope_registry_snapshot
+
+
+@receiver(post_save, sender=ApiScope)
+@receiver(post_delete, sender=ApiScope)
+@receiver(post_save, sender=ApiScopeTranslation)
+@receiver(post_delete, sender=ApiScopeTranslation)
+@receiver(post_save, sender=Api)
+@receiver(post_delete, sender=Api)
+@receiver(post_save, sender=ApiDomain)
+@receiver(post_delete, sender=ApiDomain)
+@receiver(post_save, sender=Client)
+@receiver(post_delete, sender=Client)
+@receiver(m2m_changed, sender=ApiScope.allowed_apps.through)
+def invalidate_api_scope_registry(sender, **kwargs):
+    api_scope_registry_snapshot.invalidate()
@@ -5,10 +5,10 @@ import oidc_provider
 from django.conf import settings
 from django.contrib.auth import logout as django_user_logout
 from django.contrib.auth.views import redirect_to_login
-from social_django.models import UserSocialAuth
 
 from tunnistamo.auth_tools import filter_login_methods_by_provider_ids_string
-from users.models import OidcClientOptions, TunnistamoSession
+from users.login_configuration import get_oidc_client_login_configuration
+from users.models import TunnistamoSession
 
 
 def combine_uniquely(iterable1, iterable2):
@@ -52,25 +52,18 @@ def after_userlogin_hook(request, user, client):
 
     last_login_backend = request.session.get('social_auth_last_login_backend')
 
-    try:
-        client_options = OidcClientOptions.objects.get(oidc_client=client)
-
-        allowed_methods_for_client = client_options.login_methods.all()
-
+    login_configuration = get_oidc_client_login_configuration(client.client_id)
+    if login_configuration and login_configuration.login_methods is not None:
         idp_hint = request.GET.get('idp_hint')
-        login_methods = filter_login_methods_by_provider_ids_string(allowed_methods_for_client, idp_hint)
+        login_methods = filter_login_methods_by_provider_ids_string(login_configuration.login_methods, idp_hint)
 
         allowed_providers = set((x.provider_id for x in login_methods))
-        if last_login_backend is not None:
-            active_user_social_auth = user.social_auth.filter(provider=last_login_backend).first()
-
         if (last_login_backend is None
-                or (active_user_social_auth and active_user_social_auth.provider not in allowed_providers)):
+                or (last_login_backend not in allowed_providers
+                    and user.social_auth.filter(provider=last_login_backend).exists())):
             django_user_logout(request)
             next_page = request.get_full_path()
             return redirect_to_login(next_page, oidc_provider.settings.get('OIDC_LOGIN_URL'))
-    except OidcClientOptions.DoesNotExist:
-        pass
 
     is_returning_from_idp = request.GET.get('first_authz', '') == 'false'
     if not is_returning_from_idp and last_login_backend in settings.ALWAYS_REAUTHENTICATE_BACKENDS:
@@ -87,7 +80,7 @@ def additional_tunnistamo_id_token_claims(dic, user, token, request, **kwargs):
     # to which the ID Token was issued).
     dic['azp'] = token.client.client_id
 
-    tunnistamo_session = TunnistamoSession.objects.get_by_element(token)
+    tunnistamo_session = TunnistamoSession.objects.get_snapshot_by_element(token)
     if not tunnistamo_session:
         return dic
 
@@ -95,14 +88,13 @@ def additional_tunnistamo_id_token_claims(dic, user, token, request, **kwargs):
     dic['sid'] = str(tunnistamo_session.id)
 
     # Set the social auth backend name as the "amr" (Authentication Methods Reference)
-    user_social_auth = tunnistamo_session.get_content_object_by_model(UserSocialAuth)
-    if user_social_auth:
+    if tunnistamo_session.amr:
         # TODO: By the OIDC spec the value of amr should be a list of strings,
         #       but Tunnistamo sets it erroneously to a string. The error is kept
         #       for backwards compatibility for now.
-        dic['amr'] = user_social_auth.provider
+        dic['amr'] = tunnistamo_session.amr
 
-    # Get the "loa" (Level of Assurance) value from the Tunnistamo Session
-    dic['loa'] = tunnistamo_session.get_data('loa', 'low')
+    # The "loa" (Level of Assurance) value of the Tunnistamo Session
+    dic['loa'] = tunnistamo_session.loa
 
     return dic
@@ -20,7 +20,7 @@ def get_api_tokens_view(request, token, *args, **kwargs):
     :rtype: JsonResponse
     """
     # Check that a Tunnistamo Session exists and has not ended
-    tunnistamo_session = TunnistamoSession.objects.get_by_element(token)
+    tunnistamo_session = TunnistamoSession.objects.get_snapshot_by_element(token)
     if not tunnistamo_session or tunnistamo_session.has_ended():
         error = BearerTokenError('invalid_token')
         response = HttpResponse(status=error.status)
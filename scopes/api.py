@@ -1,13 +1,21 @@
+import hashlib
+import json
+
 from django.conf import settings
 from django.utils import translation
+from django.utils.decorators import method_decorator
 from django.utils.functional import cached_property
+from django.views.decorators.http import condition
 from rest_framework import serializers
 from rest_framework.schemas import AutoSchema
 from rest_framework.views import APIView
 
+from auth_backends.suomifi_metadata import suomifi_metadata_snapshot
 from oidc_apis.models import ApiScope
+from oidc_apis.registry import api_scope_registry_snapshot
 from oidc_apis.scopes import CombinedScopeClaims
 from tunnistamo.pagination import DefaultPagination
+from tunnistamo.snapshots import VersionedSnapshot
 from tunnistamo.utils import TranslatableSerializer
 
 ENGLISH_LANGUAGE_CODE = 'en'
@@ -28,14 +36,26 @@ class AutoSchemaWithPaginationParams(AutoSchema):
         return DefaultPagination().get_schema_fields(method)
 
 
+def _get_scope_list_etag(request, *args, **kwargs):
+    # The pagination links contain the full URL and the rendered content
+    # depends on the negotiated format in addition to the scopes.
+    etag_source = '\n'.join([
+        get_scope_catalogue().etag,
+        request.build_absolute_uri(),
+        request.accepted_media_type or '',
+    ])
+    return hashlib.sha256(etag_source.encode('utf-8')).hexdigest()
+
+
 class ScopeListView(APIView):
     """
     List scopes related to OIDC authentication.
     """
     schema = AutoSchemaWithPaginationParams()
 
+    @method_decorator(condition(etag_func=_get_scope_list_etag))
     def get(self, request, format=None):
-        scopes = ScopeDataBuilder().get_scopes_data()
+        scopes = get_scope_catalogue().scopes_data
         self.paginator.paginate_queryset(scopes, self.request, view=self)
         response = self.paginator.get_paginated_response(scopes)
 
@@ -48,13 +68,76 @@ class ScopeListView(APIView):
         return self._paginator
 
 
+class ScopeCatalogue:
+    """
+    Full data of all OIDC and API scopes.
+
+    OIDC scopes are listed first and API scopes second, and both of those are ordered alphabetically by ID.
+    The catalogue is shared by the whole process and must not be modified.
+    """
+    def __init__(self, scopes_data):
+        self.scopes_data = scopes_data
+        self.etag = hashlib.sha256(json.dumps(scopes_data, sort_keys=True).encode('utf-8')).hexdigest()
+
+    @classmethod
+    def build(cls):
+        return cls(cls._get_oidc_scopes_data() + cls._get_api_scopes_data())
+
+    @classmethod
+    def _get_oidc_scopes_data(cls):
+        scopes_data = {}
+
+        for claim_cls in CombinedScopeClaims.combined_scope_claims:
+            for name in dir(claim_cls):
+                if name.startswith('info_'):
+                    scope_identifier = name.split('info_')[1]
+                    scopes_data[scope_identifier] = (claim_cls, name, {
+                        'id': scope_identifier,
+                        'name': {},
+                        'description': {},
+                    })
+
+        # The following loop produces scope name and description strings for every language
+        # listed in LANGUAGE_CODES regardless whether the string is translated or not. If
+        # translation is not found the string fallbacks to default language.
+        for language in LANGUAGE_CODES:
+            with translation.override(language):
+                for (claim_cls, name, result) in scopes_data.values():
+                    scope_data = getattr(claim_cls, name)
+                    result['name'][language] = str(scope_data[0])
+                    result['description'][language] = str(scope_data[1])
+
+        return [scopes_data[scope_identifier][2] for scope_identifier in sorted(scopes_data)]
+
+    @classmethod
+    def _get_api_scopes_data(cls):
+        api_scopes = ApiScope.objects.order_by('identifier').prefetch_related('translations')
+        return [dict(s) for s in ApiScopeSerializer(api_scopes, many=True).data]
+
+
+# The Suomi.fi scopes come from the access levels of the Suomi.fi metadata.
+scope_catalogue_snapshot = VersionedSnapshot(
+    'scope_catalogue', ScopeCatalogue.build, depends_on=[api_scope_registry_snapshot, suomifi_metadata_snapshot],
+)
+
+
+def get_scope_catalogue():
+    """
+    Get the scope catalogue of the current process.
+
+    The catalogue is rebuilt when the API scopes or the Suomi.fi access levels change.
+
+    :rtype: ScopeCatalogue
+    """
+    return scope_catalogue_snapshot.get()
+
+
 class ScopeDataBuilder:
     """
     A builder for scope data to be used in the API.
 
-    Implemented as a class to provide better control of caching. A ScopeDataBuilder instance caches
-    ApiScopes (which are in the db), so in practice there should be an own instance per request
-    to cope with possible modifications.
+    The data comes from the scope catalogue that is shared by the whole process. A ScopeDataBuilder
+    instance keeps the catalogue it first got, so the scopes stay consistent within one request.
     """
     def get_scopes_data(self, only=None):
         """
@@ -73,35 +156,4 @@ class ScopeDataBuilder:
 
     @cached_property
     def scopes_data(self):
-        return self._get_oidc_scopes_data() + self._get_api_scopes_data()
-
-    @classmethod
-    def _get_oidc_scopes_data(cls):
-        ret = []
-
-        for claim_cls in CombinedScopeClaims.combined_scope_claims:
-            for name in dir(claim_cls):
-                if name.startswith('info_'):
-                    scope_identifier = name.split('info_')[1]
-                    result = {
-                        'id': scope_identifier,
-                        'name': {},
-                        'description': {},
-                    }
-                    # The following loop produces scope name and description strings for every language
-                    # listed in LANGUAGE_CODES regardless whether the string is translated or not. If
-                    # translation is not found the string fallbacks to default language.
-                    initial_language = translation.get_language()
-                    for language in LANGUAGE_CODES:
-                        translation.activate(language)
-                        scope_data = getattr(claim_cls, name)
-                        result['name'][language] = str(scope_data[0])
-                        result['description'][language] = str(scope_data[1])
-                    translation.activate(initial_language)
-                    ret.append(result)
-            ret.sort(key=lambda x: x['id'])
-        return ret
-
-    @classmethod
-    def _get_api_scopes_data(cls):
-        return ApiScopeSerializer(ApiScope.objects.order_by('identifier'), many=True).data
+        return get_scope_catalogue().scopes_data
@@ -3,7 +3,10 @@ from parler.utils.context import switch_language
 from rest_framework.reverse import reverse
 from rest_framework.test import APIClient
 
+from auth_backends.models import SuomiFiAccessLevel
+from auth_backends.suomifi_metadata import get_suomifi_metadata
 from oidc_apis.factories import ApiDomainFactory, ApiFactory, ApiScopeFactory
+from scopes.api import get_scope_catalogue
 
 LIST_URL = reverse('v1:scope-list')
 
@@ -70,3 +73,58 @@ def test_get_also_api_scopes_list(api_client):
 
     assert foo_scope_data['name'] == {'en': foo_scope.name, 'fi': 'nimi'}
     assert foo_scope_data['description'] == {'en': foo_scope.description, 'fi': 'kuvaus'}
+
+
+def test_scope_list_is_not_queried_again(api_client, django_assert_num_queries):
+    ApiScopeFactory()
+    api_client.get(LIST_URL)
+
+    with django_assert_num_queries(0):
+        response = api_client.get(LIST_URL)
+
+    assert len(response.data['results']) == len(EXPECTED_OIDC_SCOPES) + 1
+
+
+def test_api_scope_translations_are_prefetched(api_client, django_assert_num_queries):
+    ApiScopeFactory.create_batch(5)
+    get_suomifi_metadata()
+
+    # The API scopes and their translations
+    with django_assert_num_queries(2):
+        response = api_client.get(LIST_URL)
+
+    assert len(response.data['results']) == len(EXPECTED_OIDC_SCOPES) + 5
+
+
+def test_scope_list_etag(api_client):
+    response = api_client.get(LIST_URL)
+    etag = response['ETag']
+
+    response = api_client.get(LIST_URL, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 304
+
+    response = api_client.get(LIST_URL, {'limit': 1}, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert response['ETag'] != etag
+
+    ApiScopeFactory()
+    response = api_client.get(LIST_URL, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert response['ETag'] != etag
+
+
+def test_scope_catalogue_follows_changes():
+    api_scope = ApiScopeFactory()
+    catalogue = get_scope_catalogue()
+    assert get_scope_catalogue() is catalogue
+
+    api_scope.name = 'new name'
+    api_scope.save()
+    api_scope_data = next(s for s in get_scope_catalogue().scopes_data if s['id'] == api_scope.identifier)
+    assert api_scope_data['name']['en'] == 'new name'
+
+    access_level = SuomiFiAccessLevel.objects.create(shorthand='basic', name='Basic', description='Basic data')
+    assert 'suomifi_basic' in {s['id'] for s in get_scope_catalogue().scopes_data}
+
+    access_level.delete()
+    assert 'suomifi_basic' not in {s['id'] for s in get_scope_catalogue().scopes_data}
@@ -59,7 +59,7 @@ class ServiceViewSet(viewsets.ReadOnlyModelViewSet):
     Return all services.
     """
     serializer_class = ServiceSerializer
-    queryset = Service.objects.all()
+    queryset = Service.objects.prefetch_related('translations')
     pagination_class = DefaultPagination
     filterset_class = ServiceFilter
     authentication_classes = (OidcTokenAuthentication,)
@@ -153,3 +153,14 @@ def test_oidc_authentication(service, scope, consent_given_visible):
     response = oidc_api_client.get(get_detail_url(service))
     assert response.status_code == 200
     assert bool('consent_given' in response.data) is consent_given_visible
+
+
+def test_list_translations_are_prefetched(api_client, django_assert_num_queries):
+    ServiceFactory.create_batch(5, target='client')
+
+    # The count, the services and their translations
+    with django_assert_num_queries(3):
+        response = api_client.get(LIST_URL)
+
+    assert len(response.data['results']) == 5
+    assert all(service_data['name'] for service_data in response.data['results'])
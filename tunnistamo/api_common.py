@@ -1,12 +1,13 @@
-import datetime
+import hashlib
 import json
 import logging
-from zoneinfo import ZoneInfo
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.core.exceptions import ImproperlyConfigured
-from jwcrypto import jwe, jwk, jwt
+from django.utils.timezone import now
+from jwcrypto import jwe, jwt
 from oidc_provider.lib.errors import BearerTokenError
 from oidc_provider.lib.utils.oauth2 import extract_access_token
 from oidc_provider.models import Token
@@ -15,10 +16,10 @@ from rest_framework.exceptions import AuthenticationFailed
 from rest_framework.permissions import SAFE_METHODS, BasePermission
 
 from devices.models import InterfaceDevice, UserDevice
+from tunnistamo.cache import is_cache_shared
 
 User = get_user_model()
 logger = logging.getLogger(__name__)
-local_tz = ZoneInfo(settings.TIME_ZONE)
 
 
 def parse_scope(scope):
@@ -78,36 +79,98 @@ def get_scope_specifiers(request, domain, perm):
 
 
 class TokenAuth:
-    def __init__(self, scopes, nonce=None):
+    def __init__(self, scopes, nonce=None, scope_domains=None):
         assert isinstance(scopes, (list, tuple, set))
         self.scopes = scopes
-        self.scope_domains = make_scope_domain_map(scopes)
+        self.scope_domains = scope_domains if scope_domains is not None else make_scope_domain_map(scopes)
         self.nonce = nonce
 
 
+def get_token_authentication_cache_key(prefix, token_value):
+    return '{}:{}'.format(prefix, hashlib.sha256(token_value.encode('utf-8')).hexdigest())
+
+
+def get_token_authentication_cache_timeout(expires_at):
+    """Return the seconds a validated token can be cached
+
+    The timeout is TOKEN_AUTHENTICATION_CACHE_TIMEOUT at most and never
+    exceeds the expiry of the token."""
+    seconds_left = int((expires_at - now()).total_seconds())
+    return max(min(settings.TOKEN_AUTHENTICATION_CACHE_TIMEOUT, seconds_left), 0)
+
+
+def _get_oidc_token_cache_key(access_token):
+    return get_token_authentication_cache_key('oidc_token_auth', access_token)
+
+
+def clear_cached_oidc_token_authentication(access_token):
+    cache.delete(_get_oidc_token_cache_key(access_token))
+
+
 class OidcTokenAuthentication(BaseAuthentication):
+    """Authenticate with an OIDC access token
+
+    Validated tokens are cached for a short while as a tuple of the user ID,
+    the expiry time, the scopes and the scope domains of the token if the
+    cache is shared by all of the processes. Unknown tokens are cached as
+    False. The cached tokens are cleared when the token is saved or deleted,
+    or when its Tunnistamo Session ends."""
     scopes_needed = ['openid']
 
+    def _query_token(self, access_token):
+        token = Token.objects.filter(access_token=access_token).first()
+        if token is None:
+            return False
+
+        scopes = tuple(token.scope)
+        return (token.user_id, token.expires_at, scopes, make_scope_domain_map(scopes))
+
+    def _load_token(self, access_token):
+        if not is_cache_shared():
+            return self._query_token(access_token)
+
+        cache_key = _get_oidc_token_cache_key(access_token)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        cached = self._query_token(access_token)
+        if not cached:
+            cache.set(cache_key, False, settings.TOKEN_AUTHENTICATION_NEGATIVE_CACHE_TIMEOUT)
+            return False
+
+        timeout = get_token_authentication_cache_timeout(cached[1])
+        if timeout:
+            cache.set(cache_key, cached, timeout)
+
+        return cached
+
     def authenticate(self, request):
         access_token = extract_access_token(request)
+        if not access_token:
+            return None
 
         try:
-            try:
-                token = Token.objects.get(access_token=access_token)
-            except Token.DoesNotExist:
+            cached = self._load_token(access_token)
+            if not cached:
                 logger.debug('[OidcToken] Token does not exist: %s', access_token)
                 return None
 
-            if token.has_expired():
+            (user_id, expires_at, scopes, scope_domains) = cached
+            if now() >= expires_at:
                 logger.warning('[OidcToken] Token has expired: %s', access_token)
                 raise BearerTokenError('invalid_token')
 
         except BearerTokenError as error:
             raise AuthenticationFailed(error.description)
 
-        auth = TokenAuth(token.scope)
+        user = User.objects.filter(pk=user_id).first()
+        if user is None:
+            return None
 
-        return (token.user, auth)
+        auth = TokenAuth(list(scopes), scope_domains=scope_domains)
+
+        return (user, auth)
 
     def authenticate_header(self, request):
         return "Bearer"
@@ -122,7 +185,9 @@ class DeviceGeneratedJWTAuthentication(BaseAuthentication):
             logger.debug('[DeviceJWT]: Probably not a JWE-encrypted token')
             return None
 
-        token = jwt.JWE()
+        # The JWE is parsed once. The header is read before decrypting because
+        # it tells which device's key to decrypt with.
+        token = jwe.JWE(algs=['A256KW', 'A128CBC-HS256'])
         try:
             token.deserialize(token_value)
         except (jwe.InvalidJWEData, ValueError, TypeError) as e:
@@ -137,27 +202,22 @@ class DeviceGeneratedJWTAuthentication(BaseAuthentication):
         except UserDevice.DoesNotExist:
             raise AuthenticationFailed("User device %s not registered" % user_device_id)
 
-        enc_key = jwk.JWK(**device.secret_key)
-        sign_key = jwk.JWK(**device.public_key)
+        enc_key = device.get_secret_jwk()
+        sign_key = device.get_public_jwk()
 
         try:
-            token = jwt.JWT(algs=['A256KW', 'A128CBC-HS256'])
-            token.deserialize(token_value, key=enc_key)
+            token.decrypt(enc_key)
             claims_token = jwt.JWT(algs=['ES256'])
-            claims_token.deserialize(token.claims, key=sign_key)
+            claims_token.deserialize(token.payload.decode('utf-8'), key=sign_key)
             claims = json.loads(claims_token.claims)
         except (jwe.InvalidJWEData, ValueError, TypeError) as e:
             logger.info('[DeviceJWT]: %s' % e)
             raise AuthenticationFailed("Invalid encryption key or signature")
 
         auth_counter = claims.get('cnt', None)
-        if not isinstance(auth_counter, int) or auth_counter <= device.auth_counter:
+        if not isinstance(auth_counter, int) or not device.advance_auth_counter(auth_counter):
             raise AuthenticationFailed("Invalid 'cnt' field")
 
-        device.auth_counter = auth_counter
-        device.last_used_at = datetime.datetime.now(tz=local_tz)
-        device.save(update_fields=('auth_counter', 'last_used_at'))
-
         interface_device_id = claims.get('azp', None)
         try:
             interface_device = InterfaceDevice.objects.get(id=interface_device_id)
@@ -0,0 +1,19 @@
+from django.conf import settings
+
+# Cache backends whose content is seen only by the process which stored it
+PROCESS_LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.dummy.DummyCache',
+    'django.core.cache.backends.locmem.LocMemCache',
+)
+
+
+def is_cache_shared():
+    """Return True if the default cache is shared by all of the processes
+
+    A value deleted from a shared cache is gone from every process, so it can
+    hold state which must be invalidated everywhere at once. The
+    CACHE_IS_SHARED setting overrides the detection by the cache backend."""
+    if settings.CACHE_IS_SHARED is not None:
+        return settings.CACHE_IS_SHARED
+
+    return settings.CACHES['default']['BACKEND'] not in PROCESS_LOCAL_CACHE_BACKENDS
@@ -7,25 +7,23 @@ from oidc_provider.lib.endpoints.token import TokenEndpoint
 from oidc_provider.lib.errors import AuthorizeError, TokenError, TokenIntrospectionError
 
 from oidc_apis.utils import get_authorize_endpoint_redirect_to_login_response
-from services.models import Service
 from tunnistamo.middleware import add_params_to_url
-from users.models import TunnistamoSession, UserLoginEntry
+from users.login_entries import add_user_login_entry, get_service_id_for_client
+from users.models import TunnistamoSession
 
 
-def _create_userloginentry_for_client(request, client):
-    try:
-        service = Service.objects.get(client=client)
-        UserLoginEntry.objects.create_from_request(request, service)
-    except Service.DoesNotExist:
-        pass
+def _create_userloginentry_for_client(request, client, user):
+    service_id = get_service_id_for_client(client)
+    if service_id is not None:
+        add_user_login_entry(request, service_id, user)
 
 
 class TunnistamoSessionEndpointMixin:
-    def _get_tunnistamo_session(self):
+    def _get_tunnistamo_session_snapshot(self):
         raise NotImplementedError('Implement in subclass')
 
     def is_tunnistamo_session_active(self):
-        tunnistamo_session = self._get_tunnistamo_session()
+        tunnistamo_session = self._get_tunnistamo_session_snapshot()
         if not tunnistamo_session or tunnistamo_session.has_ended():
             return False
 
@@ -59,6 +57,13 @@ class TunnistamoAuthorizeEndpoint(TunnistamoSessionEndpointMixin, AuthorizeEndpo
         except TunnistamoSession.DoesNotExist:
             return None
 
+    def _get_tunnistamo_session_snapshot(self):
+        tunnistamo_session_id = self.request.session.get("tunnistamo_session_id")
+        if not tunnistamo_session_id:
+            return None
+
+        return TunnistamoSession.objects.get_snapshot(tunnistamo_session_id)
+
     def validate_params(self):
         super().validate_params()
 
@@ -83,7 +88,7 @@ class TunnistamoAuthorizeEndpoint(TunnistamoSessionEndpointMixin, AuthorizeEndpo
             token.save()
             tunnistamo_session.add_element(token)
 
-        _create_userloginentry_for_client(self.request, token.client)
+        _create_userloginentry_for_client(self.request, token.client, token.user)
 
         return token
 
@@ -109,6 +114,12 @@ class TunnistamoTokenEndpoint(TunnistamoSessionEndpointMixin, TokenEndpoint):
         elif hasattr(self, 'token') and self.token:
             return TunnistamoSession.objects.get_by_element(self.token)
 
+    def _get_tunnistamo_session_snapshot(self):
+        if hasattr(self, 'code') and self.code:
+            return TunnistamoSession.objects.get_snapshot_by_element(self.code)
+        elif hasattr(self, 'token') and self.token:
+            return TunnistamoSession.objects.get_snapshot_by_element(self.token)
+
     def validate_params(self):
         super().validate_params()
 
@@ -123,7 +134,7 @@ class TunnistamoTokenEndpoint(TunnistamoSessionEndpointMixin, TokenEndpoint):
             token.save()
             tunnistamo_session.add_element(token)
 
-        _create_userloginentry_for_client(self.request, token.client)
+        _create_userloginentry_for_client(self.request, token.client, token.user)
 
         return token
 
@@ -151,9 +162,9 @@ class TunnistamoTokenEndpoint(TunnistamoSessionEndpointMixin, TokenEndpoint):
 
 
 class TunnistamoTokenIntrospectionEndpoint(TunnistamoSessionEndpointMixin, TokenIntrospectionEndpoint):
-    def _get_tunnistamo_session(self):
+    def _get_tunnistamo_session_snapshot(self):
         if hasattr(self, 'token') and self.token:
-            return TunnistamoSession.objects.get_by_element(self.token)
+            return TunnistamoSession.objects.get_snapshot_by_element(self.token)
 
     def validate_params(self):
         super().validate_params()
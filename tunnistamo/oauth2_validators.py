@@ -0,0 +1,86 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from oauth2_provider.models import get_access_token_model, get_application_model
+from oauth2_provider.oauth2_validators import OAuth2Validator
+
+from tunnistamo.api_common import get_token_authentication_cache_key, get_token_authentication_cache_timeout
+from tunnistamo.cache import is_cache_shared
+from tunnistamo.snapshots import VersionedSnapshot
+
+# The fields of an access token which are cached. They don't change during
+# the lifetime of the token, and the token is cleared from the cache whenever
+# it is saved or deleted anyway.
+CACHED_ACCESS_TOKEN_FIELDS = ('id', 'token', 'user_id', 'application_id', 'expires', 'scope')
+
+
+def _build_applications_by_id():
+    return {application.pk: application for application in get_application_model().objects.all()}
+
+
+applications_snapshot = VersionedSnapshot('oauth2_applications', _build_applications_by_id)
+
+
+def _get_oauth2_access_token_cache_key(token):
+    return get_token_authentication_cache_key('oauth2_token_auth', token)
+
+
+def clear_cached_oauth2_access_token(token):
+    cache.delete(_get_oauth2_access_token_cache_key(token))
+
+
+def _restore_access_token(fields):
+    """Create an access token from its cached fields
+
+    The user is loaded from the database and the application is taken from
+    the applications snapshot. Returns None if either of them no longer exists."""
+    access_token = get_access_token_model()(**fields)
+
+    if access_token.user_id is not None:
+        user = get_user_model().objects.filter(pk=access_token.user_id).first()
+        if user is None:
+            return None
+        access_token.user = user
+
+    if access_token.application_id is not None:
+        application = applications_snapshot.get().get(access_token.application_id)
+        if application is None:
+            return None
+        access_token.application = application
+
+    return access_token
+
+
+def _reject_inactive_user(access_token):
+    if access_token is not None and access_token.user is not None and not access_token.user.is_active:
+        return None
+    return access_token
+
+
+class TunnistamoOAuth2Validator(OAuth2Validator):
+    def _load_access_token(self, token):
+        """Load the access token with its application and user
+
+        The immutable fields of the loaded access tokens are cached for a short
+        while if the cache is shared by all of the processes. Unknown tokens are
+        cached as False. The cached tokens are cleared when the access token is
+        saved or deleted, e.g. revoked. The user is loaded for every request and
+        the tokens of inactive users are rejected."""
+        if not is_cache_shared():
+            return _reject_inactive_user(super()._load_access_token(token))
+
+        cache_key = _get_oauth2_access_token_cache_key(token)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return _reject_inactive_user(_restore_access_token(cached)) if cached else None
+
+        access_token = super()._load_access_token(token)
+        if access_token is None:
+            cache.set(cache_key, False, settings.TOKEN_AUTHENTICATION_NEGATIVE_CACHE_TIMEOUT)
+            return None
+
+        timeout = get_token_authentication_cache_timeout(access_token.expires)
+        if timeout:
+            cache.set(cache_key, {field: getattr(access_token, field) for field in CACHED_ACCESS_TOKEN_FIELDS}, timeout)
+
+        return _reject_inactive_user(access_token)
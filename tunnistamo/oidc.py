@@ -1,7 +1,7 @@
 import time
 import uuid
 
-from oidc_provider.lib.utils.token import encode_id_token
+from key_manager.signing_keys import sign_jwt
 
 
 def sub_generator(user):
@@ -48,7 +48,7 @@ def get_userinfo(claims, user):
     return claims
 
 
-def create_logout_token(oidc_client, iss, sub, sid=None):
+def create_logout_token(oidc_client, iss, sub, sid=None, alg=None):
     logout_token_dic = {
         'iss': iss,
         'sub': sub,
@@ -62,6 +62,6 @@ def create_logout_token(oidc_client, iss, sub, sid=None):
     if sid:
         logout_token_dic['sid'] = sid
 
-    logout_token = encode_id_token(logout_token_dic, oidc_client)
+    logout_token = sign_jwt(logout_token_dic, oidc_client, alg=alg)
 
     return logout_token
@@ -1,6 +1,64 @@
-from rest_framework.pagination import LimitOffsetPagination
+import coreapi
+import coreschema
+from rest_framework.pagination import CursorPagination, LimitOffsetPagination
 
 
 class DefaultPagination(LimitOffsetPagination):
     default_limit = 100
     max_limit = 1000
+
+
+class DefaultCursorPagination(CursorPagination):
+    cursor_query_param = 'cursor'
+    page_size = DefaultPagination.default_limit
+    page_size_query_param = DefaultPagination.limit_query_param
+    max_page_size = DefaultPagination.max_limit
+
+
+class OptionalCursorPagination(DefaultPagination):
+    """
+    Limit-offset pagination with an opt-in cursor mode.
+
+    The cursor mode is used when the request has the cursor query parameter, an empty value
+    returning the first page. Cursor pages are not counted and their next and previous links
+    stay stable when rows are added or deleted, and deep pages don't require an OFFSET scan.
+
+    The view must define cursor_pagination_ordering, which should be a nearly unique field
+    covered by an index. An OrderingFilter on the view takes precedence over it.
+    """
+    cursor_query_param = DefaultCursorPagination.cursor_query_param
+    cursor_paginator = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.cursor_query_param not in request.query_params:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.cursor_paginator = DefaultCursorPagination()
+        self.cursor_paginator.ordering = view.cursor_pagination_ordering
+        page = self.cursor_paginator.paginate_queryset(queryset, request, view)
+        self.display_page_controls = self.cursor_paginator.display_page_controls
+        return page
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def to_html(self):
+        if self.cursor_paginator:
+            return self.cursor_paginator.to_html()
+        return super().to_html()
+
+    def get_schema_fields(self, view):
+        fields = super().get_schema_fields(view)
+        fields.append(coreapi.Field(
+            name=self.cursor_query_param,
+            required=False,
+            location='query',
+            schema=coreschema.String(
+                title='Cursor',
+                description='The pagination cursor value. Give an empty value to use cursor pagination from '
+                            'the first page. Cursor pages are not counted.',
+            ),
+        ))
+        return fields
@@ -19,6 +19,7 @@ env = environ.Env(
     DEBUG=(bool, False),
     SECRET_KEY=(str, ""),
     DATABASE_URL=(str, "postgres:///tunnistamo"),
+    CACHE_URL=(str, "locmemcache://"),
     ALLOWED_HOSTS=(list, []),
     ALLOW_CROSS_SITE_SESSION_COOKIE=(bool, False),
     TRUST_X_FORWARDED_HOST=(bool, False),
@@ -44,6 +45,10 @@ env = environ.Env(
 
     ALWAYS_REAUTHENTICATE_BACKENDS=(list, []),
 
+    OIDC_APIS_BACKCHANNEL_LOGOUT_SEND_IMMEDIATELY=(bool, True),
+
+    KEY_MANAGER_EC_KEYS_ENABLED=(bool, False),
+
     # Authentication settings
     SOCIAL_AUTH_FACEBOOK_KEY=(str, ""),
     SOCIAL_AUTH_FACEBOOK_SECRET=(str, ""),
@@ -258,6 +263,20 @@ WSGI_APPLICATION = 'tunnistamo.wsgi.application'
 #
 DATABASES = {"default": env.db("DATABASE_URL")}
 
+CACHES = {"default": env.cache("CACHE_URL")}
+
+# Whether the default cache is shared by all of the processes, e.g. Redis or
+# Memcached. State which must change everywhere at once, such as ended
+# sessions and revoked tokens, is cached only in a shared cache. None detects
+# it from the cache backend: the local memory and the dummy caches are not
+# shared.
+CACHE_IS_SHARED = None
+
+# Seconds a process may use a stale snapshot of rarely changing database
+# content (e.g. the API scopes and the signing keys) when the cache is not
+# shared. With a shared cache the snapshots are refreshed right away.
+SNAPSHOT_LOCAL_CACHE_TIMEOUT = 60
+
 #
 # Internationalization
 #
@@ -371,6 +390,7 @@ CORS_URLS_REGEX = r'.*/(\.well-known/openid-configuration|v1|openid|api-tokens|j
 OAUTH2_PROVIDER_APPLICATION_MODEL = 'users.Application'
 OAUTH2_PROVIDER = {
     'CLIENT_SECRET_GENERATOR_LENGTH': 96,
+    'OAUTH2_VALIDATOR_CLASS': 'tunnistamo.oauth2_validators.TunnistamoOAuth2Validator',
 }
 
 REST_FRAMEWORK = {
@@ -410,11 +430,96 @@ OIDC_EXTRA_SCOPE_CLAIMS = 'oidc_apis.scopes.CombinedScopeClaims'
 OIDC_AFTER_USERLOGIN_HOOK = 'oidc_apis.utils.after_userlogin_hook'
 OIDC_IDTOKEN_PROCESSING_HOOK = 'oidc_apis.utils.additional_tunnistamo_id_token_claims'
 
+# Seconds a summary of a Tunnistamo Session is cached. The summary is used to
+# check that the session of an access token hasn't ended.
+TUNNISTAMO_SESSION_CACHE_TIMEOUT = 5 * 60
+
+# Seconds a validated bearer token is cached by the API authentication. The
+# token is never cached past its expiry. Unknown tokens are cached for the
+# negative timeout. The tokens are cached only in a cache shared by all of the
+# processes, so that a revoked token is rejected by every process at once.
+TOKEN_AUTHENTICATION_CACHE_TIMEOUT = 60
+TOKEN_AUTHENTICATION_NEGATIVE_CACHE_TIMEOUT = 5
+
+# Seconds a successfully verified secret of an interface device is cached
+INTERFACE_DEVICE_SECRET_CACHE_TIMEOUT = 5 * 60
+
+# Minimum seconds between updates of the last used time of a user device
+USER_DEVICE_LAST_USED_AT_INTERVAL = 60
+
+# Number of IP address locations cached per process and the seconds between
+# checks whether the GeoIP2 database file on GEOIP_PATH has changed
+GEOIP_CACHE_SIZE = 10000
+GEOIP_RELOAD_CHECK_INTERVAL = 60
+
+# Days the prune_expired_data management command keeps the rows after they
+# have expired or ended. The inactive Tunnistamo Sessions are the ones never
+# ended, counted from their creation or their newest element, and the session
+# elements are the ones whose token or other content object has been deleted.
+# None keeps the rows.
+#
+# Refresh tokens don't expire and stay usable as long as their token exists,
+# so setting oidc_tokens limits the lifetime of the refresh tokens to the
+# given days after their access token has expired.
+DATA_RETENTION_DAYS = {
+    'oidc_codes': 1,
+    'oidc_tokens': None,
+    'user_consents': 30,
+    'django_sessions': 0,
+    'tunnistamo_sessions': 30,
+    'inactive_tunnistamo_sessions': 365,
+    'session_elements': 1,
+    'user_login_entries': 2 * 365,
+}
+
+# User login entries are written to the database right away by default. With
+# a flush interval (in seconds) they are buffered in memory instead and written
+# in batches by a background thread at least once per flush interval.
+#
+# The buffered entries are written when the process exits normally, but the
+# entries of up to one flush interval (and batch) are lost if the process is
+# killed, e.g. by SIGKILL or by a worker timeout or recycling of the
+# application server. The buffered entries are also written independently of
+# the transaction of the login, so an entry may be written for a login whose
+# transaction was rolled back. Only set the flush interval if the login history
+# may lose entries.
+USER_LOGIN_ENTRY_BATCH_SIZE = 100
+USER_LOGIN_ENTRY_FLUSH_INTERVAL = None
+
+# Back-channel log outs sent to the APIs. The log out tokens are posted to the
+# APIs concurrently. The timeout applies to a single API and the total timeout
+# to all of the APIs of one log out together.
+OIDC_APIS_BACKCHANNEL_LOGOUT_TIMEOUT = 2
+OIDC_APIS_BACKCHANNEL_LOGOUT_TOTAL_TIMEOUT = 4
+OIDC_APIS_BACKCHANNEL_LOGOUT_MAX_WORKERS = 10
+
+# Log outs are stored in an outbox and sent by the send_backchannel_logouts
+# management command, which retries the failed ones with an exponential
+# backoff (in seconds) until they expire. Sending immediately also posts the
+# log outs once while the user is logging out, which makes the log out wait for
+# the APIs for up to the total timeout. Only disable it when the command is
+# kept running, as it is by the uWSGI configuration of the Docker image.
+OIDC_APIS_BACKCHANNEL_LOGOUT_SEND_IMMEDIATELY = env("OIDC_APIS_BACKCHANNEL_LOGOUT_SEND_IMMEDIATELY")
+OIDC_APIS_BACKCHANNEL_LOGOUT_RETRY_DELAY = 30
+OIDC_APIS_BACKCHANNEL_LOGOUT_MAX_RETRY_DELAY = 60 * 60
+OIDC_APIS_BACKCHANNEL_LOGOUT_EXPIRATION = 24 * 60 * 60
+OIDC_APIS_BACKCHANNEL_LOGOUT_MAX_PER_API = 5
+
+# Maximum number of threads signing the API tokens of one request. With one
+# thread the tokens are signed in the request thread. Whether the threads speed
+# up the signing depends on the CPUs and the crypto libraries, so measure the
+# API token endpoint with several APIs before raising this.
+OIDC_APIS_API_TOKEN_SIGNING_MAX_WORKERS = 1
+
 # key_manager settings for RSA Key
 KEY_MANAGER_RSA_KEY_LENGTH = 4096
 KEY_MANAGER_RSA_KEY_MAX_AGE = 3 * 30
 KEY_MANAGER_RSA_KEY_EXPIRATION_PERIOD = 7
 
+# key_manager settings for EC keys. The P-256 keys are rotated like the RSA
+# keys and allow signing the API and log out tokens with ES256.
+KEY_MANAGER_EC_KEYS_ENABLED = env("KEY_MANAGER_EC_KEYS_ENABLED")
+
 SASS_PROCESSOR_INCLUDE_DIRS = [
     env("NODE_MODULES_ROOT"),
 ]
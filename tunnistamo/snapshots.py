@@ -0,0 +1,94 @@
+import threading
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from tunnistamo.cache import is_cache_shared
+
+
+class VersionedSnapshot:
+    """Per-process snapshot of rarely changing database content
+
+    The snapshot is built lazily by calling the build function. The version
+    of the snapshot is kept in the cache and every process rebuilds its own
+    copy when it notices that the version has changed. If the cache is shared
+    by all of the processes, calling invalidate in one process therefore
+    refreshes the snapshot in all of them. A process-local cache only sees the
+    invalidations of its own process, so there the version expires after
+    SNAPSHOT_LOCAL_CACHE_TIMEOUT seconds and the other processes may use a
+    stale snapshot until then.
+
+    A snapshot that is built from other snapshots lists them in depends_on and
+    is rebuilt whenever any of them is invalidated.
+
+    The built value is shared by all threads of the process and must not be
+    modified."""
+
+    def __init__(self, name, build, depends_on=()):
+        self.name = name
+        self.build = build
+        self.depends_on = tuple(depends_on)
+        self._lock = threading.Lock()
+        self._snapshot = None
+
+    @property
+    def cache_key(self):
+        return 'snapshot_version:{}'.format(self.name)
+
+    def _get_current_version(self):
+        version = cache.get(self.cache_key)
+        if version is None:
+            cache.add(self.cache_key, uuid.uuid4().hex, _get_version_timeout())
+            version = cache.get(self.cache_key)
+
+        if version is None or not self.depends_on:
+            return version
+
+        versions = [version] + [snapshot._get_current_version() for snapshot in self.depends_on]
+        if None in versions:
+            return None
+
+        return ':'.join(versions)
+
+    def get(self):
+        version = self._get_current_version()
+        if version is None:
+            # The cache doesn't store anything (e.g. the dummy cache), so the
+            # version can't be tracked.
+            return self.build()
+
+        snapshot = self._snapshot
+        if snapshot is None or snapshot[0] != version:
+            with self._lock:
+                snapshot = self._snapshot
+                if snapshot is None or snapshot[0] != version:
+                    snapshot = (version, self.build())
+                    self._snapshot = snapshot
+
+        return snapshot[1]
+
+    def invalidate(self):
+        """Make every process rebuild the snapshot
+
+        The version is changed right away so that the current process sees its
+        own changes, and again after the transaction is committed because other
+        processes might have rebuilt the snapshot before the changes were
+        visible to them."""
+        self._bump_version()
+        transaction.on_commit(self._bump_version)
+
+    def discard(self):
+        """Make the current process rebuild the snapshot
+
+        For snapshots whose content depends on the time as well, since the
+        version changes only when the database content changes."""
+        self._snapshot = None
+
+    def _bump_version(self):
+        cache.set(self.cache_key, uuid.uuid4().hex, _get_version_timeout())
+
+
+def _get_version_timeout():
+    return None if is_cache_shared() else settings.SNAPSHOT_LOCAL_CACHE_TIMEOUT
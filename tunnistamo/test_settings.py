@@ -85,3 +85,6 @@ SOCIAL_AUTH_SUOMIFI_TECHNICAL_CONTACT = SOCIAL_AUTH_SUOMIFI_SUPPORT_CONTACT = {
 SOCIAL_AUTH_SUOMIFI_UI_LOGO = {'url': 'https://tunnistamo.test/logo.svg', 'height': '120', 'width': '240'}
 
 EMAIL_EXEMPT_AUTH_BACKENDS = ['suomifi']
+
+# The tests run in a single process
+CACHE_IS_SHARED = True
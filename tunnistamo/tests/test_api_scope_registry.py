@@ -0,0 +1,147 @@
+import time
+from unittest import mock
+
+import pytest
+from django.core.cache import cache
+from django.utils import translation
+
+from oidc_apis.factories import ApiDomainFactory, ApiFactory, ApiScopeFactory
+from oidc_apis.models import ApiScope
+from oidc_apis.registry import get_api_scope_registry
+from oidc_apis.scopes import ApiScopeClaims
+from tunnistamo.snapshots import VersionedSnapshot
+
+
+@pytest.mark.django_db
+def test_versioned_snapshot_is_rebuilt_when_invalidated():
+    builds = []
+
+    def build():
+        builds.append(None)
+        return len(builds)
+
+    snapshot = VersionedSnapshot('test', build)
+
+    assert snapshot.get() == 1
+    assert snapshot.get() == 1
+
+    snapshot.invalidate()
+
+    assert snapshot.get() == 2
+
+
+@pytest.mark.django_db
+def test_versioned_snapshot_is_rebuilt_when_version_changes_in_another_process():
+    builds = []
+
+    def build():
+        builds.append(None)
+        return len(builds)
+
+    snapshot = VersionedSnapshot('test', build)
+    other_process_snapshot = VersionedSnapshot('test', build)
+
+    assert snapshot.get() == 1
+    assert other_process_snapshot.get() == 2
+
+    other_process_snapshot.invalidate()
+
+    assert snapshot.get() == 3
+    cache.delete(snapshot.cache_key)
+    assert snapshot.get() == 4
+
+
+def test_versioned_snapshot_is_rebuilt_when_dependency_is_invalidated():
+    snapshot = VersionedSnapshot('test', object)
+    dependent_snapshot = VersionedSnapshot('dependent', object, depends_on=[snapshot])
+    built = dependent_snapshot.get()
+
+    assert dependent_snapshot.get() is built
+
+    snapshot._bump_version()
+
+    assert dependent_snapshot.get() is not built
+
+
+def test_versioned_snapshot_version_expires_when_cache_is_not_shared(settings):
+    settings.CACHE_IS_SHARED = False
+    settings.SNAPSHOT_LOCAL_CACHE_TIMEOUT = 60
+    snapshot = VersionedSnapshot('test', object)
+    built = snapshot.get()
+    current_time = time.time()
+
+    with mock.patch('time.time', return_value=current_time + 30):
+        assert snapshot.get() is built
+
+    with mock.patch('time.time', return_value=current_time + 61):
+        assert snapshot.get() is not built
+
+
+@pytest.mark.django_db
+def test_api_scope_registry_lookups(oidcclient_factory, django_assert_num_queries):
+    client = oidcclient_factory(redirect_uris=['https://example.com'])
+    other_client = oidcclient_factory(client_id='other', redirect_uris=['https://example.com'])
+    api = ApiFactory(required_scopes=['email', 'profile'])
+    api_scope = ApiScopeFactory(api=api)
+    api_scope.allowed_apps.set([client])
+    readonly_api_scope = ApiScopeFactory(api=api, specifier='readonly')
+
+    get_api_scope_registry()
+
+    with django_assert_num_queries(0):
+        registry = get_api_scope_registry()
+
+        assert registry.get(api_scope.identifier) == api_scope
+        assert registry.get('unknown') is None
+        assert registry.by_identifiers(
+            [readonly_api_scope.identifier, 'unknown', api_scope.identifier]
+        ) == [readonly_api_scope, api_scope]
+        assert registry.allowed_for_client([api_scope.identifier, readonly_api_scope.identifier], client) == [
+            api_scope
+        ]
+        assert registry.allowed_for_client([api_scope.identifier], other_client) == []
+        assert registry.get_required_scopes([api_scope.identifier]) == {'email', 'profile'}
+        assert registry.get(api_scope.identifier).api.domain == api.domain
+
+
+@pytest.mark.django_db
+def test_api_scope_registry_translations_follow_active_language():
+    api_scope = ApiScopeFactory(name='Nimi', description='Kuvaus')
+    api_scope.set_current_language('en')
+    api_scope.name = 'Name'
+    api_scope.description = 'Description'
+    api_scope.save()
+
+    with translation.override('fi'):
+        get_api_scope_registry()
+
+    with translation.override('en'):
+        assert ApiScopeClaims.get_scopes_info([api_scope.identifier]) == [
+            {'scope': api_scope.identifier, 'name': 'Name', 'description': 'Description'}
+        ]
+    with translation.override('fi'):
+        assert ApiScopeClaims.get_scopes_info([api_scope.identifier]) == [
+            {'scope': api_scope.identifier, 'name': 'Nimi', 'description': 'Kuvaus'}
+        ]
+
+
+@pytest.mark.django_db
+def test_api_scope_registry_is_rebuilt_when_api_scopes_change(oidcclient_factory):
+    client = oidcclient_factory(redirect_uris=['https://example.com'])
+    api_scope = ApiScopeFactory(api=ApiFactory(required_scopes=['email']))
+
+    assert get_api_scope_registry().allowed_for_client([api_scope.identifier], client) == []
+    assert ApiScope.extend_scope([api_scope.identifier]) == [api_scope.identifier, 'email']
+
+    api_scope.allowed_apps.add(client)
+    assert get_api_scope_registry().allowed_for_client([api_scope.identifier], client) == [api_scope]
+
+    api_scope.api.required_scopes = ['profile']
+    api_scope.api.save()
+    assert ApiScope.extend_scope([api_scope.identifier]) == [api_scope.identifier, 'profile']
+
+    other_api_scope = ApiScopeFactory(api=ApiFactory(domain=ApiDomainFactory(identifier='https://other.example.com')))
+    assert get_api_scope_registry().get(other_api_scope.identifier) == other_api_scope
+
+    other_api_scope.delete()
+    assert get_api_scope_registry().get(other_api_scope.identifier) is None
@@ -0,0 +1,143 @@
+from unittest import mock
+
+import jwt
+import pytest
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.test.client import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from jwcrypto.jwk import JWK
+from oidc_provider.lib.utils.token import create_id_token, create_token
+
+from key_manager.models import ManagedECKey
+from oidc_apis.api_tokens import (
+    _get_api_tokens_cache_key, _get_signing_executor, _sign_api_token, get_api_tokens_by_access_token
+)
+from oidc_apis.factories import ApiDomainFactory, ApiFactory, ApiScopeFactory
+from oidc_apis.models import ApiScope
+from tunnistamo.tests.conftest import create_oidc_clients_and_api, create_rsa_key
+
+
+def _create_access_token(user, api_count=1):
+    oidc_client = create_oidc_clients_and_api()
+    api_scope = ApiScope.objects.filter(allowed_apps=oidc_client).first()
+    scopes = ['openid', api_scope.identifier]
+
+    for i in range(2, api_count + 1):
+        other_api_scope = ApiScopeFactory(
+            api=ApiFactory(
+                name='test_api{}'.format(i),
+                domain=ApiDomainFactory(identifier='https://test_api{}.example.com'.format(i)),
+            )
+        )
+        other_api_scope.allowed_apps.set([oidc_client])
+        scopes.append(other_api_scope.identifier)
+
+    token = create_token(user, oidc_client, scopes)
+    token.save()
+
+    return token, api_scope
+
+
+@pytest.mark.django_db
+def test_api_tokens_are_cached(user):
+    token, api_scope = _create_access_token(user)
+
+    with mock.patch('oidc_apis.api_tokens._sign_api_token', side_effect=_sign_api_token) as mock_sign:
+        api_tokens = get_api_tokens_by_access_token(token, request=RequestFactory().get('/'))
+        assert get_api_tokens_by_access_token(token, request=RequestFactory().get('/')) == api_tokens
+
+    assert list(api_tokens.keys()) == [api_scope.api.identifier]
+    assert mock_sign.call_count == 1
+
+
+@pytest.mark.django_db
+def test_api_tokens_are_signed_again_when_signing_keys_change(user):
+    token, api_scope = _create_access_token(user)
+
+    with mock.patch('oidc_apis.api_tokens._sign_api_token', side_effect=_sign_api_token) as mock_sign:
+        get_api_tokens_by_access_token(token, request=RequestFactory().get('/'))
+        create_rsa_key()
+        get_api_tokens_by_access_token(token, request=RequestFactory().get('/'))
+
+    assert mock_sign.call_count == 2
+
+
+@pytest.mark.django_db
+def test_cached_api_tokens_are_removed_when_session_ends(user, tunnistamosession_factory):
+    token, api_scope = _create_access_token(user)
+    tunnistamo_session = tunnistamosession_factory(user=user)
+    tunnistamo_session.add_element(token)
+
+    get_api_tokens_by_access_token(token, request=RequestFactory().get('/'))
+    assert cache.get(_get_api_tokens_cache_key(token)) is not None
+
+    tunnistamo_session.end()
+
+    assert cache.get(_get_api_tokens_cache_key(token)) is None
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('max_workers', (1, 2))
+def test_api_tokens_of_several_apis_share_id_token_claims(settings, user, max_workers):
+    settings.OIDC_APIS_API_TOKEN_SIGNING_MAX_WORKERS = max_workers
+    token, api_scope = _create_access_token(user, api_count=3)
+
+    with mock.patch('oidc_apis.api_tokens.create_id_token', side_effect=create_id_token) as mock_create_id_token, \
+            mock.patch('oidc_apis.api_tokens._get_signing_executor', wraps=_get_signing_executor) as mock_executor:
+        api_tokens = get_api_tokens_by_access_token(token, request=RequestFactory().get('/'))
+
+    assert len(api_tokens) == 3
+    assert mock_create_id_token.call_count == 1
+    # The tokens are signed in the request thread unless more threads are allowed
+    assert mock_executor.called == (max_workers > 1)
+
+    for api_identifier, api_token in api_tokens.items():
+        claims = jwt.decode(api_token, options={'verify_signature': False})
+        assert claims['aud'] == api_identifier
+        assert claims['sub'] == str(user.uuid)
+
+
+@pytest.mark.django_db
+def test_api_token_generation_queries_do_not_grow_with_apis(user, django_assert_max_num_queries):
+    token, api_scope = _create_access_token(user, api_count=4)
+    request = RequestFactory().get('/')
+
+    one_api_token = create_token(user, token.client, ['openid', api_scope.identifier])
+    one_api_token.save()
+    with CaptureQueriesContext(connection) as one_api_queries:
+        get_api_tokens_by_access_token(one_api_token, request=request)
+
+    with django_assert_max_num_queries(len(one_api_queries)):
+        assert len(get_api_tokens_by_access_token(token, request=request)) == 4
+
+
+@pytest.mark.django_db
+def test_api_tokens_of_es256_api_are_signed_with_ec_key(user):
+    token, api_scope = _create_access_token(user)
+    eckey = ManagedECKey.objects.create(
+        key=JWK.generate(kty='EC', crv='P-256').export_to_pem(private_key=True, password=None).decode('utf8'),
+        created_at=timezone.now(),
+    )
+    api = api_scope.api
+    api.jwt_alg = 'ES256'
+    api.save()
+
+    api_token = get_api_tokens_by_access_token(token, request=RequestFactory().get('/'))[api.identifier]
+
+    assert jwt.get_unverified_header(api_token) == {'alg': 'ES256', 'kid': eckey.kid}
+    public_key = JWK.from_pem(eckey.key.encode('utf8')).export_to_pem()
+    claims = jwt.decode(api_token, public_key, algorithms=['ES256'], audience=api.identifier)
+    assert claims['sub'] == str(user.uuid)
+
+
+@pytest.mark.django_db
+def test_api_with_es256_requires_ec_keys():
+    api = ApiFactory()
+    api.jwt_alg = 'ES256'
+
+    with pytest.raises(ValidationError) as excinfo:
+        api.clean()
+    assert 'jwt_alg' in excinfo.value.message_dict
@@ -1,17 +1,26 @@
 import logging
+import threading
+import time
+from datetime import timedelta
+from io import StringIO
 from timeit import default_timer
+from unittest import mock
 
 import jwt
 import pytest
+from django.core.management import call_command
 from django.test import Client as DjangoTestClient
 from django.test.client import RequestFactory
 from django.urls import reverse
+from django.utils.timezone import now
 from httpretty import httprettified, httpretty
 from oidc_provider.lib.utils.token import create_token
 
-from oidc_apis.backchannel_logout import send_backchannel_logout_to_apis_in_token_scope
+from oidc_apis.backchannel_logout import (
+    claim_due_backchannel_logout_deliveries, queue_backchannel_logouts, send_backchannel_logout_to_apis_in_token_scope
+)
 from oidc_apis.factories import ApiDomainFactory, ApiFactory, ApiScopeFactory
-from oidc_apis.models import ApiScope
+from oidc_apis.models import ApiScope, BackchannelLogoutDelivery
 from tunnistamo.oidc import create_logout_token
 from tunnistamo.tests.conftest import create_oidc_clients_and_api, get_tokens, reload_social_django_utils
 from users.models import TunnistamoSession
@@ -48,6 +57,15 @@ def fix_httpretty_latest_requests_list(latest_requests):
     return result
 
 
+@pytest.fixture(autouse=True)
+def send_backchannel_logouts_one_at_a_time(settings):
+    """HTTPretty isn't thread safe
+
+    The requests it records get mixed up when the back-channel log outs are
+    sent concurrently."""
+    settings.OIDC_APIS_BACKCHANNEL_LOGOUT_MAX_WORKERS = 1
+
+
 def _check_logout_token(logout_token, client, user, sid=None):
     logout_token_decoded = jwt.decode(
         logout_token,
@@ -203,11 +221,334 @@ def test_send_backchannel_logout_to_apis_two_apis_in_scope(user):
     latest_requests = fix_httpretty_latest_requests_list(httpretty.latest_requests)
     assert len(latest_requests) == 2
 
-    requested_urls = {lr.url for lr in latest_requests}
-    assert requested_urls == {api_scope.api.backchannel_logout_url, api_scope2.api.backchannel_logout_url}
+    requests_by_url = {lr.url: lr for lr in latest_requests}
+    assert set(requests_by_url) == {api_scope.api.backchannel_logout_url, api_scope2.api.backchannel_logout_url}
 
-    _check_logout_token(latest_requests[0].parsed_body['logout_token'][0], api_scope.api.oidc_client, user)
-    _check_logout_token(latest_requests[1].parsed_body['logout_token'][0], api_scope2.api.oidc_client, user)
+    _check_logout_token(
+        requests_by_url[api_scope.api.backchannel_logout_url].parsed_body['logout_token'][0],
+        api_scope.api.oidc_client,
+        user,
+    )
+    _check_logout_token(
+        requests_by_url[api_scope2.api.backchannel_logout_url].parsed_body['logout_token'][0],
+        api_scope2.api.oidc_client,
+        user,
+    )
+
+
+@pytest.mark.django_db
+def test_send_backchannel_logout_should_post_to_apis_concurrently(settings, user):
+    settings.OIDC_APIS_BACKCHANNEL_LOGOUT_MAX_WORKERS = 2
+
+    oidc_client = create_oidc_clients_and_api()
+    api_scope = ApiScope.objects.filter(allowed_apps=oidc_client).first()
+    api_scope2 = ApiScopeFactory(
+        api=ApiFactory(
+            name='test_api2',
+            domain=ApiDomainFactory(identifier='https://test_api2.example.com'),
+            backchannel_logout_url='https://test_api2.example.com/backchannel_logout',
+        )
+    )
+    api_scope2.allowed_apps.set([oidc_client])
+    token = create_token(user, oidc_client, [api_scope.identifier, api_scope2.identifier])
+
+    # Both posts have to be in progress at the same time to pass the barrier
+    barrier = threading.Barrier(2, timeout=2)
+    posted_urls = []
+
+    def concurrent_post(url, logout_token):
+        barrier.wait()
+        posted_urls.append(url)
+        return 0.0
+
+    with mock.patch('oidc_apis.backchannel_logout._post_logout_token', side_effect=concurrent_post):
+        results = send_backchannel_logout_to_apis_in_token_scope(token, request=RequestFactory().get('/'))
+
+    assert [result.error for result in results] == [None, None]
+    assert set(posted_urls) == {api_scope.api.backchannel_logout_url, api_scope2.api.backchannel_logout_url}
+
+
+@pytest.mark.django_db
+def test_send_backchannel_logout_should_have_total_timeout(settings, user):
+    settings.OIDC_APIS_BACKCHANNEL_LOGOUT_TOTAL_TIMEOUT = 0.1
+
+    oidc_client = create_oidc_clients_and_api()
+    api_scope = ApiScope.objects.filter(allowed_apps=oidc_client).first()
+    token = create_token(user, oidc_client, [api_scope.identifier])
+
+    def slow_post(url, logout_token):
+        time.sleep(1)
+
+    with mock.patch('oidc_apis.backchannel_logout._post_logout_token', side_effect=slow_post):
+        start_time = default_timer()
+        results = send_backchannel_logout_to_apis_in_token_scope(token, request=RequestFactory().get('/'))
+        end_time = default_timer()
+
+    assert end_time - start_time < 1
+
+    assert len(results) == 1
+    assert results[0].api == api_scope.api
+    assert 'Total timeout' in results[0].error
+
+
+@pytest.mark.django_db
+@httprettified
+def test_send_backchannel_logout_reports_latency(user):
+    oidc_client = create_oidc_clients_and_api()
+    api_scope = ApiScope.objects.filter(allowed_apps=oidc_client).first()
+    token = create_token(user, oidc_client, [api_scope.identifier])
+
+    httpretty.register_uri(httpretty.POST, api_scope.api.backchannel_logout_url)
+
+    results = send_backchannel_logout_to_apis_in_token_scope(token, request=RequestFactory().get('/'))
+
+    assert len(results) == 1
+    assert results[0].api == api_scope.api
+    assert results[0].elapsed is not None
+    assert results[0].error is None
+
+
+@pytest.mark.django_db
+@httprettified
+def test_session_end_should_send_one_backchannel_logout_per_api(user, tunnistamosession_factory):
+    oidc_client = create_oidc_clients_and_api()
+    api_scope = ApiScope.objects.filter(allowed_apps=oidc_client).first()
+
+    tunnistamo_session = tunnistamosession_factory(user=user)
+    for i in range(2):
+        token = create_token(user, oidc_client, ['openid', api_scope.identifier])
+        token.save()
+        tunnistamo_session.add_element(token)
+
+    httpretty.register_uri(httpretty.POST, api_scope.api.backchannel_logout_url)
+
+    tunnistamo_session.end(send_logout_to_apis=True, request=RequestFactory().get('/'))
+
+    latest_requests = fix_httpretty_latest_requests_list(httpretty.latest_requests)
+    assert len(latest_requests) == 1
+
+    assert latest_requests[0].url == api_scope.api.backchannel_logout_url
+    _check_logout_token(
+        latest_requests[0].parsed_body['logout_token'][0],
+        api_scope.api.oidc_client,
+        user,
+        str(tunnistamo_session.id),
+    )
+
+
+def _create_session_with_api_token(user, tunnistamosession_factory):
+    oidc_client = create_oidc_clients_and_api()
+    api_scope = ApiScope.objects.filter(allowed_apps=oidc_client).first()
+
+    tunnistamo_session = tunnistamosession_factory(user=user)
+    token = create_token(user, oidc_client, ['openid', api_scope.identifier])
+    token.save()
+    tunnistamo_session.add_element(token)
+
+    return tunnistamo_session, api_scope.api
+
+
+@pytest.mark.django_db
+@httprettified
+def test_session_end_should_remove_delivered_backchannel_logout_from_outbox(user, tunnistamosession_factory):
+    tunnistamo_session, api = _create_session_with_api_token(user, tunnistamosession_factory)
+    httpretty.register_uri(httpretty.POST, api.backchannel_logout_url)
+
+    tunnistamo_session.end(send_logout_to_apis=True, request=RequestFactory().get('/'))
+
+    assert len(fix_httpretty_latest_requests_list(httpretty.latest_requests)) == 1
+    assert BackchannelLogoutDelivery.objects.count() == 0
+
+
+@pytest.mark.django_db
+@httprettified
+def test_session_end_should_leave_failed_backchannel_logout_in_outbox(user, tunnistamosession_factory):
+    tunnistamo_session, api = _create_session_with_api_token(user, tunnistamosession_factory)
+    httpretty.register_uri(httpretty.POST, api.backchannel_logout_url, status=503)
+
+    tunnistamo_session.end(send_logout_to_apis=True, request=RequestFactory().get('/'))
+
+    delivery = BackchannelLogoutDelivery.objects.get()
+    assert delivery.api == api
+    assert delivery.sub == str(user.uuid)
+    assert delivery.sid == str(tunnistamo_session.id)
+    assert delivery.attempts == 1
+    assert '503' in delivery.last_error
+    assert delivery.next_attempt_at > now()
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('claim', (False, True))
+def test_queued_backchannel_logouts_claimed_by_caller_should_not_be_claimed_by_workers(user, claim):
+    oidc_client = create_oidc_clients_and_api()
+    api = ApiScope.objects.filter(allowed_apps=oidc_client).first().api
+
+    queue_backchannel_logouts([api], RequestFactory().get('/'), sub=str(user.uuid), claim=claim)
+
+    assert len(claim_due_backchannel_logout_deliveries(10)) == (0 if claim else 1)
+
+
+@pytest.mark.django_db
+@httprettified
+def test_session_end_should_only_queue_backchannel_logout_when_not_sending_immediately(
+    settings, user, tunnistamosession_factory
+):
+    settings.OIDC_APIS_BACKCHANNEL_LOGOUT_SEND_IMMEDIATELY = False
+    tunnistamo_session, api = _create_session_with_api_token(user, tunnistamosession_factory)
+    httpretty.register_uri(httpretty.POST, api.backchannel_logout_url)
+
+    tunnistamo_session.end(send_logout_to_apis=True, request=RequestFactory().get('/'))
+
+    assert len(httpretty.latest_requests) == 0
+    assert BackchannelLogoutDelivery.objects.count() == 1
+
+    call_command('send_backchannel_logouts', stdout=StringIO())
+
+    latest_requests = fix_httpretty_latest_requests_list(httpretty.latest_requests)
+    assert len(latest_requests) == 1
+    _check_logout_token(
+        latest_requests[0].parsed_body['logout_token'][0],
+        api.oidc_client,
+        user,
+        str(tunnistamo_session.id),
+    )
+    assert BackchannelLogoutDelivery.objects.count() == 0
+
+
+@pytest.mark.django_db
+@httprettified
+def test_send_backchannel_logouts_command_should_retry_failed_logout_with_backoff(
+    settings, user, tunnistamosession_factory
+):
+    settings.OIDC_APIS_BACKCHANNEL_LOGOUT_RETRY_DELAY = 10
+    tunnistamo_session, api = _create_session_with_api_token(user, tunnistamosession_factory)
+    httpretty.register_uri(httpretty.POST, api.backchannel_logout_url, status=503)
+
+    tunnistamo_session.end(send_logout_to_apis=True, request=RequestFactory().get('/'))
+    delivery = BackchannelLogoutDelivery.objects.get()
+    assert delivery.attempts == 1
+
+    # Not due yet
+    call_command('send_backchannel_logouts', stdout=StringIO())
+    delivery.refresh_from_db()
+    assert delivery.attempts == 1
+
+    BackchannelLogoutDelivery.objects.update(next_attempt_at=now())
+    call_command('send_backchannel_logouts', stdout=StringIO())
+    delivery.refresh_from_db()
+    assert delivery.attempts == 2
+    assert delivery.next_attempt_at - now() > timedelta(seconds=15)
+
+    httpretty.register_uri(httpretty.POST, api.backchannel_logout_url, status=200)
+    BackchannelLogoutDelivery.objects.update(next_attempt_at=now())
+    call_command('send_backchannel_logouts', stdout=StringIO())
+    assert BackchannelLogoutDelivery.objects.count() == 0
+
+
+@pytest.mark.django_db
+@httprettified
+def test_send_backchannel_logouts_command_should_discard_expired_logouts(
+    settings, user, tunnistamosession_factory
+):
+    settings.OIDC_APIS_BACKCHANNEL_LOGOUT_SEND_IMMEDIATELY = False
+    tunnistamo_session, api = _create_session_with_api_token(user, tunnistamosession_factory)
+    httpretty.register_uri(httpretty.POST, api.backchannel_logout_url)
+
+    tunnistamo_session.end(send_logout_to_apis=True, request=RequestFactory().get('/'))
+    BackchannelLogoutDelivery.objects.update(expires_at=now())
+
+    call_command('send_backchannel_logouts', stdout=StringIO())
+
+    assert len(httpretty.latest_requests) == 0
+    assert BackchannelLogoutDelivery.objects.count() == 0
+
+
+class StopWorker(Exception):
+    pass
+
+
+@pytest.mark.django_db
+@httprettified
+def test_send_backchannel_logouts_worker_should_retry_logout_failed_during_session_end(
+    user, tunnistamosession_factory
+):
+    tunnistamo_session, api = _create_session_with_api_token(user, tunnistamosession_factory)
+    httpretty.register_uri(httpretty.POST, api.backchannel_logout_url, responses=[
+        httpretty.Response(body='', status=503),
+        httpretty.Response(body='', status=200),
+    ])
+
+    tunnistamo_session.end(send_logout_to_apis=True, request=RequestFactory().get('/'))
+    assert BackchannelLogoutDelivery.objects.get().attempts == 1
+
+    BackchannelLogoutDelivery.objects.update(next_attempt_at=now())
+    # The worker runs until its first sleep between the loops
+    with mock.patch(
+        'oidc_apis.management.commands.send_backchannel_logouts.time.sleep', side_effect=StopWorker,
+    ), pytest.raises(StopWorker):
+        call_command('send_backchannel_logouts', loop=True, stdout=StringIO())
+
+    latest_requests = fix_httpretty_latest_requests_list(httpretty.latest_requests)
+    assert len(latest_requests) == 2
+    _check_logout_token(
+        latest_requests[1].parsed_body['logout_token'][0],
+        api.oidc_client,
+        user,
+        str(tunnistamo_session.id),
+    )
+    assert BackchannelLogoutDelivery.objects.count() == 0
+
+
+@pytest.mark.django_db
+def test_claim_due_backchannel_logout_deliveries_should_limit_deliveries_per_api(settings):
+    settings.OIDC_APIS_BACKCHANNEL_LOGOUT_MAX_PER_API = 2
+    api = ApiFactory(backchannel_logout_url='https://api.example.com/backchannel_logout')
+    for i in range(3):
+        BackchannelLogoutDelivery.objects.create(
+            api=api, iss='iss', sub='sub{}'.format(i), expires_at=now() + timedelta(hours=1),
+        )
+
+    assert len(claim_due_backchannel_logout_deliveries(batch_size=10)) == 2
+    assert len(claim_due_backchannel_logout_deliveries(batch_size=10)) == 1
+    assert len(claim_due_backchannel_logout_deliveries(batch_size=10)) == 0
+
+
+@pytest.mark.django_db
+@httprettified
+def test_send_backchannel_logouts_command_should_fail_only_logout_which_cannot_be_signed(rsa_key, user):
+    api = ApiFactory(backchannel_logout_url='https://api.example.com/backchannel_logout')
+    es256_api = ApiFactory(
+        domain=ApiDomainFactory(identifier='https://es256.example.com'),
+        backchannel_logout_url='https://es256.example.com/backchannel_logout',
+    )
+    # There are no EC keys, e.g. because they were removed after the API was saved
+    type(es256_api).objects.filter(pk=es256_api.pk).update(jwt_alg='ES256')
+    es256_api.refresh_from_db()
+    httpretty.register_uri(httpretty.POST, api.backchannel_logout_url)
+    queue_backchannel_logouts([api, es256_api], RequestFactory().get('/'), sub=str(user.uuid))
+
+    call_command('send_backchannel_logouts', stdout=StringIO())
+
+    assert len(fix_httpretty_latest_requests_list(httpretty.latest_requests)) == 1
+    delivery = BackchannelLogoutDelivery.objects.get()
+    assert delivery.api == es256_api
+    assert delivery.attempts == 1
+    assert 'EC Key' in delivery.last_error
+
+
+@pytest.mark.parametrize('attempts,expected_delay', [
+    (1, 30),
+    (2, 60),
+    (3, 120),
+    (20, 3600),
+])
+def test_backchannel_logout_delivery_retry_delay_should_grow_exponentially(settings, attempts, expected_delay):
+    settings.OIDC_APIS_BACKCHANNEL_LOGOUT_RETRY_DELAY = 30
+    settings.OIDC_APIS_BACKCHANNEL_LOGOUT_MAX_RETRY_DELAY = 3600
+
+    delivery = BackchannelLogoutDelivery(attempts=attempts)
+
+    assert delivery.get_retry_delay() == timedelta(seconds=expected_delay)
 
 
 @pytest.mark.django_db
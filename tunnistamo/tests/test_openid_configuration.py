@@ -1,5 +1,8 @@
 import pytest
 from django.urls import reverse
+from oidc_provider.models import ResponseType
+
+from tunnistamo.tests.conftest import create_rsa_key
 
 
 @pytest.mark.django_db
@@ -11,3 +14,50 @@ def test_openid_configuration_is_consistent_between_paths(client):
     oidc_provider_config = client.get(oidc_provider_config_url).json()
 
     assert root_config == oidc_provider_config
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('url', ['/.well-known/openid-configuration', '/openid/jwks'])
+def test_public_documents_are_answered_conditionally(client, rsa_key, url):
+    response = client.get(url)
+
+    assert response.status_code == 200
+    assert response['Cache-Control'] == 'public, max-age=3600'
+    etag = response['ETag']
+    assert etag.startswith('"')
+
+    response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    assert response.status_code == 304
+    assert response.content == b''
+
+
+@pytest.mark.django_db
+def test_jwks_etag_changes_when_keys_are_rotated(client, rsa_key):
+    etag = client.get('/openid/jwks')['ETag']
+
+    create_rsa_key()
+
+    response = client.get('/openid/jwks', HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert response['ETag'] != etag
+    assert len(response.json()['keys']) == 2
+
+
+@pytest.mark.django_db
+def test_openid_configuration_is_rendered_once(client, django_assert_num_queries):
+    config = client.get('/.well-known/openid-configuration').json()
+    assert config['backchannel_logout_supported'] is True
+
+    with django_assert_num_queries(0):
+        assert client.get('/.well-known/openid-configuration').json() == config
+
+
+@pytest.mark.django_db
+def test_openid_configuration_follows_response_types(client):
+    config = client.get('/.well-known/openid-configuration').json()
+
+    ResponseType.objects.create(value='code token id_token', description='Test')
+
+    response_types = client.get('/.well-known/openid-configuration').json()['response_types_supported']
+    assert set(response_types) == set(config['response_types_supported']) | {'code token id_token'}
@@ -1,12 +1,21 @@
+from datetime import timedelta
+
 import jwt
 import pytest
 from django.test.client import Client as TestClient
+from django.utils.timezone import now
+from oidc_provider.models import Token
+from social_django.models import UserSocialAuth
 
+from auth_backends.models import SuomiFiAccessLevel
+from auth_backends.suomifi_metadata import get_suomifi_metadata
 from oidc_apis.models import ApiScope
+from oidc_apis.scopes import CombinedScopeClaims
 from tunnistamo.tests.conftest import (
     DummyFixedOidcBackend, create_oidc_clients_and_api, get_api_tokens, get_tokens, get_userinfo, refresh_token,
     social_login
 )
+from users.factories import OIDCClientFactory
 
 
 def _get_access_and_id_tokens(settings, oidc_client, response_type, trust_loa=True):
@@ -159,3 +168,65 @@ def test_claims_not_in_userinfo(settings, response_type):
     assert 'azp' not in userinfo
     assert 'amr' not in userinfo
     assert 'sid' not in userinfo
+
+
+def _create_token_with_scopes(user, scopes):
+    oidc_client = OIDCClientFactory(scope=scopes)
+    token = Token.objects.create(
+        user=user,
+        client=oidc_client,
+        expires_at=now() + timedelta(hours=1),
+        access_token='test_access_token',
+        refresh_token='test_refresh_token',
+    )
+    token.scope = scopes
+    token.save()
+    return Token.objects.select_related('user', 'client').get(pk=token.pk)
+
+
+@pytest.fixture
+def user_with_social_auths_and_ad_groups(user):
+    UserSocialAuth.objects.create(user=user, provider='github', uid='github_uid', extra_data={'login': 'octocat'})
+    UserSocialAuth.objects.create(user=user, provider='suomifi', uid='suomifi_uid', extra_data={
+        'suomifi_attributes': {'cn': 'Testi Teppo', 'nationalIdentificationNumber': '010101-0101'},
+    })
+    user.update_ad_groups(['group_1', 'group_2'])
+    return user
+
+
+@pytest.fixture
+def suomifi_access_level():
+    level = SuomiFiAccessLevel.objects.create(shorthand='basic', name='Basic')
+    for friendly_name in ['cn', 'nationalIdentificationNumber']:
+        level.attributes.create(friendly_name=friendly_name, uri=friendly_name, name=friendly_name)
+    # The access levels are read from the Suomi.fi metadata snapshot
+    get_suomifi_metadata()
+    return level
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('scopes,expected_claims,expected_queries', [
+    (['openid', 'profile', 'email'], set(), 0),
+    (['openid', 'github_username'], {'github_username'}, 1),
+    (['openid', 'ad_groups'], {'ad_groups'}, 1),
+    (['openid', 'github_username', 'ad_groups'], {'github_username', 'ad_groups'}, 2),
+    (['openid', 'suomifi_basic'], {'suomifi_basic'}, 1),
+    (['openid', 'profile', 'github_username', 'ad_groups', 'suomifi_basic'],
+     {'github_username', 'ad_groups', 'suomifi_basic'}, 2),
+])
+def test_combined_scope_claims_queries(
+    user_with_social_auths_and_ad_groups, suomifi_access_level, django_assert_num_queries,
+    scopes, expected_claims, expected_queries
+):
+    token = _create_token_with_scopes(user_with_social_auths_and_ad_groups, scopes)
+
+    with django_assert_num_queries(expected_queries):
+        claims = CombinedScopeClaims(token).create_response_dic()
+
+    assert {'github_username', 'ad_groups', 'suomifi_basic'} & set(claims) == expected_claims
+    if 'github_username' in expected_claims:
+        assert claims['github_username'] == 'octocat'
+    if 'ad_groups' in expected_claims:
+        assert sorted(claims['ad_groups']) == ['group_1', 'group_2']
+    if 'suomifi_basic' in expected_claims:
+        assert claims['suomifi_basic'] == {'cn': 'Testi Teppo', 'nationalIdentificationNumber': '010101-0101'}
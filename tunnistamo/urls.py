@@ -23,8 +23,9 @@ from services.views import ReportView
 from tunnistamo import social_auth_urls
 from users.api import TunnistamoAuthorizationView, UserConsentViewSet, UserLoginEntryViewSet
 from users.views import (
-    AuthoritativeLogoutRedirectView, LoginView, TunnistamoOidcAuthorizeView, TunnistamoOidcEndSessionView,
-    TunnistamoOidcProviderInfoView, TunnistamoOidcTokenView, TunnistamoTokenIntrospectionView, userinfo
+    AuthoritativeLogoutRedirectView, LoginView, TunnistamoJwksView, TunnistamoOidcAuthorizeView,
+    TunnistamoOidcEndSessionView, TunnistamoOidcProviderInfoView, TunnistamoOidcTokenView,
+    TunnistamoTokenIntrospectionView, userinfo
 )
 
 from .api import GetJWTView, UserView
@@ -80,6 +81,8 @@ urlpatterns = [
     re_path(r'^openid/token/?$', csrf_exempt(TunnistamoOidcTokenView.as_view()), name='token'),
     re_path(r'^openid/userinfo/?$', csrf_exempt(userinfo), name='userinfo'),
     re_path(r'^openid/introspect/?$', TunnistamoTokenIntrospectionView.as_view(), name='token-introspection'),
+    # Shadows the jwks path in the oidc_provider.urls to publish also the EC keys
+    re_path(r'^openid/jwks/?$', TunnistamoJwksView.as_view(), name='jwks'),
     # This should shadow the openid-configuration path in the oidc_provider.urls so that
     # the same TunnistamoOidcProviderInfoView is used in both root, and openid paths.
     re_path(r'^openid/\.well-known/openid-configuration/?$', TunnistamoOidcProviderInfoView.as_view()),
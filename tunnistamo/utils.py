@@ -1,6 +1,8 @@
 from collections import OrderedDict
+from types import MappingProxyType
 
 from django.conf import settings
+from django.utils.translation import get_language
 from django.utils.translation import gettext_lazy as _
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
@@ -15,16 +17,32 @@ class TranslatableSerializer(serializers.Serializer):
     by defining translation_lang in the Meta class.
     """
 
-    def __init__(self, *args, **kwargs):
-        self.Meta.translated_fields = [
-            field for field in self.Meta.model._parler_meta._fields_to_model if field in self.Meta.fields
-        ]
-        non_translated_fields = [field for field in self.Meta.fields if field not in self.Meta.translated_fields]
-        self.Meta.fields = non_translated_fields
-        super(TranslatableSerializer, self).__init__(*args, **kwargs)
-        self.Meta.fields = non_translated_fields + self.Meta.translated_fields
-        if not hasattr(self.Meta, 'translation_lang'):
-            self.Meta.translation_lang = [lang['code'] for lang in settings.PARLER_LANGUAGES[settings.SITE_ID]]
+    @classmethod
+    def get_translation_options(cls):
+        """
+        Return the translated fields and the translation languages of the serializer class.
+
+        They are resolved once per class instead of modifying the Meta class for every instance.
+        """
+        options = cls.__dict__.get('_translation_options')
+        if options is None:
+            translated_fields = tuple(
+                field for field in cls.Meta.model._parler_meta._fields_to_model if field in cls.Meta.fields
+            )
+            translation_lang = getattr(cls.Meta, 'translation_lang', None)
+            if translation_lang is None:
+                translation_lang = [lang['code'] for lang in settings.PARLER_LANGUAGES[settings.SITE_ID]]
+            options = (translated_fields, tuple(translation_lang))
+            cls._translation_options = options
+        return options
+
+    @property
+    def translated_fields(self):
+        return self.get_translation_options()[0]
+
+    @property
+    def translation_lang(self):
+        return self.get_translation_options()[1]
 
     def _update_lang(self, ret, field, value, lang_code):
         if not ret.get(field) or isinstance(ret[field], str):
@@ -35,25 +53,37 @@ class TranslatableSerializer(serializers.Serializer):
 
     def to_representation(self, instance):
         ret = super(TranslatableSerializer, self).to_representation(instance)
-        translations = instance.translations.filter(language_code__in=self.Meta.translation_lang)
 
-        for translation in translations:
-            for field in self.Meta.translated_fields:
+        for translation in self.get_translations(instance):
+            for field in self.translated_fields:
                 self._update_lang(ret, field, getattr(translation, field), translation.language_code)
         return ret
 
+    def get_translations(self, instance):
+        """
+        Return the translations of the instance in the translation languages.
+
+        Translations prefetched with prefetch_related('translations') are used without a query.
+        """
+        if 'translations' in getattr(instance, '_prefetched_objects_cache', {}):
+            return [
+                translation for translation in instance.translations.all()
+                if translation.language_code in self.translation_lang
+            ]
+        return instance.translations.filter(language_code__in=self.translation_lang)
+
     def _validate_translated_field(self, field, data):
-        assert field in self.Meta.translated_fields, '%s is not a translated field' % field
+        assert field in self.translated_fields, '%s is not a translated field' % field
         if data is None:
             return
         if not isinstance(data, dict):
             raise ValidationError(_('Not a valid translation format. Expecting {"lang_code": %(data)s}' %
                                     {'data': data}))
         for lang in data:
-            if lang not in self.Meta.translation_lang:
+            if lang not in self.translation_lang:
                 raise ValidationError(_('%(lang)s is not a supported language (%(allowed)s)' % {
                     'lang': lang,
-                    'allowed': self.Meta.translation_lang,
+                    'allowed': self.translation_lang,
                 }))
 
     def validate(self, data):
@@ -62,7 +92,7 @@ class TranslatableSerializer(serializers.Serializer):
         """
         validated_data = super().validate(data)
         errors = OrderedDict()
-        for field in self.Meta.translated_fields:
+        for field in self.translated_fields:
             try:
                 self._validate_translated_field(field, data.get(field, None))
             except ValidationError as e:
@@ -75,7 +105,7 @@ class TranslatableSerializer(serializers.Serializer):
 
     def to_internal_value(self, value):
         ret = super(TranslatableSerializer, self).to_internal_value(value)
-        for field in self.Meta.translated_fields:
+        for field in self.translated_fields:
             v = value.get(field)
             if v:
                 ret[field] = v
@@ -88,7 +118,7 @@ class TranslatableSerializer(serializers.Serializer):
         translated_data = self._pop_translated_data()
         if not self.instance:
             # forces the translation to be created, since the object cannot be saved without
-            self.validated_data[self.Meta.translated_fields[0]] = ''
+            self.validated_data[self.translated_fields[0]] = ''
         instance = super(TranslatableSerializer, self).save(**kwargs)
         self.save_translations(instance, translated_data)
         instance.save()
@@ -99,7 +129,7 @@ class TranslatableSerializer(serializers.Serializer):
         Separate data of translated fields from other data.
         """
         translated_data = {}
-        for meta in self.Meta.translated_fields:
+        for meta in self.translated_fields:
             translations = self.validated_data.pop(meta, {})
             if translations:
                 translated_data[meta] = translations
@@ -109,10 +139,10 @@ class TranslatableSerializer(serializers.Serializer):
         """
         Save translation data into translation objects.
         """
-        for field in self.Meta.translated_fields:
+        for field in self.translated_fields:
             translations = {}
             if not self.partial:
-                translations = {lang_code: '' for lang_code in self.Meta.translation_lang}
+                translations = {lang_code: '' for lang_code in self.translation_lang}
             translations.update(translated_data.get(field, {}))
 
             for lang_code, value in translations.items():
@@ -121,5 +151,32 @@ class TranslatableSerializer(serializers.Serializer):
         instance.save_translations()
 
 
+def get_translations(instance, field):
+    """
+    Get the values of a translated field of a parler model in every language.
+
+    The values can be stored in objects shared by the whole process, unlike the
+    instance whose translated fields return the language active when it was loaded.
+
+    :rtype: Mapping[str, str]
+    """
+    return MappingProxyType({
+        language: instance.safe_translation_getter(field, language_code=language)
+        for (language, language_name) in settings.LANGUAGES
+    })
+
+
+def get_translation(translations):
+    """
+    Get the value in the active language from the values of get_translations.
+
+    Falls back to the default language.
+    """
+    language = get_language()
+    if language in translations:
+        return translations[language]
+    return translations.get(settings.LANGUAGE_CODE)
+
+
 def assert_objects_in_response(response, objects):
     assert {r['id'] for r in response.data['results']} == {o.id for o in objects}
@@ -4,7 +4,6 @@ import coreapi
 import coreschema
 from django.contrib.auth import logout as django_user_logout
 from django.contrib.auth.mixins import UserPassesTestMixin
-from oauth2_provider.models import get_application_model
 from oauth2_provider.views import AuthorizationView
 from oidc_provider.models import UserConsent
 from rest_framework import filters, mixins, serializers, viewsets
@@ -13,7 +12,8 @@ from rest_framework.schemas import AutoSchema
 
 from scopes.api import ScopeDataBuilder
 from tunnistamo.api_common import OidcTokenAuthentication, ScopePermission
-from tunnistamo.pagination import DefaultPagination
+from tunnistamo.pagination import OptionalCursorPagination
+from users.login_configuration import get_application_login_configuration
 from users.models import UserLoginEntry
 
 logger = logging.getLogger(__name__)
@@ -34,7 +34,8 @@ class UserLoginEntryViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
     """
     serializer_class = UserLoginEntrySerializer
     queryset = UserLoginEntry.objects.all()
-    pagination_class = DefaultPagination
+    pagination_class = OptionalCursorPagination
+    cursor_pagination_ordering = 'timestamp'
     authentication_classes = (OidcTokenAuthentication,)
     permission_classes = (IsAuthenticated, ScopePermission)
     required_scopes = ('login_entries',)
@@ -100,7 +101,8 @@ class UserConsentViewSet(mixins.ListModelMixin, mixins.RetrieveModelMixin, mixin
     """
     serializer_class = UserConsentSerializer
     queryset = UserConsent.objects.select_related('client__service')
-    pagination_class = DefaultPagination
+    pagination_class = OptionalCursorPagination
+    cursor_pagination_ordering = 'id'
     authentication_classes = (OidcTokenAuthentication,)
     permission_classes = (IsAuthenticated, ScopePermission)
     required_scopes = ('consents',)
@@ -122,26 +124,18 @@ class TunnistamoAuthorizationView(AuthorizationView, UserPassesTestMixin):
     def test_func(self):
         request = self.request
         client_id = request.GET.get('client_id', request.POST.get('client_id', None))
-        Application = get_application_model()
         user = request.user
         if user.is_authenticated:
             last_login_backend = request.session.get('social_auth_last_login_backend')
-            try:
-                application = Application.objects.get(client_id=client_id)
-            except Application.DoesNotExist:
+            login_configuration = get_application_login_configuration(client_id)
+            if login_configuration is None:
                 logger.info("Application with id '{}' does not exist".format(client_id))
                 return False
 
-            allowed_methods = application.login_methods.all()
-            if allowed_methods is None:
-                return False
-
-            allowed_providers = set((x.provider_id for x in allowed_methods))
-            if last_login_backend is not None:
-                active_backend = user.social_auth.filter(provider=last_login_backend)
-
+            allowed_providers = login_configuration.allowed_provider_ids
             if ((last_login_backend is None and user is not None)
-                    or (active_backend.exists() and active_backend.first().provider not in allowed_providers)):
+                    or (last_login_backend not in allowed_providers
+                        and user.social_auth.filter(provider=last_login_backend).exists())):
                 django_user_logout(request)
                 return False
 
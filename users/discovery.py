@@ -0,0 +1,56 @@
+import hashlib
+import threading
+
+from django.http import HttpResponse
+from django.utils.cache import patch_cache_control
+
+from key_manager import settings as key_manager_settings
+from tunnistamo.snapshots import VersionedSnapshot
+
+
+class RenderedDocuments(object):
+    """
+    JSON documents rendered once per site URL.
+
+    The site URL comes from the SITE_URL setting or from the host of the
+    request, which is limited by ALLOWED_HOSTS, so the number of documents
+    stays small.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._documents = {}
+
+    def get(self, site_url, render):
+        """
+        Return the content and the ETag of the document of the site URL.
+
+        :type render: Callable[[], bytes]
+        :param render: Renders the document if it hasn't been rendered yet
+        :rtype: (bytes, str)
+        """
+        document = self._documents.get(site_url)
+        if document is None:
+            content = render()
+            with self._lock:
+                document = self._documents.setdefault(site_url, (content, hashlib.sha256(content).hexdigest()))
+
+        return document
+
+
+# The discovery document depends on the response types in the database in
+# addition to the settings.
+provider_info_snapshot = VersionedSnapshot('provider_info', RenderedDocuments)
+
+
+def precomputed_json_response(content):
+    """
+    Return a response for a rendered public JSON document.
+
+    The document may be cached by the clients for
+    KEY_MANAGER_KEYS_CACHE_MAX_AGE seconds.
+    """
+    response = HttpResponse(content, content_type='application/json')
+    response['Access-Control-Allow-Origin'] = '*'
+    patch_cache_control(response, public=True, max_age=key_manager_settings.get('KEY_MANAGER_KEYS_CACHE_MAX_AGE'))
+
+    return response
@@ -0,0 +1,138 @@
+from collections import defaultdict, namedtuple
+
+from django.conf import settings
+from oidc_provider.models import Client
+
+from tunnistamo.snapshots import VersionedSnapshot
+from users.models import (
+    Application, LoginMethod, OidcClientOptions, get_post_logout_redirect_uris_of_client_configuration
+)
+
+ClientLoginConfiguration = namedtuple('ClientLoginConfiguration', [
+    'client_id',
+    'client_type',
+    'site_type',
+    # Allowed login methods in order, or None if the client has no options
+    'login_methods',
+    'allowed_provider_ids',
+    'post_logout_redirect_uris',
+])
+
+LoginConfigurations = namedtuple('LoginConfigurations', ['applications', 'oidc_clients', 'login_methods'])
+
+
+def _create_client_login_configuration(client_id, client_type, options, login_methods, post_logout_redirect_uris):
+    if login_methods is not None:
+        login_methods = tuple(login_methods)
+
+    return ClientLoginConfiguration(
+        client_id=client_id,
+        client_type=client_type,
+        site_type=options.site_type if options else None,
+        login_methods=login_methods,
+        allowed_provider_ids=frozenset(
+            login_method.provider_id for login_method in login_methods
+        ) if login_methods is not None else None,
+        post_logout_redirect_uris=post_logout_redirect_uris,
+    )
+
+
+def _get_login_methods_by_owner(through_model, owner_field, login_methods_by_id):
+    login_methods_by_owner = defaultdict(list)
+    through_values = through_model.objects.values_list(owner_field, 'loginmethod_id')
+    for (owner_id, login_method_id) in through_values:
+        login_methods_by_owner[owner_id].append(login_methods_by_id[login_method_id])
+
+    return login_methods_by_owner
+
+
+def _sort_login_methods(login_methods, ordered_ids):
+    return sorted(login_methods, key=lambda login_method: ordered_ids[login_method.pk])
+
+
+def _load_translations(login_method):
+    # Load the translations of every language into the translation cache of the
+    # instance, so that copies of the shared instance can switch languages without
+    # queries or modifying the shared instance.
+    for (language, language_name) in settings.LANGUAGES:
+        login_method.safe_translation_getter('name', language_code=language)
+
+
+def _build_login_configurations():
+    login_methods = tuple(LoginMethod.objects.prefetch_related('translations'))
+    for login_method in login_methods:
+        _load_translations(login_method)
+    login_methods_by_id = {login_method.pk: login_method for login_method in login_methods}
+    ordered_ids = {login_method.pk: index for (index, login_method) in enumerate(login_methods)}
+
+    application_login_methods = _get_login_methods_by_owner(
+        Application.login_methods.through, 'application_id', login_methods_by_id,
+    )
+    applications = {}
+    for application in Application.objects.all():
+        applications[application.client_id] = _create_client_login_configuration(
+            application.client_id,
+            application.client_type,
+            application,
+            _sort_login_methods(application_login_methods[application.pk], ordered_ids),
+            get_post_logout_redirect_uris_of_client_configuration(application),
+        )
+
+    options_login_methods = _get_login_methods_by_owner(
+        OidcClientOptions.login_methods.through, 'oidcclientoptions_id', login_methods_by_id,
+    )
+    options_by_client_id = {options.oidc_client_id: options for options in OidcClientOptions.objects.all()}
+    oidc_clients = {}
+    for client in Client.objects.all():
+        options = options_by_client_id.get(client.pk)
+        oidc_clients[client.client_id] = _create_client_login_configuration(
+            client.client_id,
+            client.client_type,
+            options,
+            _sort_login_methods(options_login_methods[options.pk], ordered_ids) if options else None,
+            get_post_logout_redirect_uris_of_client_configuration(client),
+        )
+
+    return LoginConfigurations(applications, oidc_clients, login_methods)
+
+
+login_configurations_snapshot = VersionedSnapshot('login_configurations', _build_login_configurations)
+
+
+def get_application_login_configuration(client_id):
+    """Return the login configuration of the OAuth2 application or None
+
+    :rtype: ClientLoginConfiguration
+    """
+    return login_configurations_snapshot.get().applications.get(client_id)
+
+
+def get_oidc_client_login_configuration(client_id):
+    """Return the login configuration of the OIDC client or None
+
+    :rtype: ClientLoginConfiguration
+    """
+    return login_configurations_snapshot.get().oidc_clients.get(client_id)
+
+
+def get_client_login_configuration(client_id):
+    """Return the login configuration of the application or the OIDC client
+
+    An application takes precedence over an OIDC client with the same client id.
+
+    :rtype: ClientLoginConfiguration
+    """
+    configurations = login_configurations_snapshot.get()
+    return configurations.applications.get(client_id) or configurations.oidc_clients.get(client_id)
+
+
+def get_all_login_methods():
+    """Return all of the login methods in order
+
+    The login methods are shared by the whole process and must not be modified.
+    Their translated fields return the language active when they were loaded, so
+    use a copy with set_current_language to read them in the active language.
+
+    :rtype: tuple[LoginMethod]
+    """
+    return login_configurations_snapshot.get().login_methods
@@ -0,0 +1,151 @@
+import atexit
+import logging
+import threading
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import connection
+from django.utils.timezone import now
+from ipware import get_client_ip
+
+from services.models import Service
+from tunnistamo.snapshots import VersionedSnapshot
+from users.models import UserLoginEntry, get_geo_location_data_or_none
+
+logger = logging.getLogger(__name__)
+
+PendingUserLoginEntry = namedtuple('PendingUserLoginEntry', ['user_id', 'service_id', 'timestamp', 'ip_address'])
+
+ServiceIds = namedtuple('ServiceIds', ['by_application', 'by_client'])
+
+
+def _build_service_ids():
+    by_application = {}
+    by_client = {}
+    for (service_id, application_id, client_id) in Service.objects.values_list('id', 'application_id', 'client_id'):
+        if application_id is not None:
+            by_application[application_id] = service_id
+        if client_id is not None:
+            by_client[client_id] = service_id
+
+    return ServiceIds(by_application, by_client)
+
+
+service_ids_snapshot = VersionedSnapshot('service_ids', _build_service_ids)
+
+
+def get_service_id_for_application(application):
+    return service_ids_snapshot.get().by_application.get(application.pk)
+
+
+def get_service_id_for_client(client):
+    return service_ids_snapshot.get().by_client.get(client.pk)
+
+
+class UserLoginEntryBuffer:
+    """Buffer of user login entries waiting to be written to the database
+
+    Without a flush interval, which is the default, the entries are written
+    right away. With a flush interval the entries are written with bulk_create
+    by a background thread when the batch is full or the flush interval has
+    passed, so that the requests creating the entries don't wait for the geo
+    location lookups or the database. The geo locations are looked up when the
+    entries are written.
+
+    The buffer is in the memory of the process, so the entries not yet written
+    are lost if the process is killed without running the exit handlers. The
+    buffered entries are written outside the transaction of the request that
+    added them."""
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._entries = []
+        self._worker = None
+
+    def add(self, entry):
+        if settings.USER_LOGIN_ENTRY_FLUSH_INTERVAL is None:
+            self.write([entry])
+            return
+
+        with self._condition:
+            self._entries.append(entry)
+            self._ensure_worker()
+            if self._is_full():
+                self._condition.notify()
+
+    def _is_full(self):
+        return len(self._entries) >= settings.USER_LOGIN_ENTRY_BATCH_SIZE
+
+    def _ensure_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._run, name='user-login-entry-writer', daemon=True)
+            self._worker.start()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(self._is_full, timeout=settings.USER_LOGIN_ENTRY_FLUSH_INTERVAL)
+
+            try:
+                self.flush()
+            except Exception as e:
+                logger.exception('Error writing user login entries: {}'.format(e))
+            finally:
+                connection.close()
+
+    def flush(self):
+        """Write all of the buffered entries to the database
+
+        If writing the batch fails, the entries are written one by one so that
+        an entry which can't be written, e.g. of a user deleted meanwhile,
+        doesn't lose the other entries of the batch."""
+        with self._condition:
+            (entries, self._entries) = (self._entries, [])
+
+        if not entries:
+            return
+
+        try:
+            self.write(entries)
+        except Exception as e:
+            logger.warning('Error writing a batch of user login entries, writing them one by one: {}'.format(e))
+            for entry in entries:
+                try:
+                    self.write([entry])
+                except Exception as e:
+                    logger.exception('Error writing a user login entry: {}'.format(e))
+
+    def write(self, entries):
+        geo_locations = {}
+        for entry in entries:
+            if entry.ip_address not in geo_locations:
+                geo_locations[entry.ip_address] = get_geo_location_data_or_none(entry.ip_address)
+
+        UserLoginEntry.objects.bulk_create([
+            UserLoginEntry(
+                user_id=entry.user_id,
+                service_id=entry.service_id,
+                timestamp=entry.timestamp,
+                ip_address=entry.ip_address,
+                geo_location=geo_locations[entry.ip_address],
+            ) for entry in entries
+        ], batch_size=settings.USER_LOGIN_ENTRY_BATCH_SIZE)
+
+
+user_login_entry_buffer = UserLoginEntryBuffer()
+
+# Write the buffered entries when the process exits normally
+atexit.register(user_login_entry_buffer.flush)
+
+
+def add_user_login_entry(request, service_id, user):
+    """Add a login entry of the user to the buffer
+
+    The IP address is taken from the request right away. The entry is written
+    to the database later by the buffer."""
+    user_login_entry_buffer.add(PendingUserLoginEntry(
+        user_id=user.pk,
+        service_id=service_id,
+        timestamp=now(),
+        ip_address=get_client_ip(request)[0],
+    ))
@@ -0,0 +1,55 @@
+import random
+from timeit import default_timer
+
+from django.conf import settings
+from django.contrib.gis.geoip2 import GeoIP2
+from django.core.management.base import BaseCommand, CommandError
+from geoip2.errors import AddressNotFoundError
+
+from users.utils import get_geo_location_data_for_ip
+
+
+def _lookup_with_new_reader(ip_address):
+    try:
+        return GeoIP2().city(ip_address)
+    except AddressNotFoundError:
+        return None
+
+
+class Command(BaseCommand):
+    help = 'Compares the IP address location lookups of a new GeoIP2 reader per lookup and the shared reader'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=2000, help='Number of lookups with each reader')
+        parser.add_argument(
+            '--addresses', type=int, default=200, help='Number of distinct IP addresses in the lookups'
+        )
+
+    def handle(self, *args, **options):
+        if not getattr(settings, 'GEOIP_PATH', None):
+            raise CommandError('GEOIP_PATH setting is required')
+
+        count = options['count']
+        addresses = [
+            '.'.join(str(random.randint(1, 223)) for i in range(4)) for i in range(options['addresses'])
+        ]
+        ip_addresses = [random.choice(addresses) for i in range(count)]
+
+        lookups = [
+            ('New reader', _lookup_with_new_reader),
+            ('Shared reader', get_geo_location_data_for_ip),
+        ]
+        for (name, lookup) in lookups:
+            # Warm up
+            lookup(ip_addresses[0])
+
+            start_time = default_timer()
+            for ip_address in ip_addresses:
+                lookup(ip_address)
+            elapsed = default_timer() - start_time
+
+            self.stdout.write('{name:<14} {per_second:>10.1f} lookups/s {per_lookup:>8.3f} ms/lookup'.format(
+                name=name,
+                per_second=count / elapsed,
+                per_lookup=elapsed / count * 1000,
+            ))
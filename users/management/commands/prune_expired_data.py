@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from users.pruning import RETENTION_POLICIES, prune_all
+
+
+class Command(BaseCommand):
+    help = 'Deletes expired sessions, tokens and other rows past their retention period in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Number of rows deleted at a time')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the rows that would be deleted')
+        parser.add_argument('--pause', type=float, default=0, help='Seconds to sleep between the batches')
+        parser.add_argument(
+            '--policy', action='append', dest='policies', metavar='NAME',
+            help='Prune only the named retention policy. Can be given several times.',
+        )
+        parser.add_argument('--loop', action='store_true', help='Keep pruning until interrupted')
+        parser.add_argument('--interval', type=float, default=60 * 60, help='Seconds to sleep between loops')
+
+    def handle(self, *args, **options):
+        names = options['policies']
+        unknown_names = set(names or ()) - {policy.name for policy in RETENTION_POLICIES}
+        if unknown_names:
+            raise CommandError('Unknown retention policies: {}'.format(', '.join(sorted(unknown_names))))
+
+        while True:
+            results = prune_all(
+                options['batch_size'], dry_run=options['dry_run'], pause=options['pause'], names=names,
+            )
+            for result in results:
+                self.stdout.write('{action} {count} rows of {name} in {batches} batches in {elapsed:.1f}s'.format(
+                    action='Would delete' if options['dry_run'] else 'Deleted',
+                    count=result.count,
+                    name=result.policy.name,
+                    batches=result.batches,
+                    elapsed=result.elapsed,
+                ))
+
+            if not options['loop']:
+                return
+
+            time.sleep(options['interval'])
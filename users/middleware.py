@@ -16,11 +16,7 @@ CORS_HEADERS = [
 def validate_allowed_origin(uri, origin_match=False):
     if uri is None or uri == '':
         return False
-    try:
-        AllowedOrigin.objects.get(key=generate_origin(uri))
-    except AllowedOrigin.DoesNotExist:
-        return False
-    return True
+    return generate_origin(uri) in AllowedOrigin.objects.get_cached_keys()
 
 
 class CustomDatabaseWhitelistCorsMiddleware(CorsMiddleware):
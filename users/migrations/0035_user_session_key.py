@@ -0,0 +1,54 @@
+# Generated by Django 4.2.14 on 2026-10-18 06:26
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def populate_user_session_keys(apps, schema_editor):
+    """Index the Django session keys already saved in the active Tunnistamo Sessions"""
+    TunnistamoSession = apps.get_model("users", "TunnistamoSession")
+    UserSessionKey = apps.get_model("users", "UserSessionKey")
+
+    user_session_keys = {}
+    for tunnistamo_session in TunnistamoSession.objects.filter(ended_at__isnull=True).iterator():
+        if not isinstance(tunnistamo_session.data, dict):
+            continue
+
+        session_key = tunnistamo_session.data.get("django_session_key")
+        if not session_key:
+            continue
+
+        user_session_keys[session_key] = UserSessionKey(
+            session_key=session_key,
+            user_id=tunnistamo_session.user_id,
+            tunnistamo_session_id=tunnistamo_session.id,
+            created_at=tunnistamo_session.created_at,
+        )
+
+    UserSessionKey.objects.bulk_create(user_session_keys.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0034_application_algorithm_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserSessionKey',
+            fields=[
+                ('session_key', models.CharField(max_length=40, primary_key=True, serialize=False, verbose_name='Session key')),
+                ('created_at', models.DateTimeField(verbose_name='Created at')),
+                ('tunnistamo_session', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='session_keys', to='users.tunnistamosession', verbose_name='Tunnistamo Session')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='session_keys', to=settings.AUTH_USER_MODEL, verbose_name='User')),
+            ],
+            options={
+                'verbose_name': 'User session key',
+                'verbose_name_plural': 'User session keys',
+                'ordering': ('created_at',),
+            },
+        ),
+        migrations.RunPython(populate_user_session_keys, migrations.RunPython.noop),
+    ]
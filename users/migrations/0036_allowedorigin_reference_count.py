@@ -0,0 +1,61 @@
+# Generated by Django 4.2.14 on 2026-10-18 06:49
+
+from collections import Counter
+from urllib.parse import urlparse
+
+from django.db import migrations, models
+
+
+def count_allowed_origin_references(apps, schema_editor):
+    """Recreate the allowed origins with reference counts
+
+    Every Application and OIDC Client adds one reference to each origin of its
+    redirect URIs."""
+
+    def _generate_origin(uri):
+        try:
+            parsed = urlparse(uri)
+            return "{}://{}".format(parsed.scheme, parsed.netloc)
+        except ValueError:
+            return None
+
+    Application = apps.get_model("users", "Application")
+    AllowedOrigin = apps.get_model("users", "AllowedOrigin")
+    Client = apps.get_model("oidc_provider", "Client")
+
+    uri_fields = {
+        Application: ["redirect_uris", "post_logout_redirect_uris"],
+        Client: ["_redirect_uris", "_post_logout_redirect_uris"],
+    }
+
+    reference_counts = Counter()
+    for model, fields in uri_fields.items():
+        for obj in model.objects.all():
+            origins = set()
+            for field in fields:
+                value = getattr(obj, field, None) or ""
+                origins.update(_generate_origin(uri) for uri in value.splitlines() if uri)
+            origins.discard(None)
+            reference_counts.update(origins)
+
+    AllowedOrigin.objects.all().delete()
+    AllowedOrigin.objects.bulk_create(
+        AllowedOrigin(key=key, reference_count=count) for key, count in reference_counts.items()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0035_user_session_key'),
+        ('oidc_provider', '0026_client_multiple_response_types'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='allowedorigin',
+            name='reference_count',
+            field=models.IntegerField(default=0, help_text='Number of Applications and OIDC Clients having a redirect URI in this origin'),
+        ),
+        migrations.RunPython(count_allowed_origin_references, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.14 on 2026-10-18 07:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0036_allowedorigin_reference_count'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='userloginentry',
+            index=models.Index(fields=['user', 'timestamp'], name='users_userl_user_id_f92520_idx'),
+        ),
+    ]
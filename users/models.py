@@ -2,11 +2,14 @@ from __future__ import unicode_literals
 
 import logging
 import uuid
+from collections import namedtuple
 
+from django.conf import settings
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
 from django.core.exceptions import ObjectDoesNotExist
-from django.db import models
+from django.db import IntegrityError, models, transaction
 from django.db.models import JSONField
 from django.utils.timezone import now
 from django.utils.translation import gettext_lazy as _
@@ -16,6 +19,8 @@ from oauth2_provider.models import AbstractApplication
 from oidc_provider.models import Client, Token
 from parler.models import TranslatableModel, TranslatedFields
 
+from tunnistamo.cache import is_cache_shared
+from tunnistamo.snapshots import VersionedSnapshot
 from users.utils import get_geo_location_data_for_ip
 
 logger = logging.getLogger(__name__)
@@ -83,6 +88,39 @@ class Application(OptionsBase, AbstractApplication):
         ordering = ('site_type', 'name')
 
 
+def get_post_logout_redirect_uris_of_client_configuration(obj):
+    """Return the post logout redirect URIs of an Application or an OIDC Client"""
+    value = obj.post_logout_redirect_uris
+    if not value:
+        return frozenset()
+    if not isinstance(value, list):
+        value = value.splitlines()
+    return frozenset(uri for uri in value if uri)
+
+
+def _build_post_logout_redirect_uris():
+    uris = set()
+    for (model, field) in [(Application, 'post_logout_redirect_uris'), (Client, '_post_logout_redirect_uris')]:
+        for value in model.objects.exclude(**{field: ''}).values_list(field, flat=True):
+            uris.update(uri for uri in value.splitlines() if uri)
+
+    return frozenset(uris)
+
+
+post_logout_redirect_uris_snapshot = VersionedSnapshot('post_logout_redirect_uris', _build_post_logout_redirect_uris)
+
+
+def get_post_logout_redirect_uris():
+    """Return the post logout redirect URIs of all Applications and OIDC Clients
+
+    The URIs are read from the snapshot of the current process which is
+    rebuilt when the URIs of an Application or an OIDC Client change.
+
+    :rtype: frozenset[str]
+    """
+    return post_logout_redirect_uris_snapshot.get()
+
+
 class OidcClientOptions(OptionsBase):
     oidc_client = models.OneToOneField(Client, related_name='options', on_delete=models.CASCADE,
                                        verbose_name=_("OIDC Client"))
@@ -95,8 +133,71 @@ class OidcClientOptions(OptionsBase):
         verbose_name_plural = _("OIDC Client Options")
 
 
+class AllowedOriginManager(models.Manager):
+    def get_cached_keys(self):
+        """Return the allowed origins from the snapshot of the current process
+
+        :rtype: frozenset[str]
+        """
+        return allowed_origins_snapshot.get()
+
+    def change_references(self, added=(), removed=()):
+        """Add a reference to the added origins and remove one from the removed origins
+
+        Origins are created on their first reference and deleted when the last
+        reference is removed."""
+        if not added and not removed:
+            return
+
+        with transaction.atomic():
+            # The origins are locked in the same order by every transaction
+            for key in sorted(added):
+                self._add_reference(key)
+            if removed:
+                self.filter(key__in=removed).update(reference_count=models.F('reference_count') - 1)
+                self.filter(key__in=removed, reference_count__lte=0).delete()
+
+        allowed_origins_snapshot.invalidate()
+
+    def _add_reference(self, key):
+        while True:
+            if self.filter(key=key).update(reference_count=models.F('reference_count') + 1):
+                return
+
+            try:
+                with transaction.atomic():
+                    self.create(key=key, reference_count=1)
+                return
+            except IntegrityError:
+                # A concurrent transaction created the origin after the update.
+                # The update sees the origin once that transaction has committed.
+                continue
+
+
 class AllowedOrigin(models.Model):
     key = models.CharField(max_length=300, null=False, primary_key=True)
+    reference_count = models.IntegerField(
+        default=0,
+        help_text=_('Number of Applications and OIDC Clients having a redirect URI in this origin'),
+    )
+
+    objects = AllowedOriginManager()
+
+
+allowed_origins_snapshot = VersionedSnapshot(
+    'allowed_origins',
+    lambda: frozenset(AllowedOrigin.objects.values_list('key', flat=True)),
+)
+
+
+def get_geo_location_data_or_none(ip_address):
+    try:
+        return get_geo_location_data_for_ip(ip_address)
+    except Exception as e:
+        # catch all exceptions here because we don't want any geo location related error
+        # to make the whole login entry creation fail.
+        logger.exception('Error getting geo location data for an IP: {}'.format(e))
+        return None
 
 
 class UserLoginEntryManager(models.Manager):
@@ -107,12 +208,7 @@ class UserLoginEntryManager(models.Manager):
             kwargs['ip_address'] = get_client_ip(request)[0]
 
         if 'geo_location' not in kwargs:
-            try:
-                kwargs['geo_location'] = get_geo_location_data_for_ip(kwargs['ip_address'])
-            except Exception as e:
-                # catch all exceptions here because we don't want any geo location related error
-                # to make the whole login entry creation fail.
-                logger.exception('Error getting geo location data for an IP: {}'.format(e))
+            kwargs['geo_location'] = get_geo_location_data_or_none(kwargs['ip_address'])
 
         return self.create(service=service, **kwargs)
 
@@ -132,6 +228,10 @@ class UserLoginEntry(models.Model):
         verbose_name = _('user login entry')
         verbose_name_plural = _('user login entries')
         ordering = ('timestamp',)
+        indexes = [
+            # The login entries are listed per user in timestamp order
+            models.Index(fields=['user', 'timestamp']),
+        ]
 
     def save(self, *args, **kwargs):
         if not self.timestamp:
@@ -190,6 +290,83 @@ class TunnistamoSessionManager(models.Manager):
         except ObjectDoesNotExist:
             return None
 
+    def get_snapshot(self, session_id):
+        """Return a TunnistamoSessionSnapshot of a Tunnistamo Session
+
+        The snapshot is cached only if the cache is shared by all of the
+        processes, since ending the session has to clear the cached snapshot in
+        every process. Returns None if the session doesn't exist."""
+        use_cache = is_cache_shared()
+        cache_key = _get_session_snapshot_cache_key(session_id)
+        if use_cache:
+            snapshot = cache.get(cache_key)
+            if snapshot is not None:
+                return snapshot
+
+        try:
+            tunnistamo_session = self.get(pk=session_id)
+        except ObjectDoesNotExist:
+            return None
+
+        snapshot = tunnistamo_session.get_snapshot()
+        if use_cache:
+            cache.set(cache_key, snapshot, settings.TUNNISTAMO_SESSION_CACHE_TIMEOUT)
+
+        return snapshot
+
+    def get_snapshot_by_element(self, element):
+        """Return a TunnistamoSessionSnapshot of the session of the element
+
+        Where element is the content object of a SessionElement. Returns None if
+        the element isn't in any session. The session of the element is cached
+        in a shared cache like the snapshot."""
+        use_cache = is_cache_shared()
+        content_type = ContentType.objects.get_for_model(element)
+        cache_key = _get_session_element_cache_key(content_type.pk, element.pk)
+        session_id = cache.get(cache_key) if use_cache else None
+        if session_id is None:
+            session_id = SessionElement.objects.filter(
+                content_type=content_type,
+                object_id=element.pk,
+            ).values_list('session_id', flat=True).first()
+            if session_id is None:
+                return None
+
+            if use_cache:
+                cache.set(cache_key, session_id, settings.TUNNISTAMO_SESSION_CACHE_TIMEOUT)
+
+        return self.get_snapshot(session_id)
+
+
+def _get_session_snapshot_cache_key(session_id):
+    return 'tunnistamo_session:{}'.format(session_id)
+
+
+def _get_session_element_cache_key(content_type_id, object_id):
+    return 'tunnistamo_session_element:{}:{}'.format(content_type_id, object_id)
+
+
+def clear_cached_session_snapshot(session_id):
+    """Clear the cached snapshot of a Tunnistamo Session
+
+    The snapshot is cleared right away and again after the transaction is
+    committed, because a concurrent request might cache the snapshot of the
+    uncommitted state in between."""
+    cache_key = _get_session_snapshot_cache_key(session_id)
+    cache.delete(cache_key)
+    transaction.on_commit(lambda: cache.delete(cache_key))
+
+
+class TunnistamoSessionSnapshot(namedtuple('TunnistamoSessionSnapshot', ['id', 'ended_at', 'amr', 'loa'])):
+    """The parts of a Tunnistamo Session needed when its tokens are used
+
+    Where amr is the provider of the social auth the user logged in with and
+    loa is the level of assurance of the session."""
+    __slots__ = ()
+
+    def has_ended(self):
+        return self.ended_at is not None and self.ended_at <= now()
+
 
 class TunnistamoSession(models.Model):
     id = models.UUIDField(default=uuid.uuid4, primary_key=True)
@@ -210,6 +387,25 @@ class TunnistamoSession(models.Model):
         verbose_name_plural = _('Tunnistamo Sessions')
         ordering = ('created_at',)
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self.clear_cached_snapshot()
+
+    def clear_cached_snapshot(self):
+        clear_cached_session_snapshot(self.id)
+
+    def get_snapshot(self):
+        from social_django.models import UserSocialAuth
+
+        user_social_auth = self.get_content_object_by_model(UserSocialAuth)
+
+        return TunnistamoSessionSnapshot(
+            id=self.id,
+            ended_at=self.ended_at,
+            amr=user_social_auth.provider if user_social_auth else None,
+            loa=self.get_data('loa', 'low'),
+        )
+
     def set_data(self, key, value, save=True):
         if not self.data:
             self.data = {}
@@ -245,6 +441,15 @@ class TunnistamoSession(models.Model):
                 created_at=now(),
             )
 
+        if is_cache_shared():
+            cache.set(
+                _get_session_element_cache_key(content_type.pk, element.pk),
+                self.id,
+                settings.TUNNISTAMO_SESSION_CACHE_TIMEOUT,
+            )
+        # A new element (e.g. the social auth) can change the snapshot
+        self.clear_cached_snapshot()
+
         return session_element
 
     def get_elements_by_model(self, model_or_instance):
@@ -263,6 +468,17 @@ class TunnistamoSession(models.Model):
 
         return session_element.content_object
 
+    def get_tokens(self):
+        """Return the OIDC tokens of this session with their clients and users
+
+        The tokens are loaded with one query instead of resolving the content
+        object of every element separately. Deleted tokens are left out."""
+        token_ids = list(self.get_elements_by_model(Token).values_list('object_id', flat=True))
+        if not token_ids:
+            return []
+
+        return list(Token.objects.filter(pk__in=token_ids).select_related('client', 'user'))
+
     def end(self, send_logout_to_apis=False, request=None):
         """Marks session ended by setting ended_at to current time
 
@@ -270,16 +486,44 @@ class TunnistamoSession(models.Model):
         backchannel logouts to APIs the user might have used. In which case the
         "request"-parameter is required to generate the issuer-claim in the log out
         token.
+
+        The log outs are stored in an outbox in the same transaction in which the
+        session is ended and sent by the send_backchannel_logouts management
+        command. If OIDC_APIS_BACKCHANNEL_LOGOUT_SEND_IMMEDIATELY is enabled they
+        are also sent once right away and the failed ones are left in the outbox
+        to be retried by the management command.
         """
-        self.ended_at = now()
-        self.save()
+        from oidc_apis.api_tokens import clear_cached_api_tokens
+        from tunnistamo.api_common import clear_cached_oidc_token_authentication
+
+        tokens = self.get_tokens()
 
-        if send_logout_to_apis and request:
-            from oidc_apis.backchannel_logout import send_backchannel_logout_to_apis_in_token_scope
+        deliveries = []
+        with transaction.atomic():
+            self.ended_at = now()
+            self.save()
+
+            if send_logout_to_apis and request:
+                from oidc_apis.backchannel_logout import get_backchannel_logout_apis, queue_backchannel_logouts
+
+                # Every API gets one log out even if it's in the scope of several tokens
+                apis = {}
+                for token in tokens:
+                    apis.update((api.pk, api) for api in get_backchannel_logout_apis(token))
+
+                deliveries = queue_backchannel_logouts(
+                    apis.values(), request, sub=str(self.user.uuid), sid=str(self.id),
+                    claim=settings.OIDC_APIS_BACKCHANNEL_LOGOUT_SEND_IMMEDIATELY,
+                )
+
+        for token in tokens:
+            clear_cached_api_tokens(token)
+            clear_cached_oidc_token_authentication(token.access_token)
 
-            tokens = [se.content_object for se in self.get_elements_by_model(Token)]
-            for token in filter(None, tokens):
-                send_backchannel_logout_to_apis_in_token_scope(token, request, sid=str(self.id))
+        if deliveries and settings.OIDC_APIS_BACKCHANNEL_LOGOUT_SEND_IMMEDIATELY:
+            from oidc_apis.backchannel_logout import deliver_backchannel_logouts
+
+            deliver_backchannel_logouts(deliveries)
 
     def has_ended(self):
         return self.ended_at is not None and self.ended_at <= now()
@@ -311,3 +555,37 @@ class SessionElement(models.Model):
                 'object_id',
             ], name='unique_session_element')
         ]
+
+    def clear_cached_session(self):
+        """Clear the cached session of the content object and the session snapshot"""
+        cache.delete(_get_session_element_cache_key(self.content_type_id, self.object_id))
+        clear_cached_session_snapshot(self.session_id)
+
+
+class UserSessionKey(models.Model):
+    """Index from a user and a Tunnistamo Session to a Django session key
+
+    The Django session table can only be searched by decoding every row. The
+    keys are recorded here when the user logs in and removed when the user logs
+    out so that the Django sessions of a single user can be found directly."""
+    session_key = models.CharField(verbose_name=_('Session key'), max_length=40, primary_key=True)
+    user = models.ForeignKey(
+        User,
+        verbose_name=_('User'),
+        related_name='session_keys',
+        on_delete=models.CASCADE,
+    )
+    tunnistamo_session = models.ForeignKey(
+        TunnistamoSession,
+        verbose_name=_('Tunnistamo Session'),
+        related_name='session_keys',
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+    )
+    created_at = models.DateTimeField(verbose_name=_('Created at'))
+
+    class Meta:
+        verbose_name = _('User session key')
+        verbose_name_plural = _('User session keys')
+        ordering = ('created_at',)
@@ -0,0 +1,240 @@
+import logging
+import time
+from collections import defaultdict, namedtuple
+from datetime import timedelta
+from timeit import default_timer
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.sessions.models import Session
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils.timezone import now
+from oidc_provider.models import Code, Token, UserConsent
+
+from users.models import SessionElement, TunnistamoSession, UserLoginEntry, UserSessionKey
+
+logger = logging.getLogger(__name__)
+
+PruningResult = namedtuple('PruningResult', ['policy', 'count', 'batches', 'elapsed'])
+
+
+class RetentionPolicy:
+    """Rows of one table that are kept for a retention period
+
+    The retention period is read from the DATA_RETENTION_DAYS setting by the
+    name of the policy. A policy without a retention period is disabled."""
+    name = None
+    model = None
+
+    def get_retention_period(self):
+        days = settings.DATA_RETENTION_DAYS.get(self.name)
+        return timedelta(days=days) if days is not None else None
+
+    def is_enabled(self):
+        return self.get_retention_period() is not None
+
+    def get_queryset(self, cutoff):
+        """Return the rows that have expired before the cutoff time"""
+        raise NotImplementedError('Implement in subclass')
+
+    def select_prunable(self, pks):
+        """Return the primary keys of a batch that can be deleted"""
+        return pks
+
+    def delete(self, pks):
+        self.model.objects.filter(pk__in=pks).delete()
+
+
+class SessionElementTargetPolicy(RetentionPolicy):
+    """Policy for the rows that can be elements of a Tunnistamo Session
+
+    The session elements of the deleted rows are deleted in the same batch."""
+
+    def delete(self, pks):
+        content_type = ContentType.objects.get_for_model(self.model)
+        SessionElement.objects.filter(content_type=content_type, object_id__in=[str(pk) for pk in pks]).delete()
+        super().delete(pks)
+
+
+class EndedTunnistamoSessionPolicy(RetentionPolicy):
+    name = 'tunnistamo_sessions'
+    model = TunnistamoSession
+
+    def get_queryset(self, cutoff):
+        return TunnistamoSession.objects.filter(ended_at__lt=cutoff)
+
+
+class InactiveTunnistamoSessionPolicy(RetentionPolicy):
+    """Sessions that were never ended and have had no activity for long
+
+    The activity of a session is the creation of its newest element, e.g. a
+    token created by a refresh, or the creation of the session itself."""
+    name = 'inactive_tunnistamo_sessions'
+    model = TunnistamoSession
+
+    def get_queryset(self, cutoff):
+        recent_elements = SessionElement.objects.filter(session=OuterRef('pk'), created_at__gte=cutoff)
+        return TunnistamoSession.objects.filter(ended_at=None, created_at__lt=cutoff).exclude(Exists(recent_elements))
+
+
+class OrphanedSessionElementPolicy(RetentionPolicy):
+    """Session elements whose content object has been deleted"""
+    name = 'session_elements'
+    model = SessionElement
+
+    def get_queryset(self, cutoff):
+        return SessionElement.objects.filter(created_at__lt=cutoff)
+
+    def select_prunable(self, pks):
+        object_ids_by_content_type = defaultdict(set)
+        elements = list(SessionElement.objects.filter(pk__in=pks).values_list('pk', 'content_type_id', 'object_id'))
+        for (pk, content_type_id, object_id) in elements:
+            object_ids_by_content_type[content_type_id].add(object_id)
+
+        existing = set()
+        for (content_type_id, object_ids) in object_ids_by_content_type.items():
+            model = ContentType.objects.get_for_id(content_type_id).model_class()
+            if model is None:
+                continue
+            existing.update(
+                (content_type_id, str(pk))
+                for pk in model._default_manager.filter(pk__in=object_ids).values_list('pk', flat=True)
+            )
+
+        return [pk for (pk, content_type_id, object_id) in elements if (content_type_id, object_id) not in existing]
+
+
+class CodePolicy(SessionElementTargetPolicy):
+    name = 'oidc_codes'
+    model = Code
+
+    def get_queryset(self, cutoff):
+        return Code.objects.filter(expires_at__lt=cutoff)
+
+
+class TokenPolicy(SessionElementTargetPolicy):
+    """Tokens whose access token has expired
+
+    The refresh tokens of django-oidc-provider don't expire and a refresh token
+    is usable as long as its token exists, so the retention period of the
+    tokens is also the time a refresh token stays usable after its access token
+    has expired. The policy is therefore disabled unless configured."""
+    name = 'oidc_tokens'
+    model = Token
+
+    def get_queryset(self, cutoff):
+        return Token.objects.filter(expires_at__lt=cutoff)
+
+
+class UserConsentPolicy(RetentionPolicy):
+    name = 'user_consents'
+    model = UserConsent
+
+    def get_queryset(self, cutoff):
+        return UserConsent.objects.filter(expires_at__lt=cutoff)
+
+
+class DjangoSessionPolicy(RetentionPolicy):
+    """Expired Django sessions and their user session keys"""
+    name = 'django_sessions'
+    model = Session
+
+    def is_enabled(self):
+        return super().is_enabled() and settings.SESSION_ENGINE == 'django.contrib.sessions.backends.db'
+
+    def get_queryset(self, cutoff):
+        return Session.objects.filter(expire_date__lt=cutoff)
+
+    def delete(self, pks):
+        UserSessionKey.objects.filter(session_key__in=pks).delete()
+        super().delete(pks)
+
+
+class UserLoginEntryPolicy(RetentionPolicy):
+    name = 'user_login_entries'
+    model = UserLoginEntry
+
+    def get_queryset(self, cutoff):
+        return UserLoginEntry.objects.filter(timestamp__lt=cutoff)
+
+
+# The tokens and codes are pruned before the session elements and the sessions
+# so that their elements don't have to be found by the orphan scan.
+RETENTION_POLICIES = [
+    CodePolicy(),
+    TokenPolicy(),
+    UserConsentPolicy(),
+    DjangoSessionPolicy(),
+    EndedTunnistamoSessionPolicy(),
+    InactiveTunnistamoSessionPolicy(),
+    OrphanedSessionElementPolicy(),
+    UserLoginEntryPolicy(),
+]
+
+
+def get_retention_policies(names=None):
+    """Return the enabled retention policies, optionally only the named ones"""
+    return [
+        policy for policy in RETENTION_POLICIES
+        if policy.is_enabled() and (names is None or policy.name in names)
+    ]
+
+
+def iterate_primary_key_batches(queryset, batch_size):
+    """Iterate the primary keys of the queryset in batches in primary key order
+
+    Every batch is selected with its own query starting after the last primary
+    key of the previous batch, so no query has to skip over the rows already
+    handled and no cursor is kept open between the batches."""
+    queryset = queryset.order_by('pk')
+    last_pk = None
+    while True:
+        batch_queryset = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        pks = list(batch_queryset.values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            return
+
+        yield pks
+        last_pk = pks[-1]
+
+
+def prune(policy, batch_size, dry_run=False, pause=0, current_time=None):
+    """Delete the expired rows of the policy in batches
+
+    Every batch is deleted in its own short transaction so that the locks on
+    the table are released between the batches. With dry_run the rows are only
+    counted.
+
+    :rtype: PruningResult
+    """
+    cutoff = (current_time or now()) - policy.get_retention_period()
+    start_time = default_timer()
+    count = batches = 0
+
+    for pks in iterate_primary_key_batches(policy.get_queryset(cutoff), batch_size):
+        prunable_pks = policy.select_prunable(pks)
+        if prunable_pks and not dry_run:
+            with transaction.atomic():
+                policy.delete(prunable_pks)
+
+        count += len(prunable_pks)
+        batches += 1
+        logger.debug('Pruned {} rows of {} in batch {}'.format(len(prunable_pks), policy.name, batches))
+
+        if pause and not dry_run:
+            time.sleep(pause)
+
+    return PruningResult(policy, count, batches, default_timer() - start_time)
+
+
+def prune_all(batch_size, dry_run=False, pause=0, names=None):
+    """Prune the rows of all of the enabled retention policies
+
+    :rtype: list[PruningResult]
+    """
+    current_time = now()
+    return [
+        prune(policy, batch_size, dry_run=dry_run, pause=pause, current_time=current_time)
+        for policy in get_retention_policies(names)
+    ]
@@ -1,12 +1,21 @@
 from crequest.middleware import CrequestMiddleware
 from django.contrib.auth import user_logged_in, user_logged_out
-from django.db.models.signals import post_delete, post_save
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
 from django.dispatch import receiver
-from oauth2_provider.models import AccessToken, get_application_model
-from oidc_provider.models import Client
+from django.utils.timezone import now
+from oauth2_provider.models import AccessToken
+from oidc_provider.models import Client, ResponseType, Token
 
 from services.models import Service
-from users.models import AllowedOrigin, Application, TunnistamoSession, UserLoginEntry
+from tunnistamo.api_common import clear_cached_oidc_token_authentication
+from tunnistamo.oauth2_validators import applications_snapshot, clear_cached_oauth2_access_token
+from users.discovery import provider_info_snapshot
+from users.login_configuration import login_configurations_snapshot
+from users.login_entries import add_user_login_entry, get_service_id_for_application, service_ids_snapshot
+from users.models import (
+    AllowedOrigin, Application, LoginMethod, OidcClientOptions, SessionElement, TunnistamoSession, UserSessionKey,
+    get_post_logout_redirect_uris_of_client_configuration, post_logout_redirect_uris_snapshot
+)
 from users.utils import generate_origin
 
 
@@ -17,12 +26,33 @@ def handle_oauth2_access_token_save(sender, instance, **kwargs):
     if not (request and instance.application):
         return
 
-    try:
-        service = Service.objects.get(application=instance.application)
-    except Service.DoesNotExist:
-        return
+    service_id = get_service_id_for_application(instance.application)
+    if service_id is not None:
+        add_user_login_entry(request, service_id, instance.user)
+
+
+@receiver(post_save, sender=Service)
+@receiver(post_delete, sender=Service)
+def invalidate_service_ids(sender, **kwargs):
+    service_ids_snapshot.invalidate()
+
+
+@receiver(post_save, sender=AccessToken)
+@receiver(post_delete, sender=AccessToken)
+def clear_cached_oauth2_access_token_authentication(sender, instance, **kwargs):
+    clear_cached_oauth2_access_token(instance.token)
+
+
+@receiver(post_save, sender=Application)
+@receiver(post_delete, sender=Application)
+def invalidate_oauth2_applications(sender, **kwargs):
+    applications_snapshot.invalidate()
+
 
-    UserLoginEntry.objects.create_from_request(request, service, user=instance.user)
+@receiver(post_save, sender=Token)
+@receiver(post_delete, sender=Token)
+def clear_cached_oidc_token_authentication_after_change(sender, instance, **kwargs):
+    clear_cached_oidc_token_authentication(instance.access_token)
 
 
 # FIXME: create consistent API for both Client and Application models
@@ -32,30 +62,64 @@ def _process_uris(uris):
     return uris.splitlines()
 
 
-def generate_and_save_allowed_origins_from_client_configurations(sender, instance, **kwargs):
-    uri_texts = list()
-    for manager in [get_application_model().objects, Client.objects]:
-        for obj in manager.all():
-            for field in ['redirect_uris', 'post_logout_redirect_uris']:
-                value = getattr(obj, field, None)
-                if value is None or len(value) == 0:
-                    continue
-                uri_texts.append(value)
+def get_allowed_origins_of_client_configuration(obj):
+    """Return the origins of the redirect URIs of an Application or an OIDC Client"""
+    origins = set()
+    for field in ['redirect_uris', 'post_logout_redirect_uris']:
+        value = getattr(obj, field, None)
+        if value is None or len(value) == 0:
+            continue
+        origins.update(generate_origin(u) for u in _process_uris(value) if u)
 
-    valid_origins = set((generate_origin(u) for uri_text in uri_texts for u in _process_uris(uri_text)))
-    persisted_origins = set(AllowedOrigin.objects.values_list('key', flat=True))
+    origins.discard(None)
+    return origins
 
-    origins_to_add = valid_origins - persisted_origins
-    origins_to_delete = persisted_origins - valid_origins
 
-    AllowedOrigin.objects.filter(key__in=origins_to_delete).delete()
-    AllowedOrigin.objects.bulk_create((AllowedOrigin(key=key) for key in origins_to_add))
+def store_previous_allowed_origins_of_client_configuration(sender, instance, **kwargs):
+    previous = sender.objects.filter(pk=instance.pk).first() if instance.pk else None
+    instance._previous_allowed_origins = get_allowed_origins_of_client_configuration(previous) if previous else set()
+    instance._previous_post_logout_redirect_uris = (
+        get_post_logout_redirect_uris_of_client_configuration(previous) if previous else frozenset()
+    )
+
+
+def update_allowed_origins_after_client_configuration_save(sender, instance, **kwargs):
+    """Update the reference counts of the origins the saved configuration added or removed"""
+    previous_origins = getattr(instance, '_previous_allowed_origins', set())
+    origins = get_allowed_origins_of_client_configuration(instance)
+
+    AllowedOrigin.objects.change_references(added=origins - previous_origins, removed=previous_origins - origins)
+    instance._previous_allowed_origins = origins
+
 
+def update_allowed_origins_after_client_configuration_delete(sender, instance, **kwargs):
+    AllowedOrigin.objects.change_references(removed=get_allowed_origins_of_client_configuration(instance))
 
-post_save.connect(generate_and_save_allowed_origins_from_client_configurations, sender=Application)
-post_save.connect(generate_and_save_allowed_origins_from_client_configurations, sender=Client)
-post_delete.connect(generate_and_save_allowed_origins_from_client_configurations, sender=Application)
-post_delete.connect(generate_and_save_allowed_origins_from_client_configurations, sender=Client)
+
+def update_post_logout_redirect_uris_after_client_configuration_save(sender, instance, **kwargs):
+    previous_uris = getattr(instance, '_previous_post_logout_redirect_uris', None)
+    uris = get_post_logout_redirect_uris_of_client_configuration(instance)
+
+    if uris != previous_uris:
+        post_logout_redirect_uris_snapshot.invalidate()
+    instance._previous_post_logout_redirect_uris = uris
+
+
+def update_post_logout_redirect_uris_after_client_configuration_delete(sender, instance, **kwargs):
+    if get_post_logout_redirect_uris_of_client_configuration(instance):
+        post_logout_redirect_uris_snapshot.invalidate()
+
+
+for client_configuration_model in [Application, Client]:
+    pre_save.connect(store_previous_allowed_origins_of_client_configuration, sender=client_configuration_model)
+    post_save.connect(update_allowed_origins_after_client_configuration_save, sender=client_configuration_model)
+    post_delete.connect(update_allowed_origins_after_client_configuration_delete, sender=client_configuration_model)
+    post_save.connect(
+        update_post_logout_redirect_uris_after_client_configuration_save, sender=client_configuration_model
+    )
+    post_delete.connect(
+        update_post_logout_redirect_uris_after_client_configuration_delete, sender=client_configuration_model
+    )
 
 
 @receiver(user_logged_in)
@@ -78,6 +142,17 @@ def create_tunnistamo_session_after_login(sender, user, request, **kwargs):
             save=True
         )
 
+    # Index the django session key by the user to find the user's sessions
+    # without decoding the whole session table e.g. in back-channel logout.
+    UserSessionKey.objects.update_or_create(
+        session_key=request.session.session_key,
+        defaults={
+            'user': user,
+            'tunnistamo_session': tunnistamo_session,
+            'created_at': now(),
+        }
+    )
+
 
 @receiver(user_logged_out)
 def end_tunnistamo_session_when_user_logs_out(sender, user, request, **kwargs):
@@ -86,3 +161,39 @@ def end_tunnistamo_session_when_user_logs_out(sender, user, request, **kwargs):
         tunnistamo_session.end(send_logout_to_apis=True, request=request)
     except TunnistamoSession.DoesNotExist:
         pass
+
+
+@receiver(user_logged_out)
+def remove_user_session_key_when_user_logs_out(sender, user, request, **kwargs):
+    if request.session.session_key:
+        UserSessionKey.objects.filter(session_key=request.session.session_key).delete()
+
+
+@receiver(post_delete, sender=TunnistamoSession)
+def clear_cached_tunnistamo_session_snapshot(sender, instance, **kwargs):
+    instance.clear_cached_snapshot()
+
+
+@receiver(post_delete, sender=SessionElement)
+def clear_cached_session_of_session_element(sender, instance, **kwargs):
+    instance.clear_cached_session()
+
+
+@receiver(post_save, sender=ResponseType)
+@receiver(post_delete, sender=ResponseType)
+def invalidate_provider_info(sender, **kwargs):
+    provider_info_snapshot.invalidate()
+
+
+def invalidate_login_configurations(sender, **kwargs):
+    login_configurations_snapshot.invalidate()
+
+
+for login_configuration_model in [
+    Application, Client, OidcClientOptions, LoginMethod, LoginMethod._parler_meta.root_model,
+]:
+    post_save.connect(invalidate_login_configurations, sender=login_configuration_model)
+    post_delete.connect(invalidate_login_configurations, sender=login_configuration_model)
+
+for login_methods_field in [Application.login_methods, OidcClientOptions.login_methods]:
+    m2m_changed.connect(invalidate_login_configurations, sender=login_methods_field.through)
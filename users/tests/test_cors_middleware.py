@@ -1,6 +1,9 @@
 import pytest
+from django.db import connection
 
 from users.factories import access_token_factory
+from users.middleware import validate_allowed_origin
+from users.models import AllowedOrigin
 
 # These match the CORS_URLS_REGEX setting
 CORS_PATHS = (
@@ -178,3 +181,58 @@ def test_only_requests_with_whitelisted_paths_get_cors_headers(application_facto
 @pytest.mark.parametrize('path', CORS_PATHS + NON_CORS_PATHS)
 def test_unknown_origins_do_not_get_cors_headers(path):
     assert_cors_not_found(ORIGIN_1, path)
+
+
+def test_origin_shared_by_two_client_configurations_is_kept_until_both_remove_it(
+    application_factory, oidcclient_factory
+):
+    application = application_factory(redirect_uris=URI_1)
+    oidc_client = oidcclient_factory(redirect_uris=[URI_1, URI_2])
+
+    assert AllowedOrigin.objects.get(key=ORIGIN_1).reference_count == 2
+    assert AllowedOrigin.objects.get(key=ORIGIN_2).reference_count == 1
+
+    application.delete()
+    assert_cors_found(ORIGIN_1, CORS_PATHS[0])
+
+    oidc_client.redirect_uris = [URI_2]
+    oidc_client.save()
+    assert_cors_not_found(ORIGIN_1, CORS_PATHS[0])
+    assert_cors_found(ORIGIN_2, CORS_PATHS[0])
+
+
+def test_saving_client_configuration_without_changes_keeps_reference_counts(application_factory):
+    application = application_factory(redirect_uris="\n".join([URI_1, URI_2]))
+
+    application.name = 'Renamed'
+    application.save()
+
+    assert dict(AllowedOrigin.objects.values_list('key', 'reference_count')) == {ORIGIN_1: 1, ORIGIN_2: 1}
+
+
+def test_origin_added_concurrently_by_another_transaction_gets_both_references():
+    concurrent_insert_done = False
+
+    def insert_concurrently(execute, sql, params, many, context):
+        # Another transaction creates the origin after it wasn't found by the update
+        nonlocal concurrent_insert_done
+        result = execute(sql, params, many, context)
+        if sql.startswith('UPDATE') and 'allowedorigin' in sql and not concurrent_insert_done:
+            concurrent_insert_done = True
+            AllowedOrigin.objects.create(key=ORIGIN_1, reference_count=1)
+        return result
+
+    with connection.execute_wrapper(insert_concurrently):
+        AllowedOrigin.objects.change_references(added={ORIGIN_1})
+
+    assert concurrent_insert_done
+    assert AllowedOrigin.objects.get(key=ORIGIN_1).reference_count == 2
+
+
+def test_allowed_origins_are_checked_without_queries(application_factory, django_assert_num_queries):
+    application_factory(redirect_uris=URI_1)
+    assert validate_allowed_origin(ORIGIN_1)
+
+    with django_assert_num_queries(0):
+        assert validate_allowed_origin(ORIGIN_1)
+        assert not validate_allowed_origin(ORIGIN_2)
@@ -0,0 +1,94 @@
+import pytest
+from django.contrib.sessions.middleware import SessionMiddleware
+
+from oidc_apis.utils import after_userlogin_hook
+from users.login_configuration import (
+    get_all_login_methods, get_application_login_configuration, get_client_login_configuration,
+    get_oidc_client_login_configuration
+)
+
+
+@pytest.fixture
+def login_methods(loginmethod_factory):
+    return [
+        loginmethod_factory(provider_id='github', order=2),
+        loginmethod_factory(provider_id='facebook', order=1),
+        loginmethod_factory(provider_id='google', order=3),
+    ]
+
+
+@pytest.mark.django_db
+def test_oidc_client_login_configuration(login_methods, oidcclient_factory, oidcclientoptions_factory):
+    oidc_client = oidcclient_factory(client_id='test_client', post_logout_redirect_uris=['https://example.com/'])
+    options = oidcclientoptions_factory(oidc_client=oidc_client, site_type='production')
+    options.login_methods.set([login_methods[0], login_methods[1]])
+
+    configuration = get_oidc_client_login_configuration('test_client')
+
+    assert configuration.client_type == 'public'
+    assert configuration.site_type == 'production'
+    assert [login_method.provider_id for login_method in configuration.login_methods] == ['facebook', 'github']
+    assert configuration.allowed_provider_ids == {'facebook', 'github'}
+    assert configuration.post_logout_redirect_uris == {'https://example.com/'}
+    assert [login_method.provider_id for login_method in get_all_login_methods()] == [
+        'facebook', 'github', 'google'
+    ]
+
+
+@pytest.mark.django_db
+def test_oidc_client_without_options_has_no_login_methods(oidcclient_factory):
+    oidcclient_factory(client_id='test_client')
+
+    assert get_oidc_client_login_configuration('test_client').login_methods is None
+    assert get_oidc_client_login_configuration('unknown_client') is None
+
+
+@pytest.mark.django_db
+def test_application_takes_precedence_over_oidc_client(login_methods, application_factory, oidcclient_factory):
+    application = application_factory(client_id='test_client')
+    application.login_methods.set([login_methods[2]])
+    oidcclient_factory(client_id='test_client')
+
+    assert get_client_login_configuration('test_client') == get_application_login_configuration('test_client')
+    assert get_client_login_configuration('test_client').allowed_provider_ids == {'google'}
+
+
+@pytest.mark.django_db
+def test_login_configuration_is_not_queried_again(login_methods, oidcclient_factory, django_assert_num_queries):
+    oidcclient_factory(client_id='test_client')
+    get_client_login_configuration('test_client')
+
+    with django_assert_num_queries(0):
+        get_client_login_configuration('test_client')
+        get_all_login_methods()
+
+
+@pytest.mark.django_db
+def test_login_configuration_follows_changes(login_methods, oidcclient_factory, oidcclientoptions_factory):
+    options = oidcclientoptions_factory(oidc_client=oidcclient_factory(client_id='test_client'))
+    assert get_oidc_client_login_configuration('test_client').allowed_provider_ids == set()
+
+    options.login_methods.add(login_methods[0])
+    assert get_oidc_client_login_configuration('test_client').allowed_provider_ids == {'github'}
+
+    login_methods[0].name = 'GitHub'
+    login_methods[0].save()
+    assert get_oidc_client_login_configuration('test_client').login_methods[0].name == 'GitHub'
+
+    options.delete()
+    assert get_oidc_client_login_configuration('test_client').login_methods is None
+
+
+@pytest.mark.django_db
+def test_after_userlogin_hook_allows_login_method_of_client_without_queries(
+    rf, user, login_methods, oidcclient_factory, oidcclientoptions_factory, django_assert_num_queries
+):
+    oidc_client = oidcclient_factory()
+    oidcclientoptions_factory(oidc_client=oidc_client).login_methods.set(login_methods)
+    request = rf.get('/openid/authorize')
+    SessionMiddleware(lambda request: None).process_request(request)
+    request.session['social_auth_last_login_backend'] = 'github'
+    get_oidc_client_login_configuration(oidc_client.client_id)
+
+    with django_assert_num_queries(0):
+        assert after_userlogin_hook(request, user, oidc_client) is None
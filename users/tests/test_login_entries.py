@@ -0,0 +1,96 @@
+import time
+from unittest import mock
+
+import pytest
+
+from services.models import Service
+from users.factories import OIDCClientFactory, UserFactory
+from users.login_entries import UserLoginEntryBuffer, add_user_login_entry, get_service_id_for_client
+from users.models import UserLoginEntry
+
+
+@pytest.fixture
+def buffer(settings):
+    settings.USER_LOGIN_ENTRY_FLUSH_INTERVAL = 10
+    settings.USER_LOGIN_ENTRY_BATCH_SIZE = 100
+    buffer = UserLoginEntryBuffer()
+    with mock.patch('users.login_entries.user_login_entry_buffer', buffer), \
+            mock.patch.object(buffer, '_ensure_worker'):
+        yield buffer
+
+
+@pytest.mark.django_db
+def test_login_entries_are_written_in_a_batch_when_flushed(rf, buffer, user, service, django_assert_num_queries):
+    with mock.patch('users.models.get_geo_location_data_for_ip', return_value={'city': 'Helsinki'}) as geo_lookup:
+        add_user_login_entry(rf.get('/', REMOTE_ADDR='1.2.3.4'), service.pk, user)
+        add_user_login_entry(rf.get('/', REMOTE_ADDR='1.2.3.4'), service.pk, user)
+
+        geo_lookup.assert_not_called()
+        assert UserLoginEntry.objects.count() == 0
+
+        with django_assert_num_queries(1):
+            buffer.flush()
+
+    geo_lookup.assert_called_once_with('1.2.3.4')
+    entries = UserLoginEntry.objects.all()
+    assert len(entries) == 2
+    for entry in entries:
+        assert entry.user == user
+        assert entry.service == service
+        assert entry.ip_address == '1.2.3.4'
+        assert entry.geo_location == {'city': 'Helsinki'}
+
+
+@pytest.mark.django_db
+def test_worker_is_woken_up_when_the_batch_is_full(rf, buffer, settings, user, service):
+    settings.USER_LOGIN_ENTRY_BATCH_SIZE = 2
+
+    with mock.patch.object(buffer._condition, 'notify') as notify:
+        add_user_login_entry(rf.get('/'), service.pk, user)
+        notify.assert_not_called()
+        add_user_login_entry(rf.get('/'), service.pk, user)
+        notify.assert_called_once_with()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_worker_writes_the_buffered_entries(rf, settings, user, service):
+    settings.USER_LOGIN_ENTRY_FLUSH_INTERVAL = 0.1
+    buffer = UserLoginEntryBuffer()
+
+    with mock.patch('users.login_entries.user_login_entry_buffer', buffer):
+        add_user_login_entry(rf.get('/'), service.pk, user)
+
+    assert buffer._worker.is_alive()
+    deadline = time.monotonic() + 5
+    while not UserLoginEntry.objects.exists() and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+    assert UserLoginEntry.objects.get().user == user
+
+
+@pytest.mark.django_db(transaction=True)
+def test_entries_are_written_one_by_one_when_the_batch_fails(rf, buffer, user, service):
+    deleted_user = UserFactory()
+    add_user_login_entry(rf.get('/'), service.pk, user)
+    add_user_login_entry(rf.get('/'), service.pk, deleted_user)
+    add_user_login_entry(rf.get('/'), service.pk, user)
+    deleted_user.delete()
+
+    buffer.flush()
+
+    assert list(UserLoginEntry.objects.values_list('user_id', flat=True)) == [user.pk, user.pk]
+
+
+@pytest.mark.django_db
+def test_service_of_a_client_is_cached(django_assert_num_queries):
+    client = OIDCClientFactory()
+    assert get_service_id_for_client(client) is None
+
+    service = Service.objects.create(name='test service', client=client)
+    assert get_service_id_for_client(client) == service.pk
+
+    with django_assert_num_queries(0):
+        assert get_service_id_for_client(client) == service.pk
+
+    service.delete()
+    assert get_service_id_for_client(client) is None
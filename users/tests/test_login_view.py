@@ -54,6 +54,24 @@ def test_login_view_all_loginmethods(client, assertCountEqual, loginmethod_facto
     assertCountEqual(response.context['login_methods'], [lm1, lm2])
 
 
+@pytest.mark.django_db
+def test_login_view_loginmethods_in_requested_language(client, loginmethod_factory):
+    for provider_id in ('facebook', 'github'):
+        login_method = loginmethod_factory(provider_id=provider_id, name='{} fi'.format(provider_id))
+        login_method.set_current_language('en')
+        login_method.name = '{} en'.format(provider_id)
+        login_method.save()
+
+    response = client.get('/login/', {'ui_locales': 'fi'})
+    assert [method.name for method in response.context['login_methods']] == ['facebook fi', 'github fi']
+
+    response = client.get('/login/', {'ui_locales': 'en'})
+    assert [method.name for method in response.context['login_methods']] == ['facebook en', 'github en']
+
+    response = client.get('/login/', {'ui_locales': 'fi'})
+    assert [method.name for method in response.context['login_methods']] == ['facebook fi', 'github fi']
+
+
 @pytest.mark.django_db
 def test_login_view_one_loginmethod_redirect(client, loginmethod_factory):
     loginmethod_factory(provider_id='facebook')
@@ -4,6 +4,7 @@ from django.contrib import auth
 from django.utils.crypto import get_random_string
 
 from users.tests.conftest import DummyADFSBackend
+from users.views import TunnistamoOidcEndSessionView
 
 
 def link_to_url_found_in_response(response, url):
@@ -399,3 +400,40 @@ def test_logout_redirect_to_last_used_ad(
 
     assert response.status_code == 302
     assert response.url == expected_redirect_url
+
+
+@pytest.mark.django_db
+def test_logout_redirect_follows_changed_post_logout_redirect_uris(client, application_factory, oidcclient_factory):
+    app = application_factory(post_logout_redirect_uris='https://example.com/', redirect_uris=['https://example.com/'])
+    oidc_client = oidcclient_factory(redirect_uris=[], post_logout_redirect_uris=['https://example.org/'])
+
+    for uri in ['https://example.com/', 'https://example.org/']:
+        response = client.get('/openid/end-session/', {'post_logout_redirect_uri': uri}, follow=True)
+        assert link_to_url_found_in_response(response, uri)
+
+    app.post_logout_redirect_uris = 'https://example.net/'
+    app.save()
+    oidc_client.delete()
+
+    for (uri, expected) in [
+        ('https://example.com/', False),
+        ('https://example.org/', False),
+        ('https://example.net/', True),
+    ]:
+        response = client.get('/openid/end-session/', {'post_logout_redirect_uri': uri}, follow=True)
+        assert link_to_url_found_in_response(response, uri) is expected
+
+
+@pytest.mark.django_db
+def test_post_logout_redirect_uri_validation_does_not_query_database(
+    application_factory, oidcclient_factory, django_assert_num_queries
+):
+    application_factory(post_logout_redirect_uris='https://example.com/', redirect_uris=['https://example.com/'])
+    oidcclient_factory(redirect_uris=[], post_logout_redirect_uris=['https://example.org/'])
+
+    view = TunnistamoOidcEndSessionView()
+    assert view._validate_client_uri('https://example.com/')
+
+    with django_assert_num_queries(0):
+        assert view._validate_client_uri('https://example.org/')
+        assert not view._validate_client_uri('https://example.net/')
@@ -0,0 +1,135 @@
+from datetime import timedelta
+
+import pytest
+from django.contrib.sessions.models import Session
+from django.core.management import call_command
+from django.utils.timezone import now
+from oidc_provider.models import Token
+
+from users.factories import OIDCClientFactory, UserFactory, UserLoginEntryFactory
+from users.models import SessionElement, TunnistamoSession, UserLoginEntry, UserSessionKey
+from users.pruning import TokenPolicy, iterate_primary_key_batches, prune
+
+
+def create_token(user, client, expires_at, access_token):
+    return Token.objects.create(
+        user=user,
+        client=client,
+        expires_at=expires_at,
+        access_token=access_token,
+        refresh_token=access_token,
+    )
+
+
+@pytest.fixture
+def token_retention(settings):
+    settings.DATA_RETENTION_DAYS = dict(settings.DATA_RETENTION_DAYS, oidc_tokens=30)
+
+
+@pytest.fixture
+def tokens(user):
+    client = OIDCClientFactory()
+    return [
+        create_token(user, client, now() - timedelta(days=40), 'expired_1'),
+        create_token(user, client, now() - timedelta(days=35), 'expired_2'),
+        create_token(user, client, now() - timedelta(days=1), 'recently_expired'),
+        create_token(user, client, now() + timedelta(hours=1), 'valid'),
+    ]
+
+
+@pytest.mark.django_db
+def test_primary_keys_are_iterated_in_batches(user):
+    entries = UserLoginEntryFactory.create_batch(5, user=user)
+
+    batches = list(iterate_primary_key_batches(UserLoginEntry.objects.all(), 2))
+
+    assert batches == [[entries[0].pk, entries[1].pk], [entries[2].pk, entries[3].pk], [entries[4].pk]]
+
+
+@pytest.mark.django_db
+def test_expired_tokens_and_their_session_elements_are_pruned(token_retention, user, tokens):
+    tunnistamo_session = TunnistamoSession.objects.create(user=user, created_at=now())
+    for token in tokens:
+        tunnistamo_session.add_element(token)
+
+    result = prune(TokenPolicy(), batch_size=1)
+
+    assert result.count == 2
+    assert result.batches == 2
+    assert set(Token.objects.values_list('access_token', flat=True)) == {'recently_expired', 'valid'}
+    assert set(SessionElement.objects.values_list('object_id', flat=True)) == {str(tokens[2].pk), str(tokens[3].pk)}
+
+
+@pytest.mark.django_db
+def test_dry_run_only_counts(token_retention, user, tokens):
+    result = prune(TokenPolicy(), batch_size=10, dry_run=True)
+
+    assert result.count == 2
+    assert Token.objects.count() == 4
+
+
+@pytest.mark.django_db
+def test_orphaned_session_elements_are_pruned(user, tokens):
+    tunnistamo_session = TunnistamoSession.objects.create(user=user, created_at=now() - timedelta(days=2))
+    tunnistamo_session.add_element(tokens[3])
+    orphaned_element = tunnistamo_session.add_element(tokens[2])
+    SessionElement.objects.update(created_at=now() - timedelta(days=2))
+    Token.objects.filter(pk=tokens[2].pk).delete()
+
+    call_command('prune_expired_data', policies=['session_elements'])
+
+    assert list(SessionElement.objects.values_list('object_id', flat=True)) == [str(tokens[3].pk)]
+    assert not SessionElement.objects.filter(pk=orphaned_element.pk).exists()
+
+
+@pytest.mark.django_db
+def test_ended_and_inactive_tunnistamo_sessions_are_pruned(user):
+    ended = TunnistamoSession.objects.create(
+        user=user, created_at=now() - timedelta(days=60), ended_at=now() - timedelta(days=31),
+    )
+    recently_ended = TunnistamoSession.objects.create(
+        user=user, created_at=now() - timedelta(days=60), ended_at=now() - timedelta(days=1),
+    )
+    inactive = TunnistamoSession.objects.create(user=user, created_at=now() - timedelta(days=400))
+    inactive.add_element(create_token(user, OIDCClientFactory(), now() - timedelta(days=399), 'inactive'))
+    SessionElement.objects.update(created_at=now() - timedelta(days=399))
+    active = TunnistamoSession.objects.create(user=user, created_at=now() - timedelta(days=60))
+    refreshed = TunnistamoSession.objects.create(user=user, created_at=now() - timedelta(days=400))
+    refreshed.add_element(create_token(user, OIDCClientFactory(), now() + timedelta(hours=1), 'refreshed'))
+
+    call_command('prune_expired_data', policies=['tunnistamo_sessions', 'inactive_tunnistamo_sessions'])
+
+    remaining = set(TunnistamoSession.objects.values_list('pk', flat=True))
+    assert remaining == {recently_ended.pk, active.pk, refreshed.pk}
+    assert ended.pk not in remaining
+    assert inactive.pk not in remaining
+
+
+@pytest.mark.django_db
+def test_expired_django_sessions_and_their_keys_are_pruned():
+    user = UserFactory()
+    Session.objects.create(session_key='expired', session_data='', expire_date=now() - timedelta(minutes=1))
+    Session.objects.create(session_key='valid', session_data='', expire_date=now() + timedelta(days=1))
+    UserSessionKey.objects.create(session_key='expired', user=user, created_at=now())
+    UserSessionKey.objects.create(session_key='valid', user=user, created_at=now())
+
+    call_command('prune_expired_data', policies=['django_sessions'])
+
+    assert list(Session.objects.values_list('session_key', flat=True)) == ['valid']
+    assert list(UserSessionKey.objects.values_list('session_key', flat=True)) == ['valid']
+
+
+@pytest.mark.django_db
+def test_policy_without_retention_period_is_disabled(settings, user, tokens):
+    settings.DATA_RETENTION_DAYS = dict(settings.DATA_RETENTION_DAYS, oidc_tokens=None)
+
+    call_command('prune_expired_data')
+
+    assert Token.objects.count() == 4
+
+
+@pytest.mark.django_db
+def test_tokens_are_kept_by_default(user, tokens):
+    call_command('prune_expired_data')
+
+    assert Token.objects.count() == 4
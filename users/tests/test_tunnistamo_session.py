@@ -1,13 +1,19 @@
+import uuid
+
 import pytest
 from django.contrib.auth.middleware import AuthenticationMiddleware
 from django.contrib.auth.models import AnonymousUser
 from django.contrib.sessions.middleware import SessionMiddleware
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 from oidc_provider.models import Token
 from social_django.models import UserSocialAuth
 
 from tunnistamo.tests.conftest import social_login
-from users.models import TunnistamoSession
+from users.models import TunnistamoSession, UserSessionKey
 
 
 @pytest.mark.django_db
@@ -313,6 +319,128 @@ def test_manager_get_by_element(user, tunnistamosession_factory, add_element):
         assert TunnistamoSession.objects.get_by_element(social_auth) is None
 
 
+@pytest.mark.django_db
+@pytest.mark.parametrize('add_element', (True, False))
+def test_manager_get_snapshot_by_element(user, tunnistamosession_factory, add_element):
+    tunnistamo_session = tunnistamosession_factory(user=user)
+    tunnistamo_session.set_data('loa', 'substantial')
+    social_auth = UserSocialAuth.objects.create(
+        user=user,
+        provider='dummy',
+        uid='test_uid'
+    )
+
+    if add_element:
+        tunnistamo_session.add_element(social_auth)
+        snapshot = TunnistamoSession.objects.get_snapshot_by_element(social_auth)
+        assert snapshot.id == tunnistamo_session.id
+        assert snapshot.ended_at is None
+        assert snapshot.amr == 'dummy'
+        assert snapshot.loa == 'substantial'
+        assert not snapshot.has_ended()
+    else:
+        assert TunnistamoSession.objects.get_snapshot_by_element(social_auth) is None
+
+
+@pytest.mark.django_db
+def test_manager_get_snapshot_by_element_is_cached(
+    user, tunnistamosession_factory, oidcclient_factory, django_assert_num_queries
+):
+    tunnistamo_session = tunnistamosession_factory(user=user)
+    client = oidcclient_factory(redirect_uris=[])
+    token = Token.objects.create(client=client, expires_at=timezone.now())
+    tunnistamo_session.add_element(token)
+
+    TunnistamoSession.objects.get_snapshot_by_element(token)
+
+    with django_assert_num_queries(0):
+        snapshot = TunnistamoSession.objects.get_snapshot_by_element(token)
+
+    assert snapshot.id == tunnistamo_session.id
+
+
+@pytest.mark.django_db
+def test_cached_snapshot_is_invalidated_when_session_ends(user, tunnistamosession_factory, oidcclient_factory):
+    tunnistamo_session = tunnistamosession_factory(user=user)
+    client = oidcclient_factory(redirect_uris=[])
+    token = Token.objects.create(client=client, expires_at=timezone.now())
+    tunnistamo_session.add_element(token)
+
+    assert not TunnistamoSession.objects.get_snapshot_by_element(token).has_ended()
+
+    tunnistamo_session.end()
+
+    assert TunnistamoSession.objects.get_snapshot_by_element(token).has_ended()
+
+
+@pytest.mark.django_db
+def test_cached_snapshot_is_invalidated_when_element_is_added(user, tunnistamosession_factory, oidcclient_factory):
+    tunnistamo_session = tunnistamosession_factory(user=user)
+    client = oidcclient_factory(redirect_uris=[])
+    token = Token.objects.create(client=client, expires_at=timezone.now())
+    tunnistamo_session.add_element(token)
+
+    assert TunnistamoSession.objects.get_snapshot_by_element(token).amr is None
+
+    social_auth = UserSocialAuth.objects.create(user=user, provider='dummy', uid='test_uid')
+    tunnistamo_session.add_element(social_auth)
+
+    assert TunnistamoSession.objects.get_snapshot_by_element(token).amr == 'dummy'
+
+
+@pytest.mark.django_db
+def test_cached_snapshot_is_invalidated_when_session_is_deleted(user, tunnistamosession_factory):
+    tunnistamo_session = tunnistamosession_factory(user=user)
+    tunnistamo_session_id = tunnistamo_session.id
+
+    assert TunnistamoSession.objects.get_snapshot(tunnistamo_session_id) is not None
+
+    tunnistamo_session.delete()
+
+    assert TunnistamoSession.objects.get_snapshot(tunnistamo_session_id) is None
+
+
+@pytest.mark.django_db
+def test_snapshot_is_not_cached_in_process_local_cache(
+    settings, user, tunnistamosession_factory, oidcclient_factory, django_assert_num_queries
+):
+    settings.CACHE_IS_SHARED = False
+    tunnistamo_session = tunnistamosession_factory(user=user)
+    token = Token.objects.create(client=oidcclient_factory(redirect_uris=[]), expires_at=timezone.now())
+    tunnistamo_session.add_element(token)
+
+    TunnistamoSession.objects.get_snapshot_by_element(token)
+
+    # The content type is cached by Django
+    with django_assert_num_queries(3):
+        TunnistamoSession.objects.get_snapshot_by_element(token)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_cached_snapshot_is_cleared_again_after_commit(user, tunnistamosession_factory):
+    tunnistamo_session = tunnistamosession_factory(user=user)
+
+    with transaction.atomic():
+        tunnistamo_session.ended_at = timezone.now()
+        tunnistamo_session.save()
+        # A concurrent request caches the snapshot before the commit
+        cache.set('tunnistamo_session:{}'.format(tunnistamo_session.id), 'uncommitted')
+
+    assert TunnistamoSession.objects.get_snapshot(tunnistamo_session.id).has_ended()
+
+
+@pytest.mark.django_db
+def test_cached_session_is_cleared_when_element_is_deleted(user, tunnistamosession_factory, oidcclient_factory):
+    tunnistamo_session = tunnistamosession_factory(user=user)
+    token = Token.objects.create(client=oidcclient_factory(redirect_uris=[]), expires_at=timezone.now())
+    session_element = tunnistamo_session.add_element(token)
+    assert TunnistamoSession.objects.get_snapshot_by_element(token).id == tunnistamo_session.id
+
+    session_element.delete()
+
+    assert TunnistamoSession.objects.get_snapshot_by_element(token) is None
+
+
 @pytest.mark.django_db
 def test_session_gets_ended_on_logout(client, user_factory):
     user = user_factory()
@@ -329,3 +457,79 @@ def test_session_gets_ended_on_logout(client, user_factory):
 
     tunnistamo_session.refresh_from_db()
     assert tunnistamo_session.ended_at is not None
+
+
+@pytest.mark.django_db
+def test_django_session_key_indexed_on_login(client, user):
+    client.force_login(user)
+
+    user_session_key = UserSessionKey.objects.get(user=user)
+
+    assert user_session_key.session_key == client.session.session_key
+    assert str(user_session_key.tunnistamo_session_id) == client.session.get('tunnistamo_session_id')
+
+
+@pytest.mark.django_db
+def test_django_session_key_index_removed_on_logout(client, user_factory):
+    user = user_factory()
+    other_user = user_factory()
+    client.force_login(user)
+    UserSessionKey.objects.create(session_key='other', user=other_user, created_at=timezone.now())
+
+    assert UserSessionKey.objects.filter(user=user).count() == 1
+
+    client.get('/logout/', follow=True)
+
+    assert UserSessionKey.objects.filter(user=user).count() == 0
+    assert UserSessionKey.objects.filter(user=other_user).count() == 1
+
+
+def create_token(client, user):
+    return Token.objects.create(
+        client=client,
+        user=user,
+        expires_at=timezone.now(),
+        access_token=uuid.uuid4().hex,
+        refresh_token=uuid.uuid4().hex,
+    )
+
+
+@pytest.mark.django_db
+def test_get_tokens_loads_tokens_with_one_query(
+    user, tunnistamosession_factory, oidcclient_factory, django_assert_num_queries
+):
+    tunnistamo_session = tunnistamosession_factory(user=user)
+    client = oidcclient_factory(redirect_uris=[])
+    tokens = [create_token(client, user) for i in range(3)]
+    for token in tokens:
+        tunnistamo_session.add_element(token)
+    tokens[0].delete()
+
+    with django_assert_num_queries(2):
+        session_tokens = tunnistamo_session.get_tokens()
+        assert {token.client.client_id for token in session_tokens} == {client.client_id}
+        assert {token.user for token in session_tokens} == {user}
+
+    assert {token.pk for token in session_tokens} == {tokens[1].pk, tokens[2].pk}
+
+
+@pytest.mark.django_db
+def test_ending_session_queries_do_not_depend_on_the_number_of_tokens(
+    user, tunnistamosession_factory, oidcclient_factory
+):
+    client = oidcclient_factory(redirect_uris=[])
+
+    def count_end_queries(token_count):
+        tunnistamo_session = tunnistamosession_factory(user=user)
+        for i in range(token_count):
+            tunnistamo_session.add_element(create_token(client, user))
+
+        tunnistamo_session = TunnistamoSession.objects.get(pk=tunnistamo_session.pk)
+        with CaptureQueriesContext(connection) as context:
+            tunnistamo_session.end(send_logout_to_apis=True, request=RequestFactory().get('/'))
+        return len(context.captured_queries)
+
+    # Warm up the caches of the first session
+    count_end_queries(1)
+
+    assert count_end_queries(1) == count_end_queries(5)
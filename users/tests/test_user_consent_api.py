@@ -5,6 +5,7 @@ from parler.utils.context import switch_language
 from rest_framework.reverse import reverse
 
 from oidc_apis.factories import ApiDomainFactory, ApiFactory, ApiScopeFactory
+from services.factories import ServiceFactory
 from users.factories import OIDCClientFactory, UserConsentFactory, UserFactory, access_token_factory
 
 LIST_URL = reverse('v1:userconsent-list')
@@ -163,3 +164,18 @@ def test_delete_requires_correct_scope(api_client, user_consent):
     response = api_client.delete(get_detail_url(user_consent), HTTP_AUTHORIZATION='Bearer ' + token.access_token)
     assert response.status_code == 204
     assert UserConsent.objects.count() == 0
+
+
+def test_cursor_pagination(user_api_client, user):
+    user_consents = [
+        UserConsentFactory(user=user, client=ServiceFactory(target='client').client) for _ in range(3)
+    ]
+
+    response = user_api_client.get(LIST_URL, {'cursor': '', 'limit': 2})
+    assert response.status_code == 200
+    assert 'count' not in response.data
+    assert [r['id'] for r in response.data['results']] == [c.id for c in user_consents[:2]]
+
+    response = user_api_client.get(response.data['next'])
+    assert [r['id'] for r in response.data['results']] == [user_consents[2].id]
+    assert response.data['next'] is None
@@ -98,3 +98,38 @@ def test_ordering_filter(user_api_client, filtering, expected_index_order):
     results = [r['ip_address'] for r in response.data['results']]  # ip address is used to identify the entries
     expected = [user_login_entries[u].ip_address for u in expected_index_order]
     assert results == expected
+
+
+@pytest.mark.parametrize('ordering', (None, '-timestamp'))
+def test_cursor_pagination(user_api_client, django_assert_num_queries, ordering):
+    user = user_api_client.user
+    user_login_entries = [
+        UserLoginEntryFactory(user=user, timestamp=now() - timedelta(hours=hours), ip_address='1.1.1.{}'.format(hours))
+        for hours in range(5, 0, -1)
+    ]
+    if ordering:
+        user_login_entries.reverse()
+    params = {'cursor': '', 'limit': 2}
+    if ordering:
+        params['ordering'] = ordering
+
+    # The login entries without a count
+    with django_assert_num_queries(1):
+        response = user_api_client.get(LIST_URL, params)
+    assert response.status_code == 200
+    assert 'count' not in response.data
+    assert response.data['previous'] is None
+    assert [r['ip_address'] for r in response.data['results']] == [e.ip_address for e in user_login_entries[:2]]
+
+    # A new entry doesn't move the next page
+    UserLoginEntryFactory(user=user, timestamp=now() - timedelta(hours=6))
+    response = user_api_client.get(response.data['next'])
+    assert [r['ip_address'] for r in response.data['results']] == [e.ip_address for e in user_login_entries[2:4]]
+
+    response = user_api_client.get(response.data['previous'])
+    assert [r['ip_address'] for r in response.data['results']] == [e.ip_address for e in user_login_entries[:2]]
+
+
+def test_limit_offset_pagination_is_the_default(user_api_client, user_login_entry):
+    response = user_api_client.get(LIST_URL)
+    assert response.data['count'] == 1
@@ -0,0 +1,63 @@
+import os
+from unittest import mock
+
+import pytest
+from django.contrib.gis.geoip2 import GeoIP2
+from geoip2.errors import AddressNotFoundError
+
+from users.utils import get_geo_location_data_for_ip
+
+
+@pytest.fixture
+def geoip(settings, tmp_path, monkeypatch):
+    database = tmp_path / 'GeoLite2-City.mmdb'
+    database.write_bytes(b'')
+    settings.GEOIP_PATH = str(tmp_path)
+    settings.GEOIP_RELOAD_CHECK_INTERVAL = 0
+    monkeypatch.setattr('users.utils._geo_location_reader', None)
+
+    with mock.patch('users.utils.GeoIP2') as geoip_class:
+        geoip_class.MODE_MMAP_EXT = GeoIP2.MODE_MMAP_EXT
+        geoip_class.MODE_MMAP = GeoIP2.MODE_MMAP
+        geoip_class.return_value.city.side_effect = lambda ip_address: {'ip_address': ip_address}
+        geoip_class.database = database
+        yield geoip_class
+
+
+def test_geoip_reader_is_shared_and_lookups_are_cached(geoip):
+    assert get_geo_location_data_for_ip('1.2.3.4') == {'ip_address': '1.2.3.4'}
+    assert get_geo_location_data_for_ip('1.2.3.4') == {'ip_address': '1.2.3.4'}
+    assert get_geo_location_data_for_ip('5.6.7.8') == {'ip_address': '5.6.7.8'}
+
+    geoip.assert_called_once_with(str(geoip.database), cache=GeoIP2.MODE_MMAP_EXT)
+    assert geoip.return_value.city.call_count == 2
+
+
+def test_geoip_reader_falls_back_to_pure_python_memory_map(geoip):
+    geoip.side_effect = [ValueError('MODE_MMAP_EXT requires the maxminddb.extension module'), mock.DEFAULT]
+
+    get_geo_location_data_for_ip('1.2.3.4')
+
+    assert geoip.call_args == mock.call(str(geoip.database), cache=GeoIP2.MODE_MMAP)
+
+
+def test_unknown_addresses_are_cached(geoip):
+    geoip.return_value.city.side_effect = AddressNotFoundError('not found')
+
+    assert get_geo_location_data_for_ip('10.0.0.1') is None
+    assert get_geo_location_data_for_ip('10.0.0.1') is None
+
+    assert geoip.return_value.city.call_count == 1
+
+
+def test_geoip_reader_is_reopened_when_the_database_changes(geoip):
+    get_geo_location_data_for_ip('1.2.3.4')
+    get_geo_location_data_for_ip('1.2.3.4')
+    assert geoip.call_count == 1
+
+    stat = os.stat(geoip.database)
+    os.utime(geoip.database, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+
+    get_geo_location_data_for_ip('1.2.3.4')
+    assert geoip.call_count == 2
+    assert geoip.return_value.city.call_count == 2
@@ -1,3 +1,7 @@
+import os
+import threading
+from functools import lru_cache
+from time import monotonic
 from urllib.parse import urlparse
 
 from django.conf import settings
@@ -5,17 +9,86 @@ from django.contrib.gis.geoip2 import GeoIP2
 from geoip2.errors import AddressNotFoundError
 
 
+def _open_geoip(path):
+    try:
+        # The C extension of libmaxminddb is the fastest if it's installed
+        return GeoIP2(path, cache=GeoIP2.MODE_MMAP_EXT)
+    except ValueError:
+        return GeoIP2(path, cache=GeoIP2.MODE_MMAP)
+
+
+class GeoLocationReader:
+    """GeoIP2 city database reader shared by the whole process
+
+    The database is memory mapped so that all of the processes share the same
+    pages of the database file. The locations of the most recently looked up
+    IP addresses are cached."""
+
+    def __init__(self, path, mtime):
+        self.path = path
+        self.mtime = mtime
+        self.checked_at = monotonic()
+        self._geoip = _open_geoip(path)
+        self.city = lru_cache(maxsize=settings.GEOIP_CACHE_SIZE)(self._city)
+
+    def _city(self, ip_address):
+        try:
+            return self._geoip.city(ip_address)
+        except AddressNotFoundError:
+            return None
+
+
+_geo_location_reader = None
+_geo_location_reader_lock = threading.Lock()
+
+
+def _get_city_database_path():
+    path = str(settings.GEOIP_PATH)
+    if os.path.isdir(path):
+        path = os.path.join(path, getattr(settings, 'GEOIP_CITY', 'GeoLite2-City.mmdb'))
+    return path
+
+
+def _is_recently_checked(reader):
+    return reader is not None and monotonic() - reader.checked_at < settings.GEOIP_RELOAD_CHECK_INTERVAL
+
+
+def get_geo_location_reader():
+    """Return the GeoIP2 reader of the current process
+
+    The modification time of the database file is checked at most once per
+    GEOIP_RELOAD_CHECK_INTERVAL seconds and the database is reopened when the
+    file has changed.
+
+    :rtype: GeoLocationReader
+    """
+    global _geo_location_reader
+
+    reader = _geo_location_reader
+    if _is_recently_checked(reader):
+        return reader
+
+    with _geo_location_reader_lock:
+        reader = _geo_location_reader
+        if _is_recently_checked(reader):
+            return reader
+
+        path = _get_city_database_path()
+        mtime = os.stat(path).st_mtime_ns
+        if reader is None or reader.path != path or reader.mtime != mtime:
+            reader = GeoLocationReader(path, mtime)
+            _geo_location_reader = reader
+        else:
+            reader.checked_at = monotonic()
+
+    return reader
+
+
 def get_geo_location_data_for_ip(ip_address):
     if not hasattr(settings, 'GEOIP_PATH'):
         return None
 
-    g = GeoIP2()
-    try:
-        location = g.city(ip_address)
-    except AddressNotFoundError:
-        location = None
-
-    return location
+    return get_geo_location_reader().city(ip_address)
 
 
 def generate_origin(uri):
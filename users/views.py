@@ -1,3 +1,4 @@
+import copy
 import json
 import logging
 import re
@@ -8,7 +9,7 @@ from django.conf import settings
 from django.contrib.auth import logout as auth_logout
 from django.contrib.auth.views import LogoutView
 from django.db.models import Case, Value, When
-from django.http import HttpResponse, HttpResponseRedirect, JsonResponse
+from django.http import HttpResponse, HttpResponseRedirect
 from django.shortcuts import redirect, resolve_url
 from django.urls import reverse
 from django.utils import translation
@@ -17,10 +18,10 @@ from django.utils.http import url_has_allowed_host_and_scheme
 from django.views.decorators.cache import never_cache
 from django.views.decorators.csrf import csrf_protect
 from django.views.decorators.debug import sensitive_post_parameters
-from django.views.decorators.http import require_http_methods
-from django.views.generic.base import RedirectView, TemplateView
-from oauth2_provider.models import get_application_model
+from django.views.decorators.http import condition, require_http_methods
+from django.views.generic.base import RedirectView, TemplateView, View
 from oidc_provider.lib.errors import BearerTokenError
+from oidc_provider.lib.utils.common import get_site_url
 from oidc_provider.lib.utils.oauth2 import protected_resource_view
 from oidc_provider.lib.utils.token import client_id_from_id_token
 from oidc_provider.models import Client, Token
@@ -34,6 +35,7 @@ from social_django.models import UserSocialAuth
 from social_django.utils import load_backend, load_strategy
 
 from auth_backends.adfs.base import BaseADFS
+from key_manager.signing_keys import get_signing_key_ring
 from oidc_apis.models import ApiScope
 from tunnistamo.auth_tools import filter_login_methods_by_provider_ids_string
 from tunnistamo.endpoints import (
@@ -41,7 +43,9 @@ from tunnistamo.endpoints import (
 )
 from tunnistamo.middleware import add_params_to_url
 
-from .models import LoginMethod, OidcClientOptions, TunnistamoSession
+from .discovery import precomputed_json_response, provider_info_snapshot
+from .login_configuration import get_all_login_methods, get_client_login_configuration
+from .models import TunnistamoSession, get_post_logout_redirect_uris
 
 logger = logging.getLogger(__name__)
 
@@ -66,30 +70,11 @@ def _get_allowed_login_methods_for_client_id(client_id):
     if not client_id:
         return None
 
-    app = None
-    oidc_client = None
-
-    try:
-        app = get_application_model().objects.get(client_id=client_id)
-    except get_application_model().DoesNotExist:
-        pass
-
-    try:
-        oidc_client = Client.objects.get(client_id=client_id)
-    except Client.DoesNotExist:
-        pass
-
-    allowed_methods = None
-    if app:
-        allowed_methods = app.login_methods.all()
-    elif oidc_client:
-        try:
-            client_options = OidcClientOptions.objects.get(oidc_client=oidc_client)
-            allowed_methods = client_options.login_methods.all()
-        except OidcClientOptions.DoesNotExist:
-            pass
+    login_configuration = get_client_login_configuration(client_id)
+    if not login_configuration:
+        return None
 
-    return allowed_methods
+    return login_configuration.login_methods
 
 
 def _generate_final_login_methods(login_methods, next_url, idp_hint):
@@ -113,6 +98,10 @@ def _generate_final_login_methods(login_methods, next_url, idp_hint):
                 continue
             login_url_params['idp'] = login_method.provider_id
 
+        # The login methods are shared by the process, so the login URL and the
+        # language of the translated fields are set to a copy
+        login_method = copy.copy(login_method)
+        login_method.set_current_language(translation.get_language())
         login_method.login_url = add_params_to_url(
             reverse('social:begin', kwargs={'backend': login_method.provider_id}),
             login_url_params
@@ -139,7 +128,7 @@ class LoginView(TemplateView):
             login_methods = filter_login_methods_by_provider_ids_string(login_methods, last_login_backend)
 
         if login_methods is None:
-            login_methods = LoginMethod.objects.all()
+            login_methods = get_all_login_methods()
 
         methods = _generate_final_login_methods(login_methods, next_url, idp_hint)
 
@@ -153,12 +142,6 @@ class LoginView(TemplateView):
         return super(LoginView, self).get(request, *args, **kwargs)
 
 
-def _process_uris(uris):
-    if isinstance(uris, list):
-        return uris
-    return uris.splitlines()
-
-
 class AuthenticationErrorView(TemplateView):
     template_name = 'account/signup_closed.html'
 
@@ -282,20 +265,13 @@ class TunnistamoOidcEndSessionView(EndSessionView):
         several URIs.
 
         This method treats all URIs of all OAuth apps and OIDC Clients
-        as valid for any logout request.
+        as valid for any logout request. The URIs are looked up from a
+        snapshot kept up to date by the signals of the apps and Clients.
         """
         if uri is None or uri == '':
             return False
 
-        uri_texts = list()
-        for manager in [get_application_model().objects, Client.objects]:
-            for o in manager.all():
-                value = o.post_logout_redirect_uris
-                if value is None or len(value) == 0:
-                    continue
-                uri_texts.append(value)
-
-        return uri in (u for uri_text in uri_texts for u in _process_uris(uri_text))
+        return uri in get_post_logout_redirect_uris()
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -531,7 +507,7 @@ class TunnistamoTokenIntrospectionView(TokenIntrospectionView):
 @protected_resource_view(['openid'])
 def userinfo(request, *args, **kwargs):
     # Check that a Tunnistamo Session exists and has not ended
-    tunnistamo_session = TunnistamoSession.objects.get_by_element(kwargs['token'])
+    tunnistamo_session = TunnistamoSession.objects.get_snapshot_by_element(kwargs['token'])
     if not tunnistamo_session or tunnistamo_session.has_ended():
         error = BearerTokenError('invalid_token')
         response = HttpResponse(status=error.status)
@@ -557,15 +533,43 @@ def _add_api_scopes(scope_string):
     return ' '.join(extended_scopes)
 
 
-class TunnistamoOidcProviderInfoView(ProviderInfoView):
+def _get_jwks_etag(request, *args, **kwargs):
+    return get_signing_key_ring().public_jwks_etag
+
+
+class TunnistamoJwksView(View):
+    """JWK Set with the RSA and EC keys of the signing key ring
+
+    The JWK Set is rendered once per key ring and answered with 304 Not
+    Modified to conditional requests with a matching ETag."""
+    @method_decorator(condition(etag_func=_get_jwks_etag))
     def get(self, request, *args, **kwargs):
-        response = super().get(request, *args, **kwargs)
+        return precomputed_json_response(get_signing_key_ring().public_jwks_content)
+
+
+def _get_provider_info_etag(request, *args, **kwargs):
+    return TunnistamoOidcProviderInfoView().get_document(request)[1]
+
+
+class TunnistamoOidcProviderInfoView(ProviderInfoView):
+    """OIDC discovery document
+
+    The document is rendered once per site URL and rebuilt when the response
+    types change. Conditional requests with a matching ETag are answered with
+    304 Not Modified."""
+    def get_document(self, request):
+        site_url = get_site_url(request=request)
+        return provider_info_snapshot.get().get(site_url, lambda: self.render_document(request))
+
+    def render_document(self, request):
+        response = super().get(request)
 
         dic = json.loads(response.content)
         dic['backchannel_logout_supported'] = True
         dic['backchannel_logout_session_supported'] = True
 
-        response = JsonResponse(dic)
-        response['Access-Control-Allow-Origin'] = '*'
+        return json.dumps(dic).encode('utf-8')
 
-        return response
+    @method_decorator(condition(etag_func=_get_provider_info_etag))
+    def get(self, request, *args, **kwargs):
+        return precomputed_json_response(self.get_document(request)[0])